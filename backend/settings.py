@@ -141,6 +141,12 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Colab API
 COLAB_API_URL = os.getenv("COLAB_API_URL", "")
+# Crops come back encoded from the vision server ("jpeg" or "webp"; empty crops in Django).
+VISION_CROP_FORMAT = os.getenv("VISION_CROP_FORMAT", "jpeg")
+VISION_CROP_QUALITY = int(os.getenv("VISION_CROP_QUALITY", "90"))
+# Verify uploads are streamed to disk and rejected past these limits.
+VISION_MAX_UPLOAD_BYTES = int(os.getenv("VISION_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+VISION_MAX_PIXELS = int(os.getenv("VISION_MAX_PIXELS", "40000000"))
 
 # CORS
 CORS_ALLOWED_ORIGINS = [
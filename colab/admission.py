@@ -0,0 +1,49 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Vision server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def check_deadline(deadline):
+    if deadline is not None and time.time() > deadline:
+        raise DeadlineExceeded("Request deadline passed before inference started")
+
+
+class AdmissionQueue:
+    """Bounds how many requests may be waiting for or running inference at once."""
+
+    def __init__(self, max_depth, concurrency=1):
+        self.max_depth = max_depth
+        self.concurrency = max(1, concurrency)
+        self.depth = 0
+        self._service_time = 1.0
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        # Time for the requests already admitted to drain, rounded up to whole seconds.
+        return max(1, math.ceil(self._service_time * self.depth / self.concurrency))
+
+    @contextmanager
+    def slot(self):
+        with self._lock:
+            if self.depth >= self.max_depth:
+                raise QueueFull(self.retry_after())
+            self.depth += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self.depth -= 1
+                self._service_time = 0.8 * self._service_time + 0.2 * elapsed
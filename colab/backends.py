@@ -0,0 +1,196 @@
+import os
+import cv2
+import numpy as np
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
+VISION_BACKEND = os.getenv("VISION_BACKEND", "native")
+ORT_THREADS = int(os.getenv("ORT_THREADS", "0"))
+YOLO_IMG_SIZE = 640
+YOLO_CONF = 0.25
+YOLO_IOU = 0.7
+YOLO_MAX_DET = 300
+
+MODEL_FILES = {
+    "native": ("medicine_yolo.pt", "medicine_cnn.h5"),
+    "onnx": ("medicine_yolo.onnx", "medicine_cnn.onnx"),
+    "onnx-int8": ("medicine_yolo.int8.onnx", "medicine_cnn.int8.onnx"),
+}
+
+
+def model_paths(backend=VISION_BACKEND):
+    if backend not in MODEL_FILES:
+        raise ValueError(f"Unknown vision backend '{backend}', expected one of {', '.join(MODEL_FILES)}")
+    yolo_file, cnn_file = MODEL_FILES[backend]
+    return os.path.join(MODEL_DIR, yolo_file), os.path.join(MODEL_DIR, cnn_file)
+
+
+def load_detector(path):
+    if path.endswith(".onnx"):
+        return OnnxDetector(path)
+    return UltralyticsDetector(path)
+
+
+def load_classifier(path):
+    if path.endswith(".onnx"):
+        return OnnxClassifier(path)
+    return KerasClassifier(path)
+
+
+def onnx_session(path):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if ORT_THREADS:
+        options.intra_op_num_threads = ORT_THREADS
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def letterbox(image):
+    h, w = image.shape[:2]
+    r = min(YOLO_IMG_SIZE / h, YOLO_IMG_SIZE / w)
+    nw, nh = round(w * r), round(h * r)
+    left = round((YOLO_IMG_SIZE - nw) / 2 - 0.1)
+    top = round((YOLO_IMG_SIZE - nh) / 2 - 0.1)
+    canvas = np.full((YOLO_IMG_SIZE, YOLO_IMG_SIZE, 3), 114, dtype=np.uint8)
+    canvas[top:top + nh, left:left + nw] = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return canvas, r, left, top
+
+
+def yolo_tensor(canvases):
+    batch = np.stack([canvas[..., ::-1].transpose(2, 0, 1) for canvas in canvases])
+    return batch.astype(np.float32) / 255.0
+
+
+class UltralyticsDetector:
+    """YOLO on PyTorch through ultralytics. Returns boxes as float (x1, y1, x2, y2) plus cls, conf."""
+
+    def __init__(self, path):
+        from ultralytics import YOLO
+
+        self.path = path
+        self.model = YOLO(path)
+
+    def predict(self, images):
+        detected = []
+        for result in self.model.predict(images, verbose=False):
+            boxes = []
+            for box in result.boxes:
+                x1, y1, x2, y2 = box.xyxy[0].tolist()
+                boxes.append((x1, y1, x2, y2, int(box.cls[0]), float(box.conf[0])))
+            detected.append(boxes)
+        return detected
+
+
+class KerasClassifier:
+    def __init__(self, path):
+        import tensorflow as tf
+
+        self.path = path
+        self.model = tf.keras.models.load_model(path)
+
+    def predict(self, batch):
+        return self.model.predict(batch, batch_size=len(batch), verbose=0)
+
+
+class OnnxDetector:
+    """YOLO exported to ONNX. Letterboxing and NMS follow ultralytics' defaults."""
+
+    def __init__(self, path):
+        self.path = path
+        self.session = onnx_session(path)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Models exported without dynamic=True only take a fixed batch.
+        self.max_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+
+    def after_fork(self):
+        # ORT thread pools do not survive fork, so each worker opens its own session.
+        self.session = onnx_session(self.path)
+
+    def _postprocess(self, pred, image_shape, r, left, top):
+        pred = pred.T
+        scores = pred[:, 4:]
+        classes = scores.argmax(axis=1)
+        confs = scores[np.arange(len(scores)), classes]
+        keep = confs > YOLO_CONF
+        pred, classes, confs = pred[keep], classes[keep], confs[keep]
+        if len(pred) == 0:
+            return []
+
+        xywh = pred[:, :4].copy()
+        xywh[:, 0] -= xywh[:, 2] / 2
+        xywh[:, 1] -= xywh[:, 3] / 2
+        indices = cv2.dnn.NMSBoxesBatched(xywh.tolist(), confs.tolist(), classes.tolist(), YOLO_CONF, YOLO_IOU)
+        indices = sorted(np.array(indices).flatten(), key=lambda i: -confs[i])[:YOLO_MAX_DET]
+
+        h, w = image_shape[:2]
+        boxes = []
+        for i in indices:
+            x, y, bw, bh = xywh[i]
+            x1 = min(max((x - left) / r, 0), w)
+            y1 = min(max((y - top) / r, 0), h)
+            x2 = min(max((x + bw - left) / r, 0), w)
+            y2 = min(max((y + bh - top) / r, 0), h)
+            boxes.append((float(x1), float(y1), float(x2), float(y2), int(classes[i]), float(confs[i])))
+        return boxes
+
+    def predict(self, images):
+        step = self.max_batch or len(images)
+        detected = []
+        for start in range(0, len(images), step):
+            chunk = images[start:start + step]
+            letterboxed = [letterbox(image) for image in chunk]
+            batch = yolo_tensor([canvas for canvas, _, _, _ in letterboxed])
+            outputs = self.session.run(None, {self.input_name: batch})[0]
+            for image, pred, (_, r, left, top) in zip(chunk, outputs, letterboxed):
+                detected.append(self._postprocess(pred, image.shape, r, left, top))
+        return detected
+
+
+class OnnxClassifier:
+    def __init__(self, path):
+        self.path = path
+        self.session = onnx_session(path)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def after_fork(self):
+        self.session = onnx_session(self.path)
+
+    def predict(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class SyntheticDetector:
+    """Weight-free stand-in for benchmarks: a fixed grid of boxes plus matmul work per image."""
+
+    def __init__(self, boxes=8, work=384):
+        self.path = "synthetic"
+        self.boxes = boxes
+        self.weights = np.random.default_rng(0).random((work, work), dtype=np.float32)
+
+    def predict(self, images):
+        detected = []
+        for image in images:
+            self.weights @ self.weights
+            h, w = image.shape[:2]
+            cols = max(1, int(np.ceil(np.sqrt(self.boxes))))
+            bw, bh = w / cols, h / cols
+            boxes = []
+            for i in range(self.boxes):
+                x, y = (i % cols) * bw, (i // cols) * bh
+                boxes.append((x, y, x + bw, y + bh, i % 2, 0.5 + 0.5 * (i % 5) / 5))
+            detected.append(boxes)
+        return detected
+
+
+class SyntheticClassifier:
+    def __init__(self, work=2048):
+        self.path = "synthetic"
+        self.weights = np.random.default_rng(1).random((work, 64), dtype=np.float32)
+
+    def predict(self, batch):
+        features = batch.reshape(len(batch), -1)[:, :self.weights.shape[0]]
+        features @ self.weights
+        authentic = batch.mean(axis=(1, 2, 3))
+        return np.stack([authentic, 1 - authentic], axis=1)
@@ -0,0 +1,118 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from admission import DeadlineExceeded
+
+
+class MicroBatcher:
+    """One pipeline stage: groups items submitted from concurrent requests into batches for batch_fn.
+
+    max_queue bounds the items waiting for the stage (0 is unbounded); submitters block
+    until there is room or their deadline passes. threads sets how many batches run at once.
+    """
+
+    def __init__(self, name, batch_fn, max_batch_size=8, max_wait_ms=5, threads=1, max_queue=0):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.threads = max(1, threads)
+        self.max_queue = max_queue
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # A forked worker starts with an empty queue and its own threads.
+        self._queue = queue.Queue(self.max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._busy = 0.0
+        self._started = time.perf_counter()
+
+    def submit(self, item, deadline=None):
+        return self.submit_many([item], deadline)[0]
+
+    def submit_many(self, items, deadline=None):
+        self._ensure_started()
+        futures = []
+        for item in items:
+            future = Future()
+            future.queued = 0.0
+            entry = (item, future, deadline, time.perf_counter())
+            try:
+                self._queue.put(entry, timeout=None if deadline is None else max(0.0, deadline - time.time()))
+            except queue.Full:
+                raise DeadlineExceeded(f"Request deadline passed waiting for the {self.name} stage")
+            futures.append(future)
+        return futures
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def utilisation(self):
+        """Fraction of thread time spent inside batch_fn since the stage was created."""
+        elapsed = (time.perf_counter() - self._started) * self.threads
+        return self._busy / elapsed if elapsed > 0 else 0.0
+
+    def busy_seconds(self):
+        return self._busy
+
+    def _ensure_started(self):
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.threads:
+                thread = threading.Thread(target=self._run, name=f"{self.name}-stage-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        # A lone item means low load: run it now rather than wait for company.
+        if len(batch) == 1 or self.max_wait <= 0:
+            return batch
+
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            collected = self._collect()
+            now = time.time()
+            started = time.perf_counter()
+            batch = []
+            for item, future, deadline, enqueued in collected:
+                future.queued = started - enqueued
+                if deadline is not None and now > deadline:
+                    future.set_exception(DeadlineExceeded("Request deadline passed before inference started"))
+                else:
+                    batch.append((item, future))
+            if not batch:
+                continue
+
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                with self._lock:
+                    self._busy += time.perf_counter() - started
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,161 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from timing import timed, parse_server_timing
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), "..", "sample")
+STAGES = ["decode", "yolo", "crop", "cnn", "serialize"]
+
+
+def load_samples(sample_dir):
+    paths = sorted(glob.glob(os.path.join(sample_dir, "*.jpg")) + glob.glob(os.path.join(sample_dir, "*.png")))
+    return [(os.path.basename(path), open(path, "rb").read()) for path in paths]
+
+
+def summarize(values):
+    if not values:
+        return None
+    ms = np.array(values) * 1000
+    return {
+        "count": len(ms),
+        "mean": round(float(ms.mean()), 2),
+        "p50": round(float(np.percentile(ms, 50)), 2),
+        "p95": round(float(np.percentile(ms, 95)), 2),
+        "p99": round(float(np.percentile(ms, 99)), 2),
+        "max": round(float(ms.max()), 2),
+    }
+
+
+def in_process_runner(args):
+    import server
+    from backends import SyntheticDetector, SyntheticClassifier
+
+    if args.synthetic:
+        server.install_models(server.ModelSet(SyntheticDetector(boxes=args.synthetic_boxes), SyntheticClassifier(), "synthetic"))
+    else:
+        server.load_models()
+        if server.active_models is None:
+            sys.exit("Models not found; pass --synthetic to benchmark without weights")
+
+    def run(image_bytes):
+        timings = {}
+        start = time.perf_counter()
+        result, status = server.process_image(image_bytes, timings=timings)
+        with timed(timings, "serialize"):
+            json.dumps(result)
+        timings["total"] = time.perf_counter() - start
+        return status == 200 and result["status"] == "success", timings
+
+    def stage_busy():
+        return {stage.name: (stage.busy_seconds(), stage.threads) for stage in server.pipeline_stages()}
+
+    return run, stage_busy
+
+
+def http_runner(args):
+    import requests
+
+    session = requests.Session()
+    counter = iter(range(sys.maxsize))
+    lock = threading.Lock()
+
+    def run(image_bytes):
+        if not args.allow_cache:
+            # Bytes after the JPEG end marker change the hash but not the pixels.
+            with lock:
+                image_bytes = image_bytes + f"bench-{next(counter)}".encode()
+        start = time.perf_counter()
+        response = session.post(f"{args.url}/api/verify", files={"image": ("image.jpg", image_bytes, "image/jpeg")}, timeout=60)
+        timings = parse_server_timing(response.headers.get("Server-Timing"))
+        with timed(timings, "serialize"):
+            response.json()
+        timings["total"] = time.perf_counter() - start
+        return response.status_code == 200, timings
+
+    def stage_busy():
+        try:
+            stages = session.get(f"{args.url}/health", timeout=10).json().get("stages", {})
+        except (requests.RequestException, ValueError):
+            return {}
+        return {name: (stage["busy_seconds"], stage["threads"]) for name, stage in stages.items()}
+
+    return run, stage_busy
+
+
+def benchmark(args):
+    samples = load_samples(args.samples)
+    if not samples:
+        sys.exit(f"No images found in {args.samples}")
+
+    run, stage_busy = in_process_runner(args) if args.mode == "inprocess" else http_runner(args)
+    images = [samples[i % len(samples)][1] for i in range(args.requests)]
+
+    for image_bytes in images[:args.warmup]:
+        run(image_bytes)
+
+    busy_before = stage_busy()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        outcomes = list(executor.map(run, images))
+    elapsed = time.perf_counter() - started
+    busy_after = stage_busy()
+
+    stages = {stage: [] for stage in STAGES + ["total"]}
+    errors = 0
+    for ok, timings in outcomes:
+        errors += not ok
+        for stage, seconds in timings.items():
+            stages.setdefault(stage, []).append(seconds)
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "mode": args.mode,
+        "target": args.url if args.mode == "http" else ("synthetic" if args.synthetic else os.getenv("VISION_BACKEND", "native")),
+        "images": len(samples),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 2),
+        "latency_ms": {stage: summarize(values) for stage, values in stages.items() if values},
+        # Share of each stage's thread time spent working; near 1.0 means the stage is the bottleneck.
+        "stage_utilisation": {
+            name: round((busy - busy_before.get(name, (0.0, threads))[0]) / (elapsed * threads), 3)
+            for name, (busy, threads) in busy_after.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the sample images through the verify pipeline and report latency percentiles")
+    parser.add_argument("--mode", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument("--url", default="http://localhost:5000", help="Vision server for --mode http")
+    parser.add_argument("--samples", default=SAMPLE_DIR, help="Directory of images to replay")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests to send")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed requests sent first")
+    parser.add_argument("--synthetic", action="store_true", help="Use weight-free stand-in models (in-process only)")
+    parser.add_argument("--synthetic-boxes", type=int, default=8, help="Boxes per image from the synthetic detector")
+    parser.add_argument("--allow-cache", action="store_true", help="Send identical bytes so the server cache can hit")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = benchmark(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}: {report['throughput_rps']} req/s, p50 {report['latency_ms']['total']['p50']} ms")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from phash import BKTree
+
+
+def model_version(paths):
+    """Fingerprint of the model files on disk; changes whenever a file is replaced."""
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+class InferenceCache:
+    """Verification results keyed by image SHA-256, in a byte-bounded LRU plus an optional disk tier.
+
+    The disk tier lives in its own "inference-cache" directory under cache_dir, one
+    subdirectory per version, and is bounded by max_disk_bytes like the memory tier.
+    """
+
+    def __init__(self, max_bytes, cache_dir=None, max_disk_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.cache_dir = os.path.join(cache_dir, "inference-cache") if cache_dir else None
+        self.version = None
+        self.size = 0
+        self.disk_size = 0
+        self.hits = {"memory": 0, "disk": 0, "similar": 0}
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._files = OrderedDict()
+        self._fingerprints = {}
+        self._similar = BKTree()
+        self._lock = threading.Lock()
+
+    def set_version(self, version):
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            self._entries.clear()
+            self._files.clear()
+            self._fingerprints.clear()
+            self._similar = BKTree()
+            self.size = 0
+            self.disk_size = 0
+        if self.cache_dir and os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name != version:
+                    shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            self._load_files()
+            self._load_fingerprints()
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, self.version, "fingerprints.txt")
+
+    def _load_files(self):
+        """Index the version's result files, oldest first, and trim them to the disk budget."""
+        found = []
+        for root, _, names in os.walk(os.path.join(self.cache_dir, self.version)):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                found.append((stat.st_mtime_ns, name[:-5], stat.st_size))
+        found.sort()
+        with self._lock:
+            for _, key, size in found:
+                self._files[key] = size
+                self.disk_size += size
+            evicted, compacted = self._evict_files()
+        self._remove_files(evicted, compacted)
+
+    def _load_fingerprints(self):
+        try:
+            with open(self._index_path()) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        with self._lock:
+            for line in lines:
+                try:
+                    key, value, width, height = line.split()
+                    fingerprint = (int(value, 16), (int(width), int(height)))
+                except ValueError:
+                    continue
+                if key in self._files:
+                    self._fingerprints[key] = fingerprint
+            self._rebuild_similar()
+        if len(self._fingerprints) < len(lines):
+            self._write_fingerprints()
+
+    def _rebuild_similar(self):
+        self._similar = BKTree()
+        for key, (value, size) in self._fingerprints.items():
+            self._similar.add(value, (key, size))
+
+    def _write_fingerprints(self):
+        """Rewrite the fingerprint index with only the entries still on disk."""
+        with self._lock:
+            lines = [f"{key} {value:016x} {size[0]} {size[1]}\n" for key, (value, size) in self._fingerprints.items()]
+        path = self._index_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.writelines(lines)
+        os.replace(tmp, path)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, self.version, key[:2], f"{key}.json")
+
+    def _evict_files(self):
+        """Drop the least recently used files until the disk tier fits; called with the lock held."""
+        evicted = []
+        compacted = False
+        while self.disk_size > self.max_disk_bytes and self._files:
+            key, size = self._files.popitem(last=False)
+            self.disk_size -= size
+            evicted.append(key)
+            compacted = self._forget(key) or compacted
+        return evicted, compacted
+
+    def _forget(self, key):
+        """Drop key's fingerprint, rebuilding the BK-tree once half of it is stale; called with the lock held."""
+        if self._fingerprints.pop(key, None) is None:
+            return False
+        if len(self._fingerprints) * 2 >= self._similar.count:
+            return False
+        self._rebuild_similar()
+        return True
+
+    def _remove_files(self, evicted, compacted):
+        for key in evicted:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        if compacted:
+            self._write_fingerprints()
+
+    def get(self, image_bytes, variant=""):
+        key = hashlib.sha256(image_bytes).hexdigest()
+        return self.lookup(f"{key}-{variant}" if variant else key)
+
+    def lookup(self, key, count=True):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                if count:
+                    self.hits["memory"] += 1
+                return key, json.loads(data)
+
+        if self.cache_dir and self.version:
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+                os.utime(self._path(key))
+                with self._lock:
+                    if key in self._files:
+                        self._files.move_to_end(key)
+                self._remember(key, data)
+                if count:
+                    with self._lock:
+                        self.hits["disk"] += 1
+                return key, json.loads(data)
+            except (OSError, ValueError):
+                pass
+
+        if count:
+            with self._lock:
+                self.misses += 1
+        return key, None
+
+    def find_similar(self, fingerprint, max_distance):
+        """Cached result of the closest earlier image within max_distance bits, rescaled to this image."""
+        value, size = fingerprint
+        with self._lock:
+            matches = self._similar.search(value, max_distance)
+        for distance, (key, original_size) in matches:
+            if abs(size[0] / size[1] - original_size[0] / original_size[1]) > 0.02:
+                continue
+            _, result = self.lookup(key, count=False)
+            if result is None:
+                continue
+            sx, sy = size[0] / original_size[0], size[1] / original_size[1]
+            for detection in result.get("detections", []):
+                x1, y1, x2, y2 = detection["bbox"]
+                detection["bbox"] = [int(x1 * sx), int(y1 * sy), int(x2 * sx), int(y2 * sy)]
+            result["duplicate_of"] = key
+            result["distance"] = distance
+            with self._lock:
+                self.hits["similar"] += 1
+            return result
+        return None
+
+    def add_fingerprint(self, key, fingerprint):
+        value, size = fingerprint
+        with self._lock:
+            if key not in (self._files if self.cache_dir else self._entries):
+                return
+            self._fingerprints[key] = fingerprint
+            self._similar.add(value, (key, size))
+        if self.cache_dir and self.version:
+            os.makedirs(os.path.join(self.cache_dir, self.version), exist_ok=True)
+            with open(self._index_path(), "a") as f:
+                f.write(f"{key} {value:016x} {size[0]} {size[1]}\n")
+
+    def put(self, key, result):
+        data = json.dumps(result, separators=(",", ":")).encode()
+        self._remember(key, data)
+        if self.cache_dir and self.version:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            with self._lock:
+                self.disk_size += len(data) - self._files.pop(key, 0)
+                self._files[key] = len(data)
+                evicted, compacted = self._evict_files()
+            self._remove_files(evicted, compacted)
+
+    def _remember(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                if not self.cache_dir:
+                    self._forget(evicted_key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits["memory"] + self.hits["disk"] + self.misses
+            hits = self.hits["memory"] + self.hits["disk"] + self.hits["similar"]
+            return {
+                "fingerprints": self._similar.count,
+                "version": self.version,
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "disk_entries": len(self._files),
+                "disk_bytes": self.disk_size,
+                "memory_hits": self.hits["memory"],
+                "disk_hits": self.hits["disk"],
+                "similar_hits": self.hits["similar"],
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
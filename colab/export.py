@@ -0,0 +1,167 @@
+import os
+import sys
+import glob
+import argparse
+import cv2
+import numpy as np
+from backends import MODEL_DIR, model_paths, load_detector, load_classifier, letterbox, yolo_tensor
+
+IMG_SIZE = 224
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), "..", "sample")
+
+
+def sample_images(sample_dir):
+    paths = sorted(glob.glob(os.path.join(sample_dir, "*.jpg")) + glob.glob(os.path.join(sample_dir, "*.png")))
+    return [(os.path.basename(p), cv2.imread(p)) for p in paths]
+
+
+def cnn_tensor(images):
+    batch = np.stack([cv2.resize(image, (IMG_SIZE, IMG_SIZE)) for image in images]).astype("float32")
+    return batch / 255.0
+
+
+def export_yolo():
+    from ultralytics import YOLO
+
+    yolo_path, _ = model_paths("native")
+    output = YOLO(yolo_path).export(format="onnx", imgsz=640, dynamic=True, simplify=True)
+    print(f"YOLO exported to {output}")
+    return output
+
+
+def export_cnn():
+    import tensorflow as tf
+    import tf2onnx
+
+    _, cnn_path = model_paths("native")
+    _, output = model_paths("onnx")
+    model = tf.keras.models.load_model(cnn_path)
+    spec = [tf.TensorSpec((None, IMG_SIZE, IMG_SIZE, 3), tf.float32, name="input")]
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=17, output_path=output)
+    print(f"CNN exported to {output}")
+    return output
+
+
+def quantize(source, target, tensors):
+    from onnxruntime.quantization import quantize_static, CalibrationDataReader, QuantFormat, QuantType
+    import onnxruntime as ort
+
+    input_name = ort.InferenceSession(source, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.items = iter([{input_name: tensor[None]} for tensor in tensors])
+
+        def get_next(self):
+            return next(self.items, None)
+
+    quantize_static(
+        source,
+        target,
+        Reader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    print(f"Quantized {os.path.basename(source)} to {target}")
+
+
+def export(args):
+    yolo_onnx = export_yolo()
+    cnn_onnx = export_cnn()
+    if not args.int8:
+        return 0
+
+    images = [image for _, image in sample_images(args.samples)]
+    if not images:
+        print(f"No calibration images found in {args.samples}")
+        return 1
+    yolo_int8, cnn_int8 = model_paths("onnx-int8")
+    quantize(yolo_onnx, yolo_int8, yolo_tensor([letterbox(image)[0] for image in images]))
+    quantize(cnn_onnx, cnn_int8, cnn_tensor(images))
+    return 0
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def parity(args):
+    images = sample_images(args.samples)
+    if not images:
+        print(f"No images found in {args.samples}")
+        return 1
+
+    models = {}
+    for backend in (args.reference, args.candidate):
+        yolo_path, cnn_path = model_paths(backend)
+        models[backend] = (load_detector(yolo_path), load_classifier(cnn_path))
+    ref_detector, ref_classifier = models[args.reference]
+    cand_detector, cand_classifier = models[args.candidate]
+
+    ref_total = matched = same_class = same_cnn = 0
+    conf_delta = cnn_delta = 0.0
+    for name, image in images:
+        ref_boxes = ref_detector.predict([image])[0]
+        cand_boxes = cand_detector.predict([image])[0]
+        ref_total += len(ref_boxes)
+
+        image_matches = 0
+        for ref in ref_boxes:
+            best = max(cand_boxes, key=lambda cand: iou(ref, cand), default=None)
+            if best is None or iou(ref, best) < args.iou:
+                continue
+            image_matches += 1
+            same_class += ref[4] == best[4]
+            conf_delta = max(conf_delta, abs(ref[5] - best[5]))
+        matched += image_matches
+
+        if ref_boxes:
+            crops = cnn_tensor([image[int(y1):int(y2), int(x1):int(x2)] for x1, y1, x2, y2, _, _ in ref_boxes])
+            ref_pred = ref_classifier.predict(crops)
+            cand_pred = cand_classifier.predict(crops)
+            same_cnn += int((ref_pred.argmax(axis=1) == cand_pred.argmax(axis=1)).sum())
+            cnn_delta = max(cnn_delta, float(np.abs(ref_pred.max(axis=1) - cand_pred.max(axis=1)).max()))
+
+        print(f"{name}: {len(ref_boxes)} {args.reference} / {len(cand_boxes)} {args.candidate} boxes, {image_matches} matched")
+
+    recall = matched / ref_total if ref_total else 1.0
+    print(f"\nBoxes matched at IoU >= {args.iou}: {matched}/{ref_total} ({recall:.1%})")
+    print(f"YOLO class agreement: {same_class}/{matched}, max confidence delta {conf_delta:.4f}")
+    print(f"CNN label agreement: {same_cnn}/{ref_total}, max confidence delta {cnn_delta:.4f}")
+
+    if recall < args.min_match or same_cnn < ref_total * args.min_match:
+        print("Parity check FAILED")
+        return 1
+    print("Parity check passed")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the vision models to ONNX and check them against the native backend")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = sub.add_parser("export", help=f"Export models in {MODEL_DIR} to ONNX")
+    export_parser.add_argument("--int8", action="store_true", help="Also write int8 models calibrated on the sample images")
+    export_parser.add_argument("--samples", default=SAMPLE_DIR, help="Directory of calibration images")
+    export_parser.set_defaults(func=export)
+
+    parity_parser = sub.add_parser("parity", help="Compare detections between two backends on the sample images")
+    parity_parser.add_argument("--reference", default="native", help="Backend treated as ground truth")
+    parity_parser.add_argument("--candidate", default="onnx", help="Backend under test (onnx or onnx-int8)")
+    parity_parser.add_argument("--samples", default=SAMPLE_DIR, help="Directory of images to compare on")
+    parity_parser.add_argument("--iou", type=float, default=0.5, help="IoU needed to match two boxes")
+    parity_parser.add_argument("--min-match", type=float, default=0.95, help="Minimum fraction of matched boxes and CNN labels")
+    parity_parser.set_defaults(func=parity)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+from preprocess import jpeg_size
+
+
+def dhash(gray):
+    """64-bit difference hash: sign of horizontal gradients on a 9x8 thumbnail."""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def fingerprint(image_bytes):
+    """Return (dhash, (width, height)) of an upload, or None if it cannot be decoded."""
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    size = jpeg_size(image_bytes) if image_bytes[:2] == b"\xff\xd8" else None
+    gray = cv2.imdecode(nparr, cv2.IMREAD_REDUCED_GRAYSCALE_8 if size else cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None
+    h, w = gray.shape[:2]
+    if size is None:
+        size = (w, h)
+    elif (w > h) != (size[0] > size[1]):
+        size = (size[1], size[0])
+    return dhash(gray), size
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Metric tree over Hamming distance; a radius search only visits children within the triangle bound."""
+
+    def __init__(self):
+        self.root = None
+        self.count = 0
+
+    def add(self, value, item):
+        node = [value, item, {}]
+        self.count += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, max_distance):
+        matches = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                matches.append((distance, item))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(matches, key=lambda match: match[0])
@@ -0,0 +1,88 @@
+import os
+import struct
+import cv2
+import numpy as np
+
+MAX_DETECT_SIDE = int(os.getenv("MAX_DETECT_SIDE", "640"))
+CROP_SOURCE_SIDE = int(os.getenv("CROP_SOURCE_SIDE", "1600"))
+
+REDUCED_FLAGS = {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2}
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(data):
+    """Read (width, height) from the JPEG frame header without decoding."""
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        length = struct.unpack(">H", data[i + 2:i + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def decode_factor(size):
+    """Largest DCT reduction that still leaves CROP_SOURCE_SIDE pixels on the long side."""
+    if size is None or CROP_SOURCE_SIDE <= 0:
+        return 1
+    longest = max(size)
+    for factor in (8, 4, 2):
+        if longest / factor >= CROP_SOURCE_SIDE:
+            return factor
+    return 1
+
+
+class PreparedImage:
+    """A decoded upload: a crop source, a smaller copy for detection, and the original size."""
+
+    def __init__(self, source, original_size=None):
+        self.source = source
+        source_h, source_w = source.shape[:2]
+        self.original_size = original_size or (source_w, source_h)
+
+        longest = max(source_w, source_h)
+        if MAX_DETECT_SIDE and longest > MAX_DETECT_SIDE:
+            r = MAX_DETECT_SIDE / longest
+            self.detect = cv2.resize(source, (round(source_w * r), round(source_h * r)), interpolation=cv2.INTER_AREA)
+        else:
+            self.detect = source
+
+    def to_original(self, box, space=None, offset=(0, 0)):
+        """Map a box found in `space` (the detect copy by default), shifted by offset, to original pixels."""
+        space = self.detect if space is None else space
+        space_h, space_w = space.shape[:2]
+        sx = self.original_size[0] / space_w
+        sy = self.original_size[1] / space_h
+        x1, y1, x2, y2 = box[0] + offset[0], box[1] + offset[1], box[2] + offset[0], box[3] + offset[1]
+        return (int(x1 * sx), int(y1 * sy), int(x2 * sx), int(y2 * sy)) + tuple(box[4:])
+
+    def crop(self, x1, y1, x2, y2):
+        source_h, source_w = self.source.shape[:2]
+        sx = source_w / self.original_size[0]
+        sy = source_h / self.original_size[1]
+        return self.source[int(y1 * sy):int(np.ceil(y2 * sy)), int(x1 * sx):int(np.ceil(x2 * sx))]
+
+
+def decode(image_bytes):
+    size = jpeg_size(image_bytes) if image_bytes[:2] == b"\xff\xd8" else None
+    factor = decode_factor(size)
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    image_array = cv2.imdecode(nparr, REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR))
+    if image_array is None:
+        return None
+    if factor == 1:
+        return PreparedImage(image_array)
+
+    # The header size is before EXIF rotation; the decoded array is after it.
+    width, height = size
+    source_h, source_w = image_array.shape[:2]
+    if (source_w > source_h) != (width > height):
+        width, height = height, width
+    return PreparedImage(image_array, (width, height))
@@ -1,38 +1,433 @@
 import os
+import json
+import time
+import tarfile
+import zipfile
+import tempfile
+import uuid
+import atexit
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
 import cv2
 import numpy as np
-import tensorflow as tf
-from ultralytics import YOLO
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from batching import MicroBatcher
+from backends import VISION_BACKEND, model_paths, load_detector, load_classifier
+from workers import WorkerPool, set_thread_budget, thread_budget
+from admission import AdmissionQueue, QueueFull, DeadlineExceeded, check_deadline
+from preprocess import CROP_SOURCE_SIDE, MAX_DETECT_SIDE, PreparedImage, decode
+from cache import InferenceCache, model_version
+from timing import timed, server_timing
+from phash import fingerprint
+from tiling import TILE_MODE, TILE_OVERLAP, TILE_SIZE, disputed, should_tile, tile_windows, merge_detections
+from video import MAX_VIDEO_SECONDS, VIDEO_MIN_HITS, Tracker, sample_frames, video_length
+from metrics import Registry, Counter, CallbackCounter, Gauge, Histogram
 
-MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
-YOLO_MODEL_PATH = f"{MODEL_DIR}/medicine_yolo.pt"
-CNN_MODEL_PATH = f"{MODEL_DIR}/medicine_cnn.h5"
+YOLO_MODEL_PATH, CNN_MODEL_PATH = model_paths(VISION_BACKEND)
 IMG_SIZE = 224
+CNN_BATCH_SIZE = int(os.getenv("CNN_BATCH_SIZE", "32"))
+YOLO_BATCH_SIZE = int(os.getenv("YOLO_BATCH_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+DECODE_THREADS = int(os.getenv("DECODE_THREADS", "2"))
+CROP_THREADS = int(os.getenv("CROP_THREADS", "2"))
+YOLO_THREADS = int(os.getenv("YOLO_THREADS", "1"))
+CNN_THREADS = int(os.getenv("CNN_THREADS", "1"))
+STAGE_QUEUE = int(os.getenv("STAGE_QUEUE", "64"))
+VISION_WORKERS = int(os.getenv("VISION_WORKERS", "0"))
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "2"))
+QUEUE_DEPTH = int(os.getenv("QUEUE_DEPTH", "32"))
+REQUEST_DEADLINE_S = float(os.getenv("REQUEST_DEADLINE_S", "25"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_MB", "64")) * 1024 * 1024
+CACHE_DIR = os.getenv("CACHE_DIR", "")
+CACHE_DISK_BYTES = int(os.getenv("CACHE_DISK_MB", "1024")) * 1024 * 1024
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", "100"))
+# Uncompressed bytes a batch may expand to, checked against archive headers before extraction.
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_MB", "256")) * 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "512")) * 1024 * 1024
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(YOLO_BATCH_SIZE)))
+BATCH_DEADLINE_S = float(os.getenv("BATCH_DEADLINE_S", "300"))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+# Near-duplicate reuse is opt-in: a match answers with another image's detections.
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "0"))
+VIDEO_DEADLINE_S = float(os.getenv("VIDEO_DEADLINE_S", "120"))
+# Uploads larger than these, or whose header reports more than MAX_VIDEO_SECONDS (video.py), are refused.
+MAX_VIDEO_BYTES = int(os.getenv("MAX_VIDEO_MB", "200")) * 1024 * 1024
+MAX_VIDEO_FRAMES = int(os.getenv("MAX_VIDEO_FRAMES", "3600"))
+CASCADE_YOLO_CONF = float(os.getenv("CASCADE_YOLO_CONF", "0"))
+CROP_QUALITY = int(os.getenv("CROP_QUALITY", "90"))
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "0"))
+RELOAD_TOKEN = os.getenv("RELOAD_TOKEN", "")
+WARMUP = os.getenv("WARMUP", "1") == "1"
+WARMUP_SHAPES = [(480, 640), (640, 480)]
+CROP_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+}
 
 app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
 
-yolo_model = None
-cnn_model = None
+active_models = None
+reload_lock = threading.Lock()
+startup_phase = "starting"
+startup_seconds = {}
+worker_pool = None
+admission = AdmissionQueue(QUEUE_DEPTH, concurrency=YOLO_BATCH_SIZE)
+inference_cache = InferenceCache(CACHE_MAX_BYTES, CACHE_DIR or None, CACHE_DISK_BYTES)
+in_flight = 0
+in_flight_lock = threading.Lock()
 
+metrics = Registry()
+stage_seconds = metrics.add(Histogram("vision_stage_seconds", "Time spent per pipeline stage"))
+request_seconds = metrics.add(Histogram("vision_request_seconds", "HTTP request latency by endpoint"))
+detections_total = metrics.add(Counter("vision_detections_total", "Detections returned by final result"))
+cache_lookups_total = metrics.add(Counter("vision_cache_lookups_total", "Inference cache lookups"))
+metrics.add(Gauge("vision_queue_depth", "Requests admitted and waiting for or running inference", lambda: admission.depth))
+metrics.add(Gauge("vision_in_flight_requests", "HTTP requests currently being handled", lambda: in_flight))
+metrics.add(Gauge("vision_batch_queue", "Items waiting in each pipeline stage", lambda: {
+    (("stage", stage.name),): stage.pending() for stage in pipeline_stages()
+}))
+metrics.add(CallbackCounter("vision_stage_busy_seconds_total", "Thread time each pipeline stage spent working", lambda: {
+    (("stage", stage.name),): stage.busy_seconds() for stage in pipeline_stages()
+}))
+metrics.add(Gauge("vision_startup_seconds", "Time spent in each startup phase", lambda: {
+    (("phase", phase),): seconds for phase, seconds in startup_seconds.items()
+}))
+metrics.add(Gauge("vision_ready", "1 once models are loaded and warm", lambda: int(startup_phase == "ready")))
+metrics.add(Gauge("vision_stage_threads", "Worker threads per pipeline stage", lambda: {
+    (("stage", stage.name),): stage.threads for stage in pipeline_stages()
+}))
 
-def load_models():
-    global yolo_model, cnn_model
+
+class ModelSet:
+    """A detector and classifier that serve requests together, tagged with their version.
+
+    Requests take the active set once and keep it, so a reload never mixes models mid-request.
+    With VISION_WORKERS the parent's set carries only the version; the models live in the workers.
+    """
+
+    def __init__(self, detector, classifier, version):
+        self.detector = detector
+        self.classifier = classifier
+        self.version = version
+
+
+def load_model_set():
+    version = model_version([YOLO_MODEL_PATH, CNN_MODEL_PATH])
+    detector = classifier = None
     if os.path.exists(YOLO_MODEL_PATH):
-        yolo_model = YOLO(YOLO_MODEL_PATH)
-        print("YOLO model loaded")
+        detector = load_detector(YOLO_MODEL_PATH)
+        print(f"YOLO model loaded ({VISION_BACKEND})")
     else:
         print(f"YOLO model not found at {YOLO_MODEL_PATH}")
 
     if os.path.exists(CNN_MODEL_PATH):
-        cnn_model = tf.keras.models.load_model(CNN_MODEL_PATH)
-        print("CNN model loaded")
+        classifier = load_classifier(CNN_MODEL_PATH)
+        print(f"CNN model loaded ({VISION_BACKEND})")
     else:
         print(f"CNN model not found at {CNN_MODEL_PATH}")
 
+    if detector is None or classifier is None:
+        return None
+    return ModelSet(detector, classifier, version)
+
+
+def install_models(models):
+    global active_models
+    active_models = models
+    # Settings that change detections are part of the cache version, so a restart
+    # with different ones never serves results computed under the old ones.
+    version = f"{models.version}-detect{MAX_DETECT_SIDE}-source{CROP_SOURCE_SIDE}-tile{TILE_MODE}{TILE_SIZE}x{TILE_OVERLAP:g}"
+    if CASCADE_YOLO_CONF:
+        version += f"-cascade{CASCADE_YOLO_CONF:g}"
+    inference_cache.set_version(version)
+
+
+def load_models():
+    models = load_model_set()
+    if models is not None:
+        install_models(models)
+
+
+def model_files_present():
+    return os.path.exists(YOLO_MODEL_PATH) and os.path.exists(CNN_MODEL_PATH)
+
+
+def load_worker_models(version):
+    """Runs in the worker zygote: load the model files and return the setup each forked worker runs."""
+    models = load_model_set()
+    if models is None:
+        raise ValueError("Model files not found")
+    if models.version != version:
+        raise ValueError(f"Model files changed to {models.version} while loading {version}")
+    return functools.partial(activate_worker_models, models)
+
+
+def activate_worker_models(models):
+    global active_models
+    for model in (models.detector, models.classifier):
+        after_fork = getattr(model, "after_fork", None)
+        if after_fork:
+            after_fork()
+    active_models = models
+
+
+def worker_warmup():
+    # Always send a job, so a worker that dies while activating fails the start or reload.
+    return ("warmup", ()) if WARMUP else ("ready", ())
+
+
+def warmup(models):
+    """Run synthetic inputs at the shapes traffic uses, so graph building and JIT happen before it.
+
+    Detect copies are capped at MAX_DETECT_SIDE in either orientation; both models also see
+    a single item and a full batch, since ONNX and TF specialise on batch size.
+    """
+    for h, w in WARMUP_SHAPES:
+        scale = MAX_DETECT_SIDE / max(h, w)
+        frame = np.zeros((round(h * scale), round(w * scale), 3), dtype=np.uint8)
+        models.detector.predict([frame])
+        models.detector.predict([frame] * YOLO_BATCH_SIZE)
+    for batch_size in (1, CNN_BATCH_SIZE):
+        models.classifier.predict(np.zeros((batch_size, IMG_SIZE, IMG_SIZE, 3), dtype="float32"))
+
+
+def start_up():
+    """Load, warm and (with VISION_WORKERS) fork the models; /ready turns 200 at the end."""
+    global startup_phase, worker_pool
+    started = time.perf_counter()
+    startup_phase = "loading"
+    if VISION_WORKERS:
+        if not model_files_present():
+            startup_phase = "models missing"
+            return
+        # The zygote loads the models and the workers warm themselves after the fork;
+        # the parent never imports the frameworks.
+        admission.concurrency = VISION_WORKERS * WORKER_THREADS
+        version = model_version([YOLO_MODEL_PATH, CNN_MODEL_PATH])
+        with timed(startup_seconds, "workers"):
+            pool = WorkerPool(process_job, VISION_WORKERS, handler_threads=WORKER_THREADS)
+            atexit.register(pool.stop)
+            pool.start(functools.partial(load_worker_models, version), warmup=worker_warmup())
+        worker_pool = pool
+        install_models(ModelSet(None, None, version))
+        startup_seconds["total"] = time.perf_counter() - started
+        startup_phase = "ready"
+        print("Ready in " + ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in startup_seconds.items()))
+        return
+
+    with timed(startup_seconds, "load"):
+        load_models()
+    if active_models is None:
+        startup_phase = "models missing"
+        return
+
+    startup_phase = "warming"
+    if WARMUP:
+        with timed(startup_seconds, "warmup"):
+            warmup(active_models)
+
+    startup_seconds["total"] = time.perf_counter() - started
+    startup_phase = "ready"
+    print("Ready in " + ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in startup_seconds.items()))
+
+
+def reload_models():
+    """Load the model files into a standby set, warm it up, then swap it in.
+
+    Requests already running finish on the old set. Returns the new version; raises
+    ValueError when the files are missing or already active.
+    """
+    with reload_lock:
+        version = model_version([YOLO_MODEL_PATH, CNN_MODEL_PATH])
+        if active_models is not None and version == active_models.version:
+            raise ValueError(f"Model version {version} is already active")
+        started = time.perf_counter()
+        if worker_pool is not None:
+            if not model_files_present():
+                raise ValueError("Model files not found")
+            # Old workers keep serving the old set until the new workers are warm; the
+            # parent only switches version once they are, and keeps the old one on failure.
+            worker_pool.replace_models(functools.partial(load_worker_models, version), warmup=worker_warmup())
+            install_models(ModelSet(None, None, version))
+        else:
+            models = load_model_set()
+            if models is None:
+                raise ValueError("Model files not found")
+            if WARMUP:
+                warmup(models)
+            install_models(models)
+            version = models.version
+        print(f"Models reloaded as {version} in {time.perf_counter() - started:.1f}s")
+        return version
+
+
+def watch_models(interval):
+    """Reload when the model files change and have stayed unchanged for one more interval."""
+    seen = None
+    while True:
+        time.sleep(interval)
+        version = model_version([YOLO_MODEL_PATH, CNN_MODEL_PATH])
+        if active_models is None or version == active_models.version:
+            seen = None
+            continue
+        if version != seen:
+            # Still being copied, or just appeared: wait for it to settle.
+            seen = version
+            continue
+        try:
+            reload_models()
+        except Exception as e:
+            print(f"Model reload failed: {e}")
+        seen = None
+
+
+def run_grouped(items, predict):
+    """Call predict(models, payloads) once per model set among (models, payload) items."""
+    groups = {}
+    for i, (models, payload) in enumerate(items):
+        groups.setdefault(id(models), (models, [], []))
+        groups[id(models)][1].append(i)
+        groups[id(models)][2].append(payload)
+    results = [None] * len(items)
+    for models, indexes, payloads in groups.values():
+        for i, result in zip(indexes, predict(models, payloads)):
+            results[i] = result
+    return results
+
+
+def detect_images(items):
+    return run_grouped(items, lambda models, images: models.detector.predict(images))
+
+
+def classify_batch(models, crops):
+    batch = np.empty((len(crops), IMG_SIZE, IMG_SIZE, 3), dtype="float32")
+    for i, crop in enumerate(crops):
+        batch[i] = crop
+    batch /= 255.0
+    return list(models.classifier.predict(batch))
+
+
+def classify_crops(items):
+    return run_grouped(items, classify_batch)
+
+
+def decode_images(payloads):
+    return [decode(image_bytes) for image_bytes in payloads]
+
+
+def crop_boxes(jobs):
+    return [cv2.resize(image.crop(*box[:4]), (IMG_SIZE, IMG_SIZE)) for image, box in jobs]
+
+
+# decode -> detect -> crop -> classify; the request thread serialises the response.
+# Each stage has its own threads and bounded queue, so YOLO runs on one request
+# while the CNN classifies another's crops.
+decode_stage = MicroBatcher("decode", decode_images, 1, 0, DECODE_THREADS, STAGE_QUEUE)
+yolo_batcher = MicroBatcher("yolo", detect_images, YOLO_BATCH_SIZE, BATCH_MAX_WAIT_MS, YOLO_THREADS, STAGE_QUEUE)
+crop_stage = MicroBatcher("crop", crop_boxes, 16, 0, CROP_THREADS, STAGE_QUEUE)
+cnn_batcher = MicroBatcher("cnn", classify_crops, CNN_BATCH_SIZE, BATCH_MAX_WAIT_MS, CNN_THREADS, STAGE_QUEUE)
+
 
-def verify_image(image_array):
-    if yolo_model is None or cnn_model is None:
+def pipeline_stages():
+    return [decode_stage, yolo_batcher, crop_stage, cnn_batcher]
+
+
+def worker_result(future, deadline):
+    """Wait for a worker reply until the request deadline; the worker drops the job at its own deadline check."""
+    try:
+        return future.result(timeout=max(0, deadline - time.time()))
+    except FutureTimeout:
+        raise DeadlineExceeded("Request deadline passed while waiting for a vision worker")
+
+
+def wait_batched(futures, timings, stage):
+    with timed(timings, stage):
+        results = [future.result() for future in futures]
+    if timings is not None:
+        # Split time spent waiting for a batch slot out of the model stage.
+        queued = max(future.queued for future in futures)
+        timings[stage] -= queued
+        timings["queue"] = timings.get("queue", 0.0) + queued
+    return results
+
+
+def detect_boxes(image, models, deadline=None, timings=None, tiled=None):
+    if not should_tile(image, tiled):
+        boxes = wait_batched([yolo_batcher.submit((models, image.detect), deadline)], timings, "yolo")[0]
+        return [image.to_original(box) for box in boxes]
+
+    # The downscaled whole image catches packages larger than a tile.
+    h, w = image.source.shape[:2]
+    windows = tile_windows(w, h)
+    frames = [image.detect] + [image.source[y1:y2, x1:x2] for x1, y1, x2, y2 in windows]
+    results = wait_batched(yolo_batcher.submit_many([(models, frame) for frame in frames], deadline), timings, "yolo")
+
+    boxes = [image.to_original(box) for box in results[0]]
+    for (x1, y1, _, _), tile_boxes in zip(windows, results[1:]):
+        boxes.extend(image.to_original(box, image.source, (x1, y1)) for box in tile_boxes)
+    with timed(timings, "merge"):
+        return merge_detections(boxes)
+
+
+def escalate(yolo_conf):
+    """Cascade policy: only detections below CASCADE_YOLO_CONF go to the CNN (0 sends all of them)."""
+    return not CASCADE_YOLO_CONF or yolo_conf < CASCADE_YOLO_CONF
+
+
+def cnn_prediction(cnn_pred):
+    cnn_class = np.argmax(cnn_pred)
+    return ("authentic" if cnn_class == 0 else "counterfeit"), float(np.max(cnn_pred))
+
+
+def build_detection(box, cnn_pred=None):
+    x1, y1, x2, y2, yolo_class, yolo_conf = box[:6]
+    yolo_label = "authentic" if yolo_class == 0 else "counterfeit"
+
+    if cnn_pred is None:
+        cnn_label, cnn_conf = None, None
+        final_result = "GENUINE" if yolo_label == "authentic" else "COUNTERFEIT"
+    else:
+        cnn_label, cnn_conf = cnn_prediction(cnn_pred)
+        if yolo_label == cnn_label and cnn_conf > 0.8:
+            final_result = "GENUINE" if yolo_label == "authentic" else "COUNTERFEIT"
+        else:
+            final_result = "SUSPICIOUS"
+
+    detection = {
+        "bbox": [x1, y1, x2, y2],
+        "yolo_label": yolo_label,
+        "yolo_confidence": yolo_conf,
+        "cnn_label": cnn_label,
+        "cnn_confidence": cnn_conf,
+        "result": final_result,
+        "path": "yolo" if cnn_pred is None else "cnn"
+    }
+    # Overlapping tile boxes labelled both ways are one package with no clear verdict.
+    if disputed(box):
+        detection["result"] = "SUSPICIOUS"
+        detection["disputed"] = True
+    return detection
+
+
+def classify_escalated(models, crops, deadline=None, timings=None):
+    """CNN predictions for the escalated crops, keyed by position; skipped crops are None."""
+    escalated = {i: crop for i, crop in crops.items() if crop is not None}
+    if not escalated:
+        return {}
+    preds = wait_batched(cnn_batcher.submit_many([(models, crop) for crop in escalated.values()], deadline), timings, "cnn")
+    return dict(zip(escalated, preds))
+
+
+def verify_image(image_array, deadline=None, timings=None, tiled=None):
+    return verify_prepared(PreparedImage(image_array), deadline, timings, tiled)
+
+
+def verify_prepared(image, deadline=None, timings=None, tiled=None):
+    models = active_models
+    if models is None:
         return {
             "status": "error",
             "message": "Models not loaded",
@@ -41,54 +436,397 @@ def verify_image(image_array):
             "detections": []
         }
 
-    results = yolo_model.predict(image_array, verbose=False)
+    boxes = detect_boxes(image, models, deadline, timings, tiled)
 
-    if len(results[0].boxes) == 0:
+    if len(boxes) == 0:
         return {
             "status": "success",
             "message": "No packages detected",
             "result": None,
             "confidence": 0.0,
+            "detections": [],
+            "model_version": models.version
+        }
+
+    escalated = [i for i, box in enumerate(boxes) if disputed(box) or escalate(box[5])]
+    crops = dict.fromkeys(range(len(boxes)))
+    if escalated:
+        futures = crop_stage.submit_many([(image, boxes[i]) for i in escalated], deadline)
+        crops.update(zip(escalated, wait_batched(futures, timings, "crop")))
+    cnn_preds = classify_escalated(models, crops, deadline, timings)
+
+    detections = [build_detection(box, cnn_preds.get(i)) for i, box in enumerate(boxes)]
+
+    return {
+        "status": "success",
+        "message": "Verification complete",
+        "detections": detections,
+        "model_version": models.version
+    }
+
+
+def encode_crops(image, detections, crop_format):
+    """Encode each detection's box from the decoded upload, in detection order."""
+    name, quality = crop_format
+    extension, _, quality_flag = CROP_FORMATS[name]
+    crops = []
+    for detection in detections:
+        ok, buf = cv2.imencode(extension, image.crop(*detection["bbox"]), [quality_flag, quality])
+        crops.append(buf.tobytes() if ok else b"")
+    return crops
+
+
+def process_image(image_bytes, deadline=None, timings=None, tiled=None, crop_format=None):
+    try:
+        check_deadline(deadline)
+    except DeadlineExceeded as e:
+        return {"status": "error", "message": str(e)}, 504
+
+    try:
+        image = wait_batched([decode_stage.submit(image_bytes, deadline)], timings, "decode")[0]
+    except DeadlineExceeded as e:
+        return {"status": "error", "message": str(e)}, 504
+
+    if image is None:
+        return {
+            "status": "error",
+            "message": "Invalid image format"
+        }, 400
+
+    try:
+        result = verify_prepared(image, deadline, timings, tiled)
+    except DeadlineExceeded as e:
+        return {"status": "error", "message": str(e)}, 504
+
+    if crop_format and result["detections"]:
+        with timed(timings, "encode"):
+            result["crops"] = encode_crops(image, result["detections"], crop_format)
+    return result, 200
+
+
+def verify_video(path, deadline=None, timings=None):
+    """Track packages across sampled frames and classify each track once, on its best crop."""
+    models = active_models
+    if models is None:
+        return {
+            "status": "error",
+            "message": "Models not loaded",
             "detections": []
         }
 
+    tracker = Tracker()
+    frames_sampled = 0
+    chunk = []
+
+    def track_chunk():
+        images = [PreparedImage(frame) for _, frame in chunk]
+        results = wait_batched(yolo_batcher.submit_many([(models, image.detect) for image in images], deadline), timings, "yolo")
+        with timed(timings, "track"):
+            for (seconds, _), image, boxes in zip(chunk, images, results):
+                tracker.update(
+                    [image.to_original(box) for box in boxes],
+                    seconds,
+                    lambda box, image=image: cv2.resize(image.crop(*box[:4]), (IMG_SIZE, IMG_SIZE)),
+                )
+        chunk.clear()
+
+    frames = sample_frames(path)
+    truncated_at = None
+    while True:
+        with timed(timings, "decode"):
+            try:
+                sample = next(frames)
+            except StopIteration as stop:
+                truncated_at = stop.value
+                break
+        chunk.append(sample)
+        frames_sampled += 1
+        if len(chunk) == YOLO_BATCH_SIZE:
+            track_chunk()
+    if chunk:
+        track_chunk()
+
+    tracks = [track for track in tracker.tracks() if track.hits >= VIDEO_MIN_HITS]
+    summaries = [track.summary() for track in tracks]
+    cnn_preds = classify_escalated(models, {
+        i: track.best[3] if escalate(yolo_conf) else None
+        for i, (track, (_, _, yolo_conf)) in enumerate(zip(tracks, summaries))
+    }, deadline, timings)
+
     detections = []
+    for i, (track, (box, yolo_class, yolo_conf)) in enumerate(zip(tracks, summaries)):
+        detection = build_detection((*box[:4], yolo_class, yolo_conf), cnn_preds.get(i))
+        detection.update({
+            "track_id": track.id,
+            "first_seen_s": round(track.first_seen, 2),
+            "last_seen_s": round(track.last_seen, 2),
+            "frame_time_s": round(track.best[2], 2),
+            "sightings": track.hits,
+        })
+        detections.append(detection)
+
+    result = {
+        "status": "success",
+        "message": "Verification complete" if detections else "No packages detected",
+        "frames_sampled": frames_sampled,
+        "detections": detections,
+        "model_version": models.version
+    }
+    # Only a header that understated the length gets here; check_video refuses the rest.
+    if truncated_at is not None:
+        result["truncated_at_s"] = truncated_at
+    return result
 
-    for box in results[0].boxes:
-        x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-        yolo_class = int(box.cls[0])
-        yolo_conf = float(box.conf[0])
-        yolo_label = "authentic" if yolo_class == 0 else "counterfeit"
 
-        crop = image_array[y1:y2, x1:x2]
-        crop_resized = cv2.resize(crop, (IMG_SIZE, IMG_SIZE))
-        crop_array = crop_resized.astype("float32") / 255.0
-        crop_array = np.expand_dims(crop_array, axis=0)
+def process_video(path, deadline=None, timings=None):
+    try:
+        return verify_video(path, deadline, timings), 200
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}, 400
+    except DeadlineExceeded as e:
+        return {"status": "error", "message": str(e)}, 504
 
-        cnn_pred = cnn_model.predict(crop_array, verbose=0)
-        cnn_class = np.argmax(cnn_pred[0])
-        cnn_conf = float(np.max(cnn_pred[0]))
-        cnn_label = "authentic" if cnn_class == 0 else "counterfeit"
 
-        if yolo_label == cnn_label and cnn_conf > 0.8:
-            final_result = "GENUINE" if yolo_label == "authentic" else "COUNTERFEIT"
+def process_classify(uploads, deadline=None, timings=None):
+    """CNN predictions for (filename, bytes) crops; returns (result, status)."""
+    models = active_models
+    crops = []
+    with timed(timings, "decode"):
+        for filename, crop_bytes in uploads:
+            crop = cv2.imdecode(np.frombuffer(crop_bytes, np.uint8), cv2.IMREAD_COLOR)
+            if crop is None:
+                return {"status": "error", "message": f"Invalid image format: {filename}"}, 400
+            crops.append(cv2.resize(crop, (IMG_SIZE, IMG_SIZE)))
+
+    try:
+        futures = cnn_batcher.submit_many([(models, crop) for crop in crops], deadline)
+        preds = wait_batched(futures, timings, "cnn") if crops else []
+    except DeadlineExceeded as e:
+        return {"status": "error", "message": str(e)}, 504
+
+    predictions = []
+    for pred in preds:
+        cnn_label, cnn_conf = cnn_prediction(pred)
+        predictions.append({"cnn_label": cnn_label, "cnn_confidence": cnn_conf})
+    return {"status": "success", "predictions": predictions, "model_version": models.version}, 200
+
+
+def process_job(job):
+    kind, args = job
+    timings = {}
+    if kind == "warmup":
+        with timed(timings, "warmup"):
+            warmup(active_models)
+        return {"status": "success"}, 200, timings
+    if kind == "ready":
+        return {"status": "success", "model_version": active_models.version}, 200, timings
+    if kind == "video":
+        path, deadline = args
+        result, status = process_video(path, deadline, timings)
+    elif kind == "classify":
+        uploads, deadline = args
+        result, status = process_classify(uploads, deadline, timings)
+    else:
+        image_bytes, deadline, tiled, crop_format = args
+        result, status = process_image(image_bytes, deadline, timings, tiled, crop_format)
+    return result, status, timings
+
+
+def with_crops(result, image_bytes, deadline, timings, crop_format):
+    """A cached result plus freshly encoded crops; crops are never cached."""
+    if not crop_format or not result["detections"]:
+        return result
+    image = wait_batched([decode_stage.submit(image_bytes, deadline)], timings, "decode")[0]
+    with timed(timings, "encode"):
+        return dict(result, crops=encode_crops(image, result["detections"], crop_format))
+
+
+def run_verification(image_bytes, deadline, timings=None, tiled=None, crop_format=None):
+    """Verify one upload through the cache, admission queue and models.
+
+    Returns (result, status, cache) where cache is "HIT", "NEAR" or "MISS". Raises QueueFull.
+    With crop_format=(format, quality) a successful result also carries encoded "crops".
+    """
+    timings = {} if timings is None else timings
+    variant = "" if tiled is None else ("tiled" if tiled else "untiled")
+    cache_key, cached = inference_cache.get(image_bytes, variant)
+    if cached is not None:
+        cache_lookups_total.inc(result="hit")
+        record_detections(cached)
+        return with_crops(cached, image_bytes, deadline, timings, crop_format), 200, "HIT"
+
+    image_fingerprint = None
+    if PHASH_MAX_DISTANCE and inference_cache.version and not variant:
+        with timed(timings, "phash"):
+            image_fingerprint = fingerprint(image_bytes)
+        if image_fingerprint is not None:
+            similar = inference_cache.find_similar(image_fingerprint, PHASH_MAX_DISTANCE)
+            if similar is not None:
+                cache_lookups_total.inc(result="near")
+                inference_cache.put(cache_key, similar)
+                record_detections(similar)
+                return with_crops(similar, image_bytes, deadline, timings, crop_format), 200, "NEAR"
+    cache_lookups_total.inc(result="miss")
+
+    with admission.slot():
+        if worker_pool is not None:
+            result, status, worker_timings = worker_result(worker_pool.submit(("image", (image_bytes, deadline, tiled, crop_format))), deadline)
+            timings.update(worker_timings)
         else:
-            final_result = "SUSPICIOUS"
+            result, status = process_image(image_bytes, deadline, timings, tiled, crop_format)
+    crops = result.pop("crops", None)
 
-        detections.append({
-            "bbox": [x1, y1, x2, y2],
-            "yolo_label": yolo_label,
-            "yolo_confidence": yolo_conf,
-            "cnn_label": cnn_label,
-            "cnn_confidence": cnn_conf,
-            "result": final_result
-        })
+    for stage, seconds in timings.items():
+        stage_seconds.observe(seconds, stage=stage)
+    record_detections(result)
 
-    return {
-        "status": "success",
-        "message": "Verification complete",
-        "detections": detections
+    # A request that straddled a reload must not seed the new version's cache.
+    current = active_models
+    if status == 200 and result["status"] == "success" and current is not None and result.get("model_version") == current.version:
+        inference_cache.put(cache_key, result)
+        if image_fingerprint is not None:
+            inference_cache.add_fingerprint(cache_key, image_fingerprint)
+    if crops is not None:
+        result = dict(result, crops=crops)
+    return result, status, "MISS"
+
+
+def record_detections(result):
+    for detection in result.get("detections", []):
+        detections_total.inc(result=detection["result"], path=detection.get("path", "cnn"))
+
+
+def request_deadline(limit=REQUEST_DEADLINE_S):
+    timeout = limit
+    client_timeout = request.headers.get("X-Request-Timeout")
+    if client_timeout:
+        try:
+            timeout = min(timeout, float(client_timeout))
+        except ValueError:
+            pass
+    return time.time() + timeout
+
+
+def requested_tiling():
+    value = request.values.get("tiled")
+    if value is None:
+        return None
+    return value.lower() in ("1", "true", "yes")
+
+
+def requested_crops():
+    """(format, quality) from the crop_format / crop_quality form fields, or None."""
+    name = request.values.get("crop_format")
+    if not name:
+        return None
+    name = name.lower()
+    if name not in CROP_FORMATS:
+        raise ValueError(f"crop_format must be one of: {', '.join(CROP_FORMATS)}")
+    try:
+        quality = int(request.values.get("crop_quality", CROP_QUALITY))
+    except ValueError:
+        raise ValueError("crop_quality must be an integer")
+    return name, min(max(quality, 1), 100)
+
+
+def multipart_response(result, crops, crop_format):
+    """JSON result first, then one image part per detection, as multipart/mixed."""
+    boundary = uuid.uuid4().hex
+    extension, mimetype, _ = CROP_FORMATS[crop_format[0]]
+    parts = [(b"Content-Type: application/json\r\n", json.dumps(result).encode())]
+    for i, crop in enumerate(crops):
+        headers = f'Content-Type: {mimetype}\r\nContent-Disposition: attachment; name="crop"; filename="crop_{i}{extension}"\r\n'
+        parts.append((headers.encode(), crop))
+
+    body = b"".join(
+        b"--" + boundary.encode() + b"\r\n" + headers + b"\r\n" + payload + b"\r\n"
+        for headers, payload in parts
+    ) + b"--" + boundary.encode() + b"--\r\n"
+    return Response(body, content_type=f"multipart/mixed; boundary={boundary}")
+
+
+class BatchTooLarge(ValueError):
+    pass
+
+
+def check_batch_size(count, size):
+    if count > MAX_BATCH_IMAGES:
+        raise BatchTooLarge(f"At most {MAX_BATCH_IMAGES} images per batch")
+    if size > MAX_BATCH_BYTES:
+        raise BatchTooLarge(f"Batch expands to more than {MAX_BATCH_BYTES // (1024 * 1024)} MB")
+
+
+def read_archive(archive, count=0, size=0):
+    """Extract the images of a zip or tar upload; count and size are what the batch already holds.
+
+    Member counts and sizes come from the archive headers and are checked before anything
+    is decompressed, so a zip bomb is rejected without being expanded.
+    """
+    stream = archive.stream
+    if zipfile.is_zipfile(stream):
+        stream.seek(0)
+        with zipfile.ZipFile(stream) as zf:
+            members = [info for info in zf.infolist() if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)]
+            check_batch_size(count + len(members), size + sum(info.file_size for info in members))
+            # The zip module stops reading a member at its declared size.
+            return [(info.filename, zf.read(info)) for info in members]
+
+    stream.seek(0)
+    with tarfile.open(fileobj=stream) as tf:
+        members = []
+        for member in tf:
+            if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                members.append(member)
+                size += member.size
+                check_batch_size(count + len(members), size)
+        return [(member.name, tf.extractfile(member).read()) for member in members]
+
+
+def stream_batch(images, deadline, tiled=None):
+    executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY)
+    futures = {
+        executor.submit(run_verification, image_bytes, deadline, None, tiled): (index, name)
+        for index, (name, image_bytes) in enumerate(images)
     }
+    try:
+        for future in as_completed(futures):
+            index, name = futures[future]
+            try:
+                result, status, cache = future.result()
+            except QueueFull as e:
+                result, status, cache = {"status": "error", "message": str(e), "retry_after": e.retry_after}, 429, "MISS"
+            except Exception as e:
+                result, status, cache = {"status": "error", "message": str(e)}, 500, "MISS"
+            line = {"index": index, "name": name, "http_status": status, "cached": cache != "MISS"}
+            line.update(result)
+            yield json.dumps(line) + "\n"
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({"status": "error", "message": f"Upload larger than {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB"}), 413
+
+
+@app.before_request
+def start_request():
+    global in_flight
+    g.started = time.perf_counter()
+    with in_flight_lock:
+        in_flight += 1
+    if request.path.startswith("/api/") and startup_phase in ("starting", "loading", "warming"):
+        response = jsonify({"status": "error", "message": "Vision server is still starting"})
+        response.headers["Retry-After"] = "5"
+        return response, 503
+
+
+@app.teardown_request
+def finish_request(error=None):
+    global in_flight
+    with in_flight_lock:
+        in_flight -= 1
+    request_seconds.observe(time.perf_counter() - g.started, endpoint=request.endpoint or "unknown")
 
 
 @app.route("/", methods=["GET"])
@@ -104,10 +842,37 @@ def hello():
 def health():
     return jsonify({
         "status": "healthy",
-        "service": "vision-inspection"
+        "service": "vision-inspection",
+        "model_version": active_models.version if active_models is not None else None,
+        "cache": inference_cache.stats(),
+        "stages": {
+            stage.name: {
+                "threads": stage.threads,
+                "pending": stage.pending(),
+                "busy_seconds": round(stage.busy_seconds(), 3),
+                "utilisation": round(stage.utilisation(), 3)
+            }
+            for stage in pipeline_stages()
+        }
     })
 
 
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Readiness, unlike /health: 200 only once models are loaded and warmed up."""
+    body = {
+        "status": startup_phase,
+        "model_version": active_models.version if active_models is not None else None,
+        "startup_seconds": {phase: round(seconds, 3) for phase, seconds in startup_seconds.items()}
+    }
+    return jsonify(body), 200 if startup_phase == "ready" else 503
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/api/verify", methods=["POST"])
 def verify_package():
     if "image" not in request.files:
@@ -116,25 +881,187 @@ def verify_package():
             "message": "No image provided"
         }), 400
 
-    image_file = request.files["image"]
-    image_bytes = image_file.read()
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    image_array = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    try:
+        crop_format = requested_crops()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    deadline = request_deadline()
+    image_bytes = request.files["image"].read()
+
+    timings = {}
+    try:
+        result, status, cache = run_verification(image_bytes, deadline, timings, requested_tiling(), crop_format)
+    except QueueFull as e:
+        response = jsonify({"status": "error", "message": str(e)})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
+    except DeadlineExceeded as e:
+        return jsonify({"status": "error", "message": str(e)}), 504
+
+    crops = result.pop("crops", None)
+    if crops is not None:
+        with timed(timings, "serialize"):
+            response = multipart_response(result, crops, crop_format)
+    else:
+        response = jsonify(result)
+    response.headers["X-Cache"] = cache
+    if result.get("model_version"):
+        response.headers["X-Model-Version"] = result["model_version"]
+    if SERVER_TIMING and timings:
+        response.headers["Server-Timing"] = server_timing(timings)
+    return response, status
+
+
+@app.route("/admin/reload", methods=["POST"])
+def reload_endpoint():
+    if RELOAD_TOKEN and request.headers.get("X-Reload-Token") != RELOAD_TOKEN:
+        return jsonify({"status": "error", "message": "Invalid reload token"}), 403
+    try:
+        version = reload_models()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"Reload failed, previous models kept: {e}"}), 500
+    return jsonify({"status": "success", "model_version": version})
 
-    if image_array is None:
+
+@app.route("/api/verify/batch", methods=["POST"])
+def verify_batch():
+    uploads = request.files.getlist("images")
+    images = []
+    try:
+        check_batch_size(len(uploads), 0)
+        size = 0
+        for i, f in enumerate(uploads):
+            image_bytes = f.read(MAX_BATCH_BYTES - size + 1)
+            size += len(image_bytes)
+            check_batch_size(len(uploads), size)
+            images.append((f.filename or f"image_{i}", image_bytes))
+        if "archive" in request.files:
+            images.extend(read_archive(request.files["archive"], len(images), size))
+    except BatchTooLarge as e:
+        return jsonify({"status": "error", "message": str(e)}), 413
+    except (tarfile.TarError, zipfile.BadZipFile):
         return jsonify({
             "status": "error",
-            "message": "Invalid image format"
+            "message": "Archive must be a zip or tar file"
+        }), 400
+
+    if not images:
+        return jsonify({
+            "status": "error",
+            "message": "No images provided"
         }), 400
 
-    result = verify_image(image_array)
-    return jsonify(result)
+    deadline = request_deadline(BATCH_DEADLINE_S)
+    return Response(stream_with_context(stream_batch(images, deadline, requested_tiling())), mimetype="application/x-ndjson")
+
+
+@app.route("/api/classify", methods=["POST"])
+def classify_upload():
+    """Run only the CNN on already-cropped package images, in upload order."""
+    if active_models is None:
+        return jsonify({"status": "error", "message": "Models not loaded"}), 503
+
+    uploads = [(upload.filename, upload.read()) for upload in request.files.getlist("crops")]
+    deadline = request_deadline()
+    timings = {}
+    try:
+        with admission.slot():
+            if worker_pool is not None:
+                result, status, worker_timings = worker_result(worker_pool.submit(("classify", (uploads, deadline))), deadline)
+                timings.update(worker_timings)
+            else:
+                result, status = process_classify(uploads, deadline, timings)
+    except QueueFull as e:
+        response = jsonify({"status": "error", "message": str(e)})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
+    except DeadlineExceeded as e:
+        return jsonify({"status": "error", "message": str(e)}), 504
+
+    for stage, seconds in timings.items():
+        stage_seconds.observe(seconds, stage=stage)
+    response = jsonify(result)
+    if SERVER_TIMING and timings:
+        response.headers["Server-Timing"] = server_timing(timings)
+    return response, status
+
+
+def check_video(path):
+    """(message, status) when a saved video upload is over the limits, else None."""
+    if os.path.getsize(path) > MAX_VIDEO_BYTES:
+        return f"Video is larger than {MAX_VIDEO_BYTES // (1024 * 1024)} MB", 413
+    try:
+        frames, seconds = video_length(path)
+    except ValueError as e:
+        return str(e), 400
+    if frames > MAX_VIDEO_FRAMES or seconds > MAX_VIDEO_SECONDS:
+        return f"Video has {frames} frames over {seconds:.0f}s; the limit is {MAX_VIDEO_FRAMES} frames or {MAX_VIDEO_SECONDS:g}s", 413
+    return None
+
+
+@app.route("/api/verify/video", methods=["POST"])
+def verify_video_upload():
+    if request.content_length is not None and request.content_length > MAX_VIDEO_BYTES:
+        return jsonify({"status": "error", "message": f"Video is larger than {MAX_VIDEO_BYTES // (1024 * 1024)} MB"}), 413
+    if "video" not in request.files:
+        return jsonify({
+            "status": "error",
+            "message": "No video provided"
+        }), 400
+
+    deadline = request_deadline(VIDEO_DEADLINE_S)
+    upload = request.files["video"]
+    # VideoCapture only reads from a path; workers share the filesystem.
+    suffix = os.path.splitext(upload.filename or "")[1] or ".mp4"
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        upload.save(f)
+        path = f.name
+
+    timings = {}
+    try:
+        rejected = check_video(path)
+        if rejected is not None:
+            return jsonify({"status": "error", "message": rejected[0]}), rejected[1]
+        with admission.slot():
+            if worker_pool is not None:
+                result, status, worker_timings = worker_result(worker_pool.submit(("video", (path, deadline))), deadline)
+                timings.update(worker_timings)
+            else:
+                result, status = process_video(path, deadline, timings)
+    except QueueFull as e:
+        response = jsonify({"status": "error", "message": str(e)})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
+    except DeadlineExceeded as e:
+        return jsonify({"status": "error", "message": str(e)}), 504
+    finally:
+        os.unlink(path)
+
+    for stage, seconds in timings.items():
+        stage_seconds.observe(seconds, stage=stage)
+    record_detections(result)
+
+    response = jsonify(result)
+    if SERVER_TIMING and timings:
+        response.headers["Server-Timing"] = server_timing(timings)
+    return response, status
 
 
 if __name__ == "__main__":
     port = 5000
 
-    load_models()
+    if VISION_WORKERS:
+        set_thread_budget(thread_budget(VISION_WORKERS))
+
+    # Listen straight away so /health answers during startup; /ready waits for warmup.
+    # Workers are forked by a spawned zygote, never by this threaded process.
+    threading.Thread(target=start_up, name="startup", daemon=True).start()
+
+    if MODEL_WATCH_INTERVAL:
+        threading.Thread(target=watch_models, args=(MODEL_WATCH_INTERVAL,), name="model-watcher", daemon=True).start()
 
     print(f"Server running at http://localhost:{port}")
     app.run(host="0.0.0.0", port=port)
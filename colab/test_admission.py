@@ -0,0 +1,45 @@
+import time
+import unittest
+from contextlib import ExitStack
+from admission import AdmissionQueue, QueueFull, DeadlineExceeded, check_deadline
+
+
+class AdmissionQueueTestCase(unittest.TestCase):
+    def test_rejects_when_full_and_admits_again_once_drained(self):
+        admission = AdmissionQueue(2, concurrency=1)
+        with ExitStack() as stack:
+            stack.enter_context(admission.slot())
+            stack.enter_context(admission.slot())
+            self.assertEqual(admission.depth, 2)
+            with self.assertRaises(QueueFull) as raised:
+                with admission.slot():
+                    pass
+            self.assertGreaterEqual(raised.exception.retry_after, 1)
+            self.assertEqual(admission.depth, 2)
+
+        self.assertEqual(admission.depth, 0)
+        with admission.slot():
+            self.assertEqual(admission.depth, 1)
+
+    def test_slot_is_released_when_the_request_fails(self):
+        admission = AdmissionQueue(1)
+        with self.assertRaises(ValueError):
+            with admission.slot():
+                raise ValueError("bad upload")
+        self.assertEqual(admission.depth, 0)
+
+    def test_retry_after_scales_with_depth_over_concurrency(self):
+        admission = AdmissionQueue(10, concurrency=2)
+        admission._service_time = 3.0
+        admission.depth = 4
+        self.assertEqual(admission.retry_after(), 6)
+
+    def test_check_deadline(self):
+        check_deadline(None)
+        check_deadline(time.time() + 5)
+        with self.assertRaises(DeadlineExceeded):
+            check_deadline(time.time() - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
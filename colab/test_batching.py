@@ -0,0 +1,75 @@
+import threading
+import time
+import unittest
+from batching import MicroBatcher
+from admission import DeadlineExceeded
+
+
+class MicroBatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.release = threading.Event()
+
+    def batch_fn(self, items):
+        # The first batch holds the stage so the test can queue the next ones behind it.
+        if not self.batches:
+            self.release.wait(5)
+        self.batches.append(list(items))
+        return [item * 10 for item in items]
+
+    def test_flushes_when_the_batch_is_full(self):
+        batcher = MicroBatcher("test", self.batch_fn, max_batch_size=4, max_wait_ms=50)
+        first = batcher.submit(0)
+        time.sleep(0.05)
+        futures = batcher.submit_many([1, 2, 3, 4, 5, 6])
+        self.release.set()
+
+        self.assertEqual(first.result(5), 0)
+        self.assertEqual([future.result(5) for future in futures], [10, 20, 30, 40, 50, 60])
+        self.assertEqual(self.batches, [[0], [1, 2, 3, 4], [5, 6]])
+
+    def test_flushes_a_partial_batch_after_max_wait(self):
+        batcher = MicroBatcher("test", self.batch_fn, max_batch_size=8, max_wait_ms=100)
+        batcher.submit(0)
+        time.sleep(0.05)
+        futures = batcher.submit_many([1, 2])
+        started = time.monotonic()
+        self.release.set()
+
+        self.assertEqual([future.result(5) for future in futures], [10, 20])
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+        self.assertEqual(self.batches[1], [1, 2])
+
+    def test_lone_item_runs_without_waiting(self):
+        self.release.set()
+        batcher = MicroBatcher("test", self.batch_fn, max_batch_size=8, max_wait_ms=1000)
+        started = time.monotonic()
+        self.assertEqual(batcher.submit(3).result(5), 30)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_expired_items_are_dropped_before_the_model(self):
+        batcher = MicroBatcher("test", self.batch_fn, max_batch_size=4, max_wait_ms=0)
+        batcher.submit(0)
+        time.sleep(0.05)
+        expired = batcher.submit(1, deadline=time.time() + 0.01)
+        live = batcher.submit(2, deadline=time.time() + 5)
+        time.sleep(0.05)
+        self.release.set()
+
+        with self.assertRaises(DeadlineExceeded):
+            expired.result(5)
+        self.assertEqual(live.result(5), 20)
+        self.assertNotIn(1, [item for batch in self.batches for item in batch])
+
+    def test_batch_errors_fail_every_item(self):
+        def broken(items):
+            raise RuntimeError("model failed")
+
+        batcher = MicroBatcher("test", broken, max_batch_size=4)
+        future = batcher.submit(1)
+        with self.assertRaisesRegex(RuntimeError, "model failed"):
+            future.result(5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import unittest
+from cache import InferenceCache
+
+
+def result(label, padding=0):
+    return {"detections": [{"class_name": label, "bbox": [10, 20, 110, 220]}], "padding": "x" * padding}
+
+
+def key(n):
+    return f"{n:064x}"
+
+
+class MemoryTierTestCase(unittest.TestCase):
+    def test_least_recently_used_entry_is_evicted_by_bytes(self):
+        cache = InferenceCache(max_bytes=400)
+        cache.set_version("v1")
+        cache.put(key(1), result("a", 100))
+        cache.put(key(2), result("b", 100))
+        cache.lookup(key(1))
+        cache.put(key(3), result("c", 100))
+
+        self.assertLessEqual(cache.size, 400)
+        self.assertEqual(cache.lookup(key(1))[1]["detections"][0]["class_name"], "a")
+        self.assertIsNone(cache.lookup(key(2))[1])
+        self.assertIsNotNone(cache.lookup(key(3))[1])
+
+    def test_entry_larger_than_the_budget_is_not_kept(self):
+        cache = InferenceCache(max_bytes=100)
+        cache.set_version("v1")
+        cache.put(key(1), result("a", 500))
+        self.assertEqual(cache.size, 0)
+        self.assertIsNone(cache.lookup(key(1))[1])
+
+    def test_new_version_discards_entries(self):
+        cache = InferenceCache(max_bytes=4096)
+        cache.set_version("v1")
+        cache.put(key(1), result("a"))
+        cache.set_version("v2")
+        self.assertIsNone(cache.lookup(key(1))[1])
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_fingerprints_follow_memory_eviction(self):
+        cache = InferenceCache(max_bytes=400)
+        cache.set_version("v1")
+        for n in range(20):
+            cache.put(key(n), result("a", 100))
+            cache.add_fingerprint(key(n), (n, (640, 480)))
+        self.assertLessEqual(cache.stats()["fingerprints"], 2 * cache.stats()["entries"] + 1)
+
+
+class DiskTierTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+
+    def cache(self, max_disk_bytes=1024 * 1024):
+        return InferenceCache(max_bytes=4096, cache_dir=self.dir, max_disk_bytes=max_disk_bytes)
+
+    def test_results_survive_a_restart(self):
+        first = self.cache()
+        first.set_version("v1")
+        first.put(key(1), result("a"))
+        first.add_fingerprint(key(1), (0xABCD, (640, 480)))
+
+        second = self.cache()
+        second.set_version("v1")
+        _, cached = second.lookup(key(1))
+        self.assertEqual(cached["detections"][0]["class_name"], "a")
+        self.assertEqual(second.stats()["disk_hits"], 1)
+        similar = second.find_similar((0xABCD, (1280, 960)), 2)
+        self.assertEqual(similar["duplicate_of"], key(1))
+        self.assertEqual(similar["detections"][0]["bbox"], [20, 40, 220, 440])
+
+    def test_new_version_removes_only_its_own_directories(self):
+        unrelated = os.path.join(self.dir, "unrelated_data")
+        os.makedirs(unrelated)
+        with open(os.path.join(unrelated, "keep.txt"), "w") as f:
+            f.write("keep")
+
+        first = self.cache()
+        first.set_version("v1")
+        first.put(key(1), result("a"))
+
+        second = self.cache()
+        second.set_version("v2")
+        self.assertIsNone(second.lookup(key(1))[1])
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "inference-cache", "v1")))
+        self.assertTrue(os.path.exists(os.path.join(unrelated, "keep.txt")))
+
+    def test_disk_tier_is_bounded_by_bytes(self):
+        cache = self.cache(max_disk_bytes=1000)
+        cache.set_version("v1")
+        for n in range(20):
+            cache.put(key(n), result("a", 100))
+            cache.add_fingerprint(key(n), (n, (640, 480)))
+
+        stats = cache.stats()
+        self.assertLessEqual(stats["disk_bytes"], 1000)
+        on_disk = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(os.path.join(self.dir, "inference-cache"))
+            for name in names if name.endswith(".json")
+        )
+        self.assertEqual(on_disk, stats["disk_bytes"])
+        self.assertLessEqual(stats["fingerprints"], 2 * stats["disk_entries"] + 1)
+
+        with open(os.path.join(self.dir, "inference-cache", "v1", "fingerprints.txt")) as f:
+            self.assertLessEqual(len(f.read().splitlines()), 2 * stats["disk_entries"] + 1)
+
+        restarted = self.cache(max_disk_bytes=1000)
+        restarted.set_version("v1")
+        self.assertEqual(restarted.stats()["disk_entries"], stats["disk_entries"])
+        self.assertEqual(restarted.stats()["fingerprints"], stats["disk_entries"])
+        self.assertIsNotNone(restarted.lookup(key(19))[1])
+        self.assertIsNone(restarted.lookup(key(0))[1])
+
+    def test_restart_with_a_smaller_budget_trims_the_oldest_files(self):
+        first = self.cache()
+        first.set_version("v1")
+        for n in range(5):
+            first.put(key(n), result("a", 100))
+            path = first._path(key(n))
+            os.utime(path, ns=(n * 10**9, n * 10**9))
+
+        second = self.cache(max_disk_bytes=500)
+        second.set_version("v1")
+        self.assertLessEqual(second.stats()["disk_bytes"], 500)
+        self.assertIsNone(second.lookup(key(0))[1])
+        self.assertIsNotNone(second.lookup(key(4))[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from metrics import CallbackCounter, Counter, Gauge, Histogram, Registry
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_counter_renders_sorted_labels(self):
+        counter = Counter("vision_detections_total", "Detections by result")
+        counter.inc(result="genuine", path="cnn")
+        counter.inc(2, result="genuine", path="cnn")
+        self.assertEqual(counter.render(), [
+            "# HELP vision_detections_total Detections by result",
+            "# TYPE vision_detections_total counter",
+            'vision_detections_total{path="cnn",result="genuine"} 3',
+        ])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("vision_stage_seconds", "Stage time", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(value, stage="yolo")
+        self.assertEqual(histogram.render()[2:], [
+            'vision_stage_seconds_bucket{stage="yolo",le="0.1"} 1',
+            'vision_stage_seconds_bucket{stage="yolo",le="1.0"} 3',
+            'vision_stage_seconds_bucket{stage="yolo",le="+Inf"} 4',
+            'vision_stage_seconds_sum{stage="yolo"} 4.25',
+            'vision_stage_seconds_count{stage="yolo"} 4',
+        ])
+
+    def test_callbacks_are_read_at_scrape_time(self):
+        depth = {"value": 1}
+        gauge = Gauge("vision_queue_depth", "Requests admitted", lambda: depth["value"])
+        depth["value"] = 4
+        self.assertEqual(gauge.render()[-1], "vision_queue_depth 4")
+
+        hits = CallbackCounter("vision_cache_total", "Cache lookups", lambda: {(("result", "hit"),): 7})
+        self.assertEqual(hits.render()[1:], ["# TYPE vision_cache_total counter", 'vision_cache_total{result="hit"} 7'])
+
+    def test_registry_joins_metrics_in_registration_order(self):
+        registry = Registry()
+        registry.add(Gauge("b", "second", lambda: 2))
+        registry.add(Counter("a", "first")).inc()
+        text = registry.render()
+        self.assertTrue(text.endswith("a 1\n"))
+        self.assertLess(text.index("# HELP b"), text.index("# HELP a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
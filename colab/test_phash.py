@@ -0,0 +1,59 @@
+import random
+import unittest
+import cv2
+import numpy as np
+from phash import BKTree, dhash, fingerprint, hamming
+
+
+def photo(seed=0, size=(480, 640)):
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, (6, 8, 3), dtype=np.uint8)
+    return cv2.resize(small, (size[1], size[0]), interpolation=cv2.INTER_CUBIC)
+
+
+def jpeg(image, quality=90):
+    ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes()
+
+
+class FingerprintTestCase(unittest.TestCase):
+    def test_recompressed_image_stays_within_a_few_bits(self):
+        original, size = fingerprint(jpeg(photo(), 95))
+        recompressed, _ = fingerprint(jpeg(photo(), 60))
+        other, _ = fingerprint(jpeg(photo(seed=1), 95))
+        self.assertEqual(size, (640, 480))
+        self.assertLessEqual(hamming(original, recompressed), 5)
+        self.assertGreater(hamming(original, other), 5)
+
+    def test_dhash_is_64_bits(self):
+        value = dhash(cv2.cvtColor(photo(), cv2.COLOR_BGR2GRAY))
+        self.assertLess(value, 1 << 64)
+
+    def test_undecodable_upload_has_no_fingerprint(self):
+        self.assertIsNone(fingerprint(b"not an image"))
+
+
+class BKTreeTestCase(unittest.TestCase):
+    def test_radius_search_matches_a_linear_scan(self):
+        rng = random.Random(7)
+        values = [rng.getrandbits(64) for _ in range(500)]
+        # Near neighbours of the first value, so small radii have something to find.
+        values += [values[0] ^ (1 << bit) ^ (1 << (bit + 7)) for bit in range(20)]
+        tree = BKTree()
+        for i, value in enumerate(values):
+            tree.add(value, i)
+        self.assertEqual(tree.count, len(values))
+
+        for query in (values[0], values[3], rng.getrandbits(64)):
+            for radius in (0, 2, 5, 20):
+                expected = sorted((hamming(query, value), i) for i, value in enumerate(values) if hamming(query, value) <= radius)
+                found = tree.search(query, radius)
+                self.assertEqual(sorted(found), expected)
+                self.assertEqual([distance for distance, _ in found], sorted(distance for distance, _ in found))
+
+    def test_empty_tree_finds_nothing(self):
+        self.assertEqual(BKTree().search(0, 64), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
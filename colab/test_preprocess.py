@@ -0,0 +1,67 @@
+import unittest
+from unittest import mock
+import cv2
+import numpy as np
+import preprocess
+from preprocess import PreparedImage, decode, decode_factor, jpeg_size
+
+
+def encode(image, ext=".jpg"):
+    ok, buf = cv2.imencode(ext, image)
+    return buf.tobytes()
+
+
+def gradient(width, height):
+    x = np.linspace(0, 255, width, dtype=np.uint8)
+    return np.dstack([np.tile(x, (height, 1))] * 3)
+
+
+@mock.patch.object(preprocess, "MAX_DETECT_SIDE", 640)
+@mock.patch.object(preprocess, "CROP_SOURCE_SIDE", 800)
+class DecodeTestCase(unittest.TestCase):
+    def test_reads_jpeg_size_from_the_header(self):
+        self.assertEqual(jpeg_size(encode(gradient(3400, 1000))), (3400, 1000))
+        self.assertIsNone(jpeg_size(b"\xff\xd8not a jpeg"))
+
+    def test_picks_the_largest_reduction_that_keeps_the_crop_source_side(self):
+        self.assertEqual(decode_factor((3400, 1000)), 4)
+        self.assertEqual(decode_factor((6400, 4800)), 8)
+        self.assertEqual(decode_factor((1000, 700)), 1)
+        self.assertEqual(decode_factor(None), 1)
+
+    def test_large_jpeg_is_decoded_reduced_and_keeps_its_original_size(self):
+        image = decode(encode(gradient(3400, 1000)))
+        self.assertEqual(image.source.shape[:2], (250, 850))
+        self.assertEqual(image.original_size, (3400, 1000))
+        self.assertEqual(max(image.detect.shape[:2]), 640)
+
+    def test_png_is_decoded_at_full_size(self):
+        image = decode(encode(gradient(1200, 400), ".png"))
+        self.assertEqual(image.source.shape[:2], (400, 1200))
+        self.assertEqual(image.original_size, (1200, 400))
+
+    def test_undecodable_upload_returns_none(self):
+        self.assertIsNone(decode(b"not an image"))
+
+    def test_detect_boxes_map_back_to_original_pixels(self):
+        image = decode(encode(gradient(3400, 1000)))
+        detect_h, detect_w = image.detect.shape[:2]
+        self.assertEqual(image.to_original((0, 0, detect_w, detect_h, 2, 0.9)), (0, 0, 3400, 1000, 2, 0.9))
+
+        x1, y1, x2, y2 = image.to_original((detect_w / 2, 0, detect_w, detect_h / 2))
+        self.assertAlmostEqual(x1, 1700, delta=1)
+        self.assertAlmostEqual(y2, 500, delta=1)
+        self.assertEqual((y1, x2), (0, 3400))
+
+    def test_tile_offsets_are_added_before_scaling(self):
+        image = PreparedImage(np.zeros((1000, 2000, 3), np.uint8))
+        self.assertEqual(image.to_original((10, 20, 110, 120), space=image.source, offset=(1000, 0)), (1010, 20, 1110, 120))
+
+    def test_crops_in_original_pixels_come_from_the_reduced_source(self):
+        image = decode(encode(gradient(3400, 1000)))
+        self.assertEqual(image.crop(0, 0, 3400, 1000).shape[:2], image.source.shape[:2])
+        self.assertEqual(image.crop(1700, 0, 3400, 500).shape[:2], (125, 425))
+
+
+if __name__ == "__main__":
+    unittest.main()
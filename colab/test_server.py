@@ -0,0 +1,281 @@
+import functools
+import io
+import json
+import tarfile
+import unittest
+import zipfile
+from email.parser import BytesParser
+from email.policy import HTTP
+from unittest import mock
+import cv2
+import numpy as np
+import server
+import video
+from backends import SyntheticClassifier, SyntheticDetector
+from test_video import write_video
+from workers import WorkerPool
+
+
+def jpeg(size=(64, 64), value=0):
+    ok, buf = cv2.imencode(".jpg", np.full((size[1], size[0], 3), value, np.uint8))
+    return buf.tobytes()
+
+
+class BrokenClassifier(SyntheticClassifier):
+    def predict(self, batch):
+        raise RuntimeError("classifier failed to warm up")
+
+
+def synthetic_models(version):
+    classifier = BrokenClassifier(work=8) if version.endswith("broken") else SyntheticClassifier(work=8)
+    return server.ModelSet(SyntheticDetector(boxes=2, work=8), classifier, version)
+
+
+def synthetic_worker_models(version):
+    return functools.partial(server.activate_worker_models, synthetic_models(version))
+
+
+def zipped(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def tarred(members):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tf:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    buf.seek(0)
+    return buf
+
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):
+        server.install_models(server.ModelSet(SyntheticDetector(boxes=2, work=8), SyntheticClassifier(work=8), "synthetic"))
+        server.startup_phase = "ready"
+        self.client = server.app.test_client()
+
+
+class VerifyBatchTestCase(ServerTestCase):
+    def post(self, **files):
+        return self.client.post("/api/verify/batch", data=files)
+
+    def lines(self, response):
+        return [json.loads(line) for line in response.data.splitlines()]
+
+    def test_archive_and_loose_images_stream_one_line_each(self):
+        archive = tarred([("a.jpg", jpeg(value=10)), ("b.jpg", jpeg(value=20)), ("notes.txt", b"skip")])
+        response = self.post(archive=(archive, "batch.tar"), images=[(io.BytesIO(jpeg(value=30)), "c.jpg")])
+        self.assertEqual(response.status_code, 200)
+        lines = self.lines(response)
+        self.assertEqual(sorted(line["name"] for line in lines), ["a.jpg", "b.jpg", "c.jpg"])
+        self.assertTrue(all(line["http_status"] == 200 for line in lines))
+
+    def test_zip_bomb_is_refused_from_its_headers(self):
+        bomb = zipped([("bomb.jpg", b"\0" * (3 * 1024 * 1024))])
+        self.assertLess(len(bomb.getvalue()), 64 * 1024)
+        with mock.patch.object(server, "MAX_BATCH_BYTES", 1024 * 1024), \
+                mock.patch.object(zipfile.ZipFile, "read", side_effect=AssertionError("member was extracted")):
+            response = self.post(archive=(bomb, "bomb.zip"))
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("MB", response.json["message"])
+
+    def test_too_many_members_are_refused(self):
+        with mock.patch.object(server, "MAX_BATCH_IMAGES", 3):
+            response = self.post(archive=(zipped([(f"{i}.jpg", b"x") for i in range(4)]), "many.zip"))
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("At most 3", response.json["message"])
+
+    def test_loose_images_count_against_the_archive_limits(self):
+        with mock.patch.object(server, "MAX_BATCH_IMAGES", 2):
+            response = self.post(
+                archive=(tarred([("a.jpg", b"x"), ("b.jpg", b"x")]), "batch.tar"),
+                images=[(io.BytesIO(jpeg()), "c.jpg")],
+            )
+        self.assertEqual(response.status_code, 413)
+
+    def test_non_archive_is_a_400(self):
+        response = self.post(archive=(io.BytesIO(b"not an archive"), "batch.zip"))
+        self.assertEqual(response.status_code, 400)
+
+    def test_request_over_max_content_length_is_a_json_413(self):
+        with mock.patch.dict(server.app.config, {"MAX_CONTENT_LENGTH": 1000}):
+            response = self.post(images=[(io.BytesIO(b"x" * 5000), "big.jpg")])
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json["status"], "error")
+
+
+class CropResponseTestCase(ServerTestCase):
+    def verify(self, image, **fields):
+        return self.client.post("/api/verify", data=dict(fields, image=(io.BytesIO(image), "shelf.jpg")))
+
+    def parts(self, response):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {response.headers['Content-Type']}\r\n\r\n".encode() + response.data
+        )
+        return [(part.get_content_type(), part.get_payload(decode=True)) for part in message.iter_parts()]
+
+    def test_json_comes_first_then_one_crop_per_detection(self):
+        response = self.verify(jpeg((320, 240), 90), crop_format="jpeg", crop_quality="80")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["Content-Type"].startswith("multipart/mixed"))
+        parts = self.parts(response)
+        self.assertEqual(parts[0][0], "application/json")
+        result = json.loads(parts[0][1])
+        self.assertNotIn("crops", result)
+        crops = parts[1:]
+        self.assertGreater(len(result["detections"]), 0)
+        self.assertEqual(len(crops), len(result["detections"]))
+        for (content_type, payload), detection in zip(crops, result["detections"]):
+            self.assertEqual(content_type, "image/jpeg")
+            crop = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+            x1, y1, x2, y2 = detection["bbox"]
+            self.assertEqual(crop.shape[:2], (y2 - y1, x2 - x1))
+
+    def test_cache_hits_still_carry_crops(self):
+        image = jpeg((320, 240), 91)
+        self.verify(image, crop_format="webp")
+        response = self.verify(image, crop_format="webp")
+        self.assertEqual(response.headers["X-Cache"], "HIT")
+        parts = self.parts(response)
+        self.assertEqual({content_type for content_type, _ in parts[1:]}, {"image/webp"})
+        self.assertEqual(len(parts) - 1, len(json.loads(parts[0][1])["detections"]))
+
+    def test_without_crop_format_the_response_is_plain_json(self):
+        response = self.verify(jpeg((320, 240), 92))
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertNotIn("crops", response.json)
+
+    def test_unknown_crop_format_is_a_400(self):
+        response = self.verify(jpeg(), crop_format="gif")
+        self.assertEqual(response.status_code, 400)
+
+
+class ReloadTestCase(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        server.install_models(synthetic_models("v1"))
+
+    def reload(self, version):
+        with mock.patch.object(server, "model_version", return_value=version):
+            return self.client.post("/admin/reload")
+
+    def verify(self, value):
+        return self.client.post("/api/verify", data={"image": (io.BytesIO(jpeg((160, 120), value)), "shelf.jpg")})
+
+    def test_reload_swaps_models_and_cache_version(self):
+        cache_version = server.inference_cache.version
+        with mock.patch.object(server, "load_model_set", side_effect=lambda: synthetic_models("v2")):
+            response = self.reload("v2")
+        self.assertEqual(response.json, {"status": "success", "model_version": "v2"})
+        self.assertEqual(self.verify(40).json["model_version"], "v2")
+        self.assertNotEqual(server.inference_cache.version, cache_version)
+        self.assertEqual(self.reload("v2").status_code, 409)
+
+    def test_failed_warmup_keeps_the_old_models(self):
+        cache_version = server.inference_cache.version
+        with mock.patch.object(server, "load_model_set", side_effect=lambda: synthetic_models("v2-broken")):
+            response = self.reload("v2-broken")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(server.active_models.version, "v1")
+        self.assertEqual(server.inference_cache.version, cache_version)
+
+    def test_worker_reload_installs_only_after_the_new_workers_are_warm(self):
+        pool = WorkerPool(server.process_job, 1, handler_threads=1)
+        pool.start(functools.partial(synthetic_worker_models, "v1"), warmup=server.worker_warmup())
+        self.addCleanup(pool.stop)
+        server.install_models(server.ModelSet(None, None, "v1"))
+        patches = [
+            mock.patch.object(server, "worker_pool", pool),
+            mock.patch.object(server, "load_worker_models", synthetic_worker_models),
+            mock.patch.object(server, "model_files_present", return_value=True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        cache_version = server.inference_cache.version
+
+        response = self.reload("v2-broken")
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("previous models kept", response.json["message"])
+        self.assertEqual(server.active_models.version, "v1")
+        self.assertEqual(server.inference_cache.version, cache_version)
+        # The old workers still serve, and their results are still cached.
+        self.assertEqual(self.verify(50).json["model_version"], "v1")
+        self.assertEqual(self.verify(50).headers["X-Cache"], "HIT")
+
+        # A failed reload can be retried.
+        response = self.reload("v2")
+        self.assertEqual(response.json, {"status": "success", "model_version": "v2"})
+        self.assertEqual(self.verify(51).json["model_version"], "v2")
+        self.assertNotEqual(server.inference_cache.version, cache_version)
+
+
+class BuildDetectionTestCase(unittest.TestCase):
+    def test_disputed_box_is_suspicious_even_when_the_cnn_agrees(self):
+        box = (0, 0, 10, 10, 0, 0.95)
+        self.assertEqual(server.build_detection(box, np.array([0.99, 0.01]))["result"], "GENUINE")
+        detection = server.build_detection((*box, True), np.array([0.99, 0.01]))
+        self.assertEqual(detection["result"], "SUSPICIOUS")
+        self.assertTrue(detection["disputed"])
+        self.assertEqual(detection["bbox"], [0, 0, 10, 10])
+
+
+class ClassifyTestCase(ServerTestCase):
+    def post(self, *crops):
+        return self.client.post("/api/classify", data={"crops": [(io.BytesIO(crop), f"{i}.jpg") for i, crop in enumerate(crops)]})
+
+    def test_crops_are_classified_in_upload_order(self):
+        response = self.post(jpeg(value=10), jpeg(value=200))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json["predictions"]), 2)
+        self.assertEqual(self.post(b"not an image").status_code, 400)
+
+    def test_full_admission_queue_is_a_429(self):
+        with mock.patch.object(server.admission, "slot", side_effect=server.QueueFull(2)):
+            response = self.post(jpeg())
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "2")
+
+    def test_worker_mode_classifies_in_the_workers(self):
+        pool = WorkerPool(server.process_job, 1, handler_threads=1)
+        pool.start(functools.partial(synthetic_worker_models, "v1"), warmup=server.worker_warmup())
+        self.addCleanup(pool.stop)
+        # The parent holds no models in worker mode, so only a worker can answer.
+        server.install_models(server.ModelSet(None, None, "v1"))
+        with mock.patch.object(server, "worker_pool", pool):
+            response = self.post(jpeg(value=10), jpeg(value=200))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json["model_version"], "v1")
+            self.assertEqual(len(response.json["predictions"]), 2)
+            self.assertEqual(self.post(b"not an image").status_code, 400)
+
+
+class VideoUploadTestCase(ServerTestCase):
+    def post(self, path):
+        with open(path, "rb") as f:
+            return self.client.post("/api/verify/video", data={"video": (f, "clip.avi")})
+
+    def test_video_longer_than_the_limit_is_refused(self):
+        with mock.patch.object(server, "MAX_VIDEO_SECONDS", 2.0):
+            response = self.post(write_video(self))
+        self.assertEqual(response.status_code, 413)
+
+    def test_understated_length_is_cut_at_the_limit_and_reported(self):
+        # The header passes check_video; the sampler still stops at the limit.
+        with mock.patch.object(video, "MAX_VIDEO_SECONDS", 1.0):
+            response = self.post(write_video(self))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["truncated_at_s"], 1.0)
+        with mock.patch.object(video, "MAX_VIDEO_SECONDS", 5.0):
+            self.assertNotIn("truncated_at_s", self.post(write_video(self)).get_json())
+
+
+if __name__ == "__main__":
+    unittest.main()
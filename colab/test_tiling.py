@@ -0,0 +1,65 @@
+import unittest
+from unittest import mock
+import numpy as np
+import tiling
+from preprocess import PreparedImage
+from tiling import disputed, merge_detections, should_tile, tile_windows
+
+
+class TileWindowsTestCase(unittest.TestCase):
+    def test_windows_overlap_and_end_flush_with_the_image(self):
+        windows = tile_windows(2500, 900, size=1024, overlap=0.2)
+        xs = sorted({(x1, x2) for x1, _, x2, _ in windows})
+        self.assertEqual(xs[0][0], 0)
+        self.assertEqual(xs[-1][1], 2500)
+        for (_, end), (start, _) in zip(xs, xs[1:]):
+            self.assertLess(start, end)
+        self.assertTrue(all(y1 == 0 and y2 == 900 for _, y1, _, y2 in windows))
+
+    def test_small_image_is_one_window(self):
+        self.assertEqual(tile_windows(800, 600, size=1024), [(0, 0, 800, 600)])
+
+    def test_auto_mode_tiles_wide_or_very_large_images(self):
+        with mock.patch.object(tiling, "TILE_MODE", "auto"):
+            self.assertTrue(should_tile(PreparedImage(np.zeros((500, 1200, 3), np.uint8))))
+            self.assertFalse(should_tile(PreparedImage(np.zeros((600, 800, 3), np.uint8))))
+            self.assertFalse(should_tile(PreparedImage(np.zeros((500, 1200, 3), np.uint8)), requested=False))
+
+
+class MergeDetectionsTestCase(unittest.TestCase):
+    def test_package_seen_by_two_tiles_is_kept_once(self):
+        # The same package found by neighbouring tiles, boxes shifted by a few pixels.
+        left = (900, 100, 1100, 300, 0, 0.9)
+        right = (905, 102, 1104, 298, 0, 0.8)
+        self.assertEqual(merge_detections([right, left]), [left])
+
+    def test_half_package_cut_at_a_seam_is_dropped(self):
+        whole = (900, 100, 1100, 300, 0, 0.9)
+        half = (1024, 100, 1100, 300, 0, 0.6)
+        self.assertEqual(merge_detections([whole, half]), [whole])
+
+    def test_overlapping_boxes_of_different_classes_merge_into_a_disputed_box(self):
+        genuine = (100, 100, 200, 200, 0, 0.9)
+        counterfeit = (102, 100, 202, 200, 1, 0.7)
+        merged = merge_detections([counterfeit, genuine])
+        self.assertEqual(merged, [(*genuine, True)])
+        self.assertTrue(disputed(merged[0]))
+
+    def test_half_package_with_the_other_label_is_dropped_and_disputes(self):
+        whole = (900, 100, 1100, 300, 1, 0.9)
+        half = (1024, 100, 1100, 300, 0, 0.6)
+        self.assertEqual(merge_detections([whole, half]), [(*whole, True)])
+
+    def test_agreeing_boxes_are_not_disputed(self):
+        left = (900, 100, 1100, 300, 0, 0.9)
+        right = (905, 102, 1104, 298, 0, 0.8)
+        self.assertFalse(disputed(merge_detections([left, right])[0]))
+
+    def test_separate_packages_survive_in_confidence_order(self):
+        boxes = [(0, 0, 100, 100, 0, 0.5), (300, 0, 400, 100, 0, 0.95), (600, 0, 700, 100, 0, 0.7)]
+        self.assertEqual(merge_detections(boxes), [boxes[1], boxes[2], boxes[0]])
+        self.assertEqual(merge_detections([]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import cv2
+import numpy as np
+import video
+from video import Tracker, sample_frames, video_length
+
+
+def crop_for(box):
+    return box
+
+
+class TrackerTestCase(unittest.TestCase):
+    def test_moving_package_keeps_its_id(self):
+        tracker = Tracker()
+        for step in range(6):
+            x = 40 * step
+            tracker.update([(x, 50, x + 100, 150, 0, 0.8)], step * 0.5, crop_for)
+        tracks = tracker.tracks()
+        self.assertEqual([track.id for track in tracks], [1])
+        self.assertEqual(tracks[0].hits, 6)
+        self.assertEqual((tracks[0].first_seen, tracks[0].last_seen), (0.0, 2.5))
+
+    def test_velocity_carries_a_track_across_a_skipped_frame(self):
+        tracker = Tracker()
+        tracker.update([(0, 0, 100, 100, 0, 0.8)], 0.0, crop_for)
+        tracker.update([(30, 0, 130, 100, 0, 0.8)], 0.5, crop_for)
+        # 60 px further on: too little raw overlap, but it is where the track was heading.
+        tracker.update([(90, 0, 190, 100, 0, 0.8)], 1.5, crop_for)
+        self.assertEqual([track.id for track in tracker.tracks()], [1])
+
+    def test_two_packages_get_two_ids(self):
+        tracker = Tracker()
+        for step in range(3):
+            tracker.update([(0, 0, 100, 100, 0, 0.9), (400, 0, 500, 100, 1, 0.7)], step * 0.5, crop_for)
+        tracks = tracker.tracks()
+        self.assertEqual([track.id for track in tracks], [1, 2])
+        self.assertEqual([track.summary()[1] for track in tracks], [0, 1])
+
+    def test_lost_track_finishes_and_a_return_is_a_new_id(self):
+        tracker = Tracker()
+        box = (0, 0, 100, 100, 0, 0.9)
+        tracker.update([box], 0.0, crop_for)
+        for step in range(1, 6):
+            tracker.update([], step * 0.5, crop_for)
+        tracker.update([box], 3.0, crop_for)
+        self.assertEqual([track.id for track in tracker.finished], [1])
+        self.assertEqual([track.id for track in tracker.active], [2])
+
+    def test_summary_votes_by_confidence_and_keeps_the_best_sighting(self):
+        tracker = Tracker()
+        tracker.update([(0, 0, 100, 100, 1, 0.4)], 0.0, crop_for)
+        tracker.update([(0, 0, 100, 100, 0, 0.9)], 0.5, crop_for)
+        tracker.update([(0, 0, 100, 100, 1, 0.3)], 1.0, crop_for)
+        box, yolo_class, confidence = tracker.tracks()[0].summary()
+        self.assertEqual(yolo_class, 0)
+        self.assertEqual(box[5], 0.9)
+        self.assertAlmostEqual(confidence, 0.9)
+
+
+def write_video(test, frames=25, fps=10):
+    fd, path = tempfile.mkstemp(suffix=".avi")
+    os.close(fd)
+    test.addCleanup(os.unlink, path)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (64, 48))
+    for i in range(frames):
+        writer.write(np.full((48, 64, 3), i * 10 % 256, np.uint8))
+    writer.release()
+    return path
+
+
+def drain(frames):
+    """(sampled seconds, generator return value)."""
+    seconds = []
+    while True:
+        try:
+            seconds.append(next(frames)[0])
+        except StopIteration as stop:
+            return seconds, stop.value
+
+
+class VideoLengthTestCase(unittest.TestCase):
+    def test_reads_frames_and_seconds_from_the_header(self):
+        self.assertEqual(video_length(write_video(self)), (25, 2.5))
+
+    def test_unreadable_file_raises(self):
+        with tempfile.NamedTemporaryFile(suffix=".mp4") as f:
+            f.write(b"not a video")
+            f.flush()
+            with self.assertRaises(ValueError):
+                video_length(f.name)
+
+
+class SampleFramesTestCase(unittest.TestCase):
+    def test_whole_video_is_sampled_within_the_limit(self):
+        seconds, truncated_at = drain(sample_frames(write_video(self)))
+        self.assertEqual(seconds[-1], 2.0)
+        self.assertIsNone(truncated_at)
+
+    def test_sampling_stops_at_the_limit_and_reports_it(self):
+        with mock.patch.object(video, "MAX_VIDEO_SECONDS", 1.0):
+            seconds, truncated_at = drain(sample_frames(write_video(self)))
+        self.assertEqual(seconds[-1], 1.0)
+        self.assertEqual(truncated_at, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
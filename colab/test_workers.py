@@ -0,0 +1,113 @@
+import functools
+import os
+import time
+import unittest
+from workers import WorkerPool
+
+# Set in each worker by the load it was forked from.
+model_tag = None
+
+
+def handle(payload):
+    kind, value = payload
+    if kind == "crash":
+        os._exit(3)
+    if kind == "sleep":
+        time.sleep(value)
+    if kind == "fail":
+        raise ValueError(value)
+    return os.getpid(), model_tag, value
+
+
+def use_tag(tag):
+    global model_tag
+    model_tag = tag
+
+
+def load(tag):
+    if tag == "unloadable":
+        raise ValueError("model files are corrupt")
+    if tag == "crashes":
+        return functools.partial(os._exit, 4)
+    return functools.partial(use_tag, tag)
+
+
+class WorkerPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(handle, 2, handler_threads=1)
+        self.pool.start(functools.partial(load, "v1"), warmup=("echo", None))
+        self.addCleanup(self.pool.stop)
+
+    def pids(self):
+        return sorted(worker.process.pid for worker in self.pool._workers)
+
+    def wait_for(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("condition not met in time")
+            time.sleep(0.05)
+
+    def test_jobs_run_in_the_workers_and_spread_across_them(self):
+        futures = [self.pool.submit(("sleep", 0.2)) for _ in range(2)]
+        results = [future.result(5) for future in futures]
+        self.assertEqual(sorted(pid for pid, _, _ in results), self.pids())
+        self.assertNotIn(os.getpid(), self.pids())
+        self.assertEqual({tag for _, tag, _ in results}, {"v1"})
+
+    def test_workers_are_not_forked_from_the_server(self):
+        for pid in self.pids():
+            with open(f"/proc/{pid}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+            self.assertEqual(parent, self.pool._zygote.pid)
+
+    def test_handler_errors_come_back_as_exceptions(self):
+        with self.assertRaisesRegex(RuntimeError, "bad payload"):
+            self.pool.submit(("fail", "bad payload")).result(5)
+        self.assertEqual(self.pool.submit(("echo", 1)).result(5)[2], 1)
+
+    def test_crashed_worker_fails_its_jobs_and_is_replaced(self):
+        before = self.pids()
+        with self.assertRaisesRegex(RuntimeError, "exited"):
+            self.pool.submit(("crash", None)).result(5)
+        self.wait_for(lambda: self.pids() != before and all(w.process.is_alive() for w in self.pool._workers))
+        self.assertEqual(len(self.pool._workers), 2)
+        self.assertEqual(self.pool.submit(("echo", 2)).result(5)[1:], ("v1", 2))
+
+    def test_replace_models_swaps_workers_and_drains_the_old_ones(self):
+        old = self.pool._workers
+        slow = self.pool.submit(("sleep", 0.3))
+        self.pool.replace_models(functools.partial(load, "v2"), warmup=("echo", None))
+        self.assertTrue(set(self.pids()).isdisjoint(w.process.pid for w in old))
+        # A job the old worker already held still completes, on the old models.
+        self.assertEqual(slow.result(5)[1], "v1")
+        self.assertEqual(self.pool.submit(("echo", 3)).result(5)[1], "v2")
+        self.wait_for(lambda: not any(w.process.is_alive() for w in old))
+
+    def test_failed_replacement_keeps_the_old_workers_and_models(self):
+        before = self.pids()
+        with self.assertRaisesRegex(RuntimeError, "corrupt"):
+            self.pool.replace_models(functools.partial(load, "unloadable"), warmup=("echo", None))
+        with self.assertRaises(RuntimeError):
+            self.pool.replace_models(functools.partial(load, "crashes"), warmup=("echo", None))
+        self.assertEqual(self.pids(), before)
+        self.assertEqual(self.pool.submit(("echo", 4)).result(5)[1], "v1")
+
+        # Replacements after a crash still come from the models that are serving.
+        self.pool.submit(("crash", None))
+        self.wait_for(lambda: self.pids() != before and all(w.process.is_alive() for w in self.pool._workers))
+        self.assertEqual({self.pool.submit(("sleep", 0.1)).result(5)[1] for _ in range(4)}, {"v1"})
+
+    def test_stop_does_not_respawn_and_refuses_new_jobs(self):
+        workers = list(self.pool._workers)
+        self.pool.stop()
+        time.sleep(0.5)
+        self.assertFalse(any(w.process.is_alive() for w in workers))
+        self.assertEqual([w.process.pid for w in self.pool._workers], [w.process.pid for w in workers])
+        self.assertFalse(self.pool._zygote.is_alive())
+        with self.assertRaisesRegex(RuntimeError, "shutting down"):
+            self.pool.submit(("echo", 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
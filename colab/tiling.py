@@ -0,0 +1,82 @@
+import os
+import numpy as np
+
+TILE_MODE = os.getenv("TILE_MODE", "off")
+TILE_SIZE = int(os.getenv("TILE_SIZE", "1024"))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.2"))
+TILE_IOU = 0.5
+TILE_IOS = 0.8
+
+
+def should_tile(image, requested=None):
+    if requested is not None:
+        return requested
+    if TILE_MODE == "on":
+        return True
+    if TILE_MODE != "auto":
+        return False
+    h, w = image.source.shape[:2]
+    return max(w, h) / min(w, h) >= 2 or max(w, h) >= 2 * TILE_SIZE
+
+
+def tile_windows(width, height, size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Overlapping (x1, y1, x2, y2) windows covering the image, flush with its edges."""
+
+    def starts(length):
+        if length <= size:
+            return [0]
+        step = max(1, int(size * (1 - overlap)))
+        positions = list(range(0, length - size, step))
+        return positions + [length - size]
+
+    return [(x, y, min(x + size, width), min(y + size, height)) for y in starts(height) for x in starts(width)]
+
+
+def _overlap(box, others):
+    x1 = np.maximum(box[0], others[:, 0])
+    y1 = np.maximum(box[1], others[:, 1])
+    x2 = np.minimum(box[2], others[:, 2])
+    y2 = np.minimum(box[3], others[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    other_areas = (others[:, 2] - others[:, 0]) * (others[:, 3] - others[:, 1])
+    iou = inter / np.maximum(area + other_areas - inter, 1e-9)
+    ios = inter / np.maximum(np.minimum(area, other_areas), 1e-9)
+    return iou, ios
+
+
+def disputed(box):
+    """True for a merged box that overlapped a box of another class."""
+    return len(box) > 6 and box[6]
+
+
+def merge_detections(boxes, iou_threshold=TILE_IOU, ios_threshold=TILE_IOS):
+    """Greedy NMS across tiles and classes.
+
+    Besides IoU, a box mostly contained in a stronger one (intersection over the smaller
+    area) is dropped, which removes packages cut in half at a tile border. The class is
+    the verdict, so overlapping boxes are one package whatever their label: the strongest
+    is kept, and if a suppressed box disagreed with its class it comes back with a 7th
+    element True (see disputed).
+    """
+    if not boxes:
+        return []
+    order = sorted(range(len(boxes)), key=lambda i: -boxes[i][5])
+    coords = np.array([boxes[i][:4] for i in order], dtype=np.float64)
+    classes = np.array([boxes[i][4] for i in order])
+    keep = []
+    suppressed = np.zeros(len(order), dtype=bool)
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        box = boxes[order[i]]
+        rest = np.arange(i + 1, len(order))
+        rest = rest[~suppressed[rest]]
+        if len(rest):
+            iou, ios = _overlap(coords[i], coords[rest])
+            merged = rest[(iou > iou_threshold) | (ios > ios_threshold)]
+            suppressed[merged] = True
+            if np.any(classes[merged] != classes[i]):
+                box = (*box[:6], True)
+        keep.append(box)
+    return keep
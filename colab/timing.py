@@ -0,0 +1,29 @@
+import time
+from contextlib import contextmanager
+
+
+@contextmanager
+def timed(timings, stage):
+    """Add the wall time of the block to timings[stage] (seconds). No-op when timings is None."""
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def server_timing(timings):
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+def parse_server_timing(header):
+    timings = {}
+    for entry in (header or "").split(","):
+        parts = [part.strip() for part in entry.split(";")]
+        for part in parts[1:]:
+            if part.startswith("dur="):
+                timings[parts[0]] = float(part[4:]) / 1000.0
+    return timings
@@ -0,0 +1,157 @@
+import os
+import cv2
+import numpy as np
+
+VIDEO_MAX_FPS = float(os.getenv("VIDEO_MAX_FPS", "2"))
+VIDEO_MIN_FPS = float(os.getenv("VIDEO_MIN_FPS", "0.5"))
+VIDEO_CHANGE_THRESHOLD = float(os.getenv("VIDEO_CHANGE_THRESHOLD", "6"))
+MAX_VIDEO_SECONDS = float(os.getenv("MAX_VIDEO_SECONDS", "60"))
+VIDEO_MIN_HITS = int(os.getenv("VIDEO_MIN_HITS", "1"))
+TRACK_IOU = 0.3
+TRACK_MAX_MISSES = 3
+
+
+def _thumbnail(frame):
+    return cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (64, 36), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def video_length(path):
+    """(frames, seconds) from the container header, without decoding; (0, 0.0) when it has no frame count."""
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            raise ValueError("Unreadable video")
+        frames = max(0, int(capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        return frames, frames / fps
+    finally:
+        capture.release()
+
+
+def sample_frames(path):
+    """Yield (seconds, frame) at most VIDEO_MAX_FPS times per second of video.
+
+    Candidate frames that barely differ from the last sampled one are skipped until
+    1 / VIDEO_MIN_FPS seconds have passed, so a static shot costs almost nothing.
+    Frames between candidates are only grabbed, never converted.
+
+    The server refuses videos whose header reports more than MAX_VIDEO_SECONDS; if the
+    header understated the length, sampling stops there and the generator returns the
+    cut-off time, otherwise None.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError("Unreadable video")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    step = max(1, round(fps / VIDEO_MAX_FPS))
+    max_gap = 1 / VIDEO_MIN_FPS if VIDEO_MIN_FPS > 0 else float("inf")
+    last_thumb = None
+    last_time = None
+    index = 0
+    try:
+        while capture.grab():
+            if index / fps > MAX_VIDEO_SECONDS:
+                return MAX_VIDEO_SECONDS
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    seconds = index / fps
+                    thumb = _thumbnail(frame)
+                    changed = last_thumb is None or np.abs(thumb - last_thumb).mean() >= VIDEO_CHANGE_THRESHOLD
+                    if changed or seconds - last_time >= max_gap:
+                        last_thumb, last_time = thumb, seconds
+                        yield seconds, frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    def __init__(self, track_id, box, seconds):
+        self.id = track_id
+        self.box = box
+        self.velocity = (0.0, 0.0)
+        self.first_seen = self.last_seen = seconds
+        self.hits = 0
+        self.misses = 0
+        self.votes = {}
+        self.best = None
+
+    def predicted(self, seconds):
+        dt = seconds - self.last_seen
+        dx, dy = self.velocity[0] * dt, self.velocity[1] * dt
+        x1, y1, x2, y2 = self.box[:4]
+        return (x1 + dx, y1 + dy, x2 + dx, y2 + dy)
+
+    def update(self, box, seconds, crop_for):
+        dt = seconds - self.last_seen
+        if self.hits and dt > 0:
+            self.velocity = ((box[0] - self.box[0]) / dt, (box[1] - self.box[1]) / dt)
+        self.box = box
+        self.last_seen = seconds
+        self.hits += 1
+        self.misses = 0
+        yolo_class, yolo_conf = box[4], box[5]
+        self.votes.setdefault(yolo_class, []).append(yolo_conf)
+        # Keep the sharpest view for the CNN: the most confident, then largest, sighting.
+        area = (box[2] - box[0]) * (box[3] - box[1])
+        if self.best is None or (yolo_conf, area) > self.best[0]:
+            self.best = ((yolo_conf, area), box, seconds, crop_for(box))
+
+    def summary(self):
+        """Confidence-weighted YOLO vote over all sightings: (box, yolo_class, mean confidence)."""
+        yolo_class = max(self.votes, key=lambda c: sum(self.votes[c]))
+        confidences = self.votes[yolo_class]
+        return self.best[1], yolo_class, sum(confidences) / len(confidences)
+
+
+class Tracker:
+    """Greedy IoU tracker with constant-velocity prediction between sampled frames."""
+
+    def __init__(self):
+        self.active = []
+        self.finished = []
+        self._next_id = 1
+
+    def update(self, boxes, seconds, crop_for):
+        pairs = sorted(
+            ((iou(track.predicted(seconds), box), t, b) for t, track in enumerate(self.active) for b, box in enumerate(boxes)),
+            reverse=True,
+        )
+        matched_tracks, matched_boxes = set(), set()
+        for overlap, t, b in pairs:
+            if overlap < TRACK_IOU:
+                break
+            if t in matched_tracks or b in matched_boxes:
+                continue
+            self.active[t].update(boxes[b], seconds, crop_for)
+            matched_tracks.add(t)
+            matched_boxes.add(b)
+
+        still_active = []
+        for t, track in enumerate(self.active):
+            if t not in matched_tracks:
+                track.misses += 1
+            if track.misses > TRACK_MAX_MISSES:
+                self.finished.append(track)
+            else:
+                still_active.append(track)
+        self.active = still_active
+
+        for b, box in enumerate(boxes):
+            if b not in matched_boxes:
+                track = Track(self._next_id, box, seconds)
+                track.update(box, seconds, crop_for)
+                self._next_id += 1
+                self.active.append(track)
+
+    def tracks(self):
+        return sorted(self.finished + self.active, key=lambda track: track.id)
@@ -0,0 +1,400 @@
+import os
+import sys
+import time
+import signal
+import itertools
+import threading
+import traceback
+import multiprocessing
+from multiprocessing import reduction
+from multiprocessing.connection import Connection, wait
+from concurrent.futures import Future
+
+
+def thread_budget(workers):
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def set_thread_budget(threads):
+    """Cap intra-op threads for whichever frameworks this process uses."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"):
+        os.environ[var] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+
+    import backends
+    backends.ORT_THREADS = threads
+
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    if "tensorflow" in sys.modules:
+        tf = sys.modules["tensorflow"]
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        except RuntimeError:
+            # TF refuses once its runtime is up; the env vars above already applied.
+            pass
+    import cv2
+    cv2.setNumThreads(threads)
+
+
+def _worker_main(handler, prepare, conn, threads, handler_threads):
+    set_thread_budget(threads)
+    prepare()
+
+    recv_lock = threading.Lock()
+    send_lock = threading.Lock()
+
+    def serve():
+        while True:
+            with recv_lock:
+                try:
+                    job = conn.recv()
+                except EOFError:
+                    return
+            if job is None:
+                return
+            job_id, payload = job
+            try:
+                reply = (job_id, handler(payload), None)
+            except Exception as e:
+                reply = (job_id, None, str(e))
+            with send_lock:
+                conn.send(reply)
+
+    runners = [threading.Thread(target=serve, daemon=True) for _ in range(handler_threads)]
+    for runner in runners:
+        runner.start()
+    for runner in runners:
+        runner.join()
+
+
+def _zygote_main(handler, control, threads, handler_threads):
+    """Load model sets on request and fork workers from them.
+
+    The zygote is spawned fresh, so it never holds the server's threads or locks, and every
+    worker forked from one loaded set shares its weights copy-on-write.
+    """
+    set_thread_budget(threads)
+    prepared = {}
+    while True:
+        if control.poll(0.2):
+            try:
+                command = control.recv()
+            except EOFError:
+                return
+            if command is None:
+                return
+            kind, generation, load = command
+            if kind == "load":
+                try:
+                    prepared[generation] = load()
+                    control.send(None)
+                except Exception as e:
+                    traceback.print_exc()
+                    control.send(f"{type(e).__name__}: {e}")
+            elif kind == "spawn":
+                _fork_worker(handler, prepared[generation], control, threads, handler_threads)
+            elif kind == "drop":
+                prepared.pop(generation, None)
+        # Workers are our children; reap them so their pids disappear once they exit.
+        try:
+            while os.waitpid(-1, os.WNOHANG)[0]:
+                pass
+        except ChildProcessError:
+            pass
+
+
+def _fork_worker(handler, prepare, control, threads, handler_threads):
+    parent_conn, child_conn = multiprocessing.Pipe()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            control.close()
+            parent_conn.close()
+            _worker_main(handler, prepare, child_conn, threads, handler_threads)
+            code = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+    child_conn.close()
+    reduction.send_handle(control, parent_conn.fileno(), None)
+    parent_conn.close()
+    control.send(pid)
+
+
+class _ForkedProcess:
+    """A worker forked by the zygote. It is not our child, so liveness comes from its pid."""
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def is_alive(self):
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def join(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.is_alive() and (deadline is None or time.monotonic() < deadline):
+            time.sleep(0.05)
+
+    def terminate(self):
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.pending = set()
+        self.retired = False
+
+
+class WorkerPool:
+    """Inference worker processes that share one loaded copy of the models.
+
+    The models are loaded by a zygote process spawned at start, and every worker, including
+    replacements after a crash or a reload, is forked from it rather than from the server.
+    A load is a picklable callable run in the zygote; it returns the setup each worker forked
+    from that load runs before serving. Each worker has its own pipe, so a crashed worker only
+    fails the jobs it was holding.
+    """
+
+    def __init__(self, handler, workers, handler_threads=2):
+        self.handler = handler
+        self.size = workers
+        self.handler_threads = handler_threads
+        self.threads = thread_budget(workers)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._zygote = None
+        self._control = None
+        self._control_lock = threading.Lock()
+        self._generations = itertools.count()
+        self._generation = None
+        self._futures = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._standby = []
+        self._draining = []
+        self._running = False
+        self._stopping = False
+
+    def start(self, load, warmup=None):
+        """Load the models and fork the workers; with a warmup payload, return only once every worker has run it."""
+        self._control, child_control = self._ctx.Pipe()
+        self._zygote = self._ctx.Process(
+            target=_zygote_main,
+            args=(self.handler, child_control, self.threads, self.handler_threads),
+            name="vision-zygote",
+            daemon=True,
+        )
+        self._zygote.start()
+        child_control.close()
+
+        self._generation = self._load(load)
+        self._running = True
+        threading.Thread(target=self._collect, name="worker-results", daemon=True).start()
+        self._workers = self._start_standby(self._generation, warmup)
+        print(f"Started {self.size} vision workers with {self.threads} threads each")
+
+    def _command(self, kind, generation, load=None):
+        with self._control_lock:
+            try:
+                self._control.send((kind, generation, load))
+                if kind == "load":
+                    return self._control.recv()
+                if kind == "spawn":
+                    fd = reduction.recv_handle(self._control)
+                    return Connection(fd), self._control.recv()
+            except (EOFError, OSError) as e:
+                raise RuntimeError(f"Vision worker zygote is gone: {e}")
+
+    def _load(self, load):
+        generation = next(self._generations)
+        error = self._command("load", generation, load)
+        if error is not None:
+            raise RuntimeError(f"Vision workers could not load the models: {error}")
+        return generation
+
+    def _drop(self, generation):
+        try:
+            self._command("drop", generation)
+        except RuntimeError:
+            pass
+
+    def _start_standby(self, generation, warmup):
+        with self._lock:
+            standby = [self._spawn(generation) for _ in range(self.size)]
+            self._standby.extend(standby)
+        try:
+            if warmup is not None:
+                for future in [self._send(worker, warmup) for worker in standby]:
+                    future.result()
+        except Exception:
+            self._retire(standby)
+            raise
+        finally:
+            with self._lock:
+                self._standby = [worker for worker in self._standby if worker not in standby]
+        return standby
+
+    def _spawn(self, generation):
+        conn, pid = self._command("spawn", generation)
+        return _Worker(_ForkedProcess(pid), conn)
+
+    def replace_models(self, load, warmup=None):
+        """Load new models in the zygote, fork and warm a fresh set of workers, then drain the old ones.
+
+        Old workers keep taking jobs until the new ones are warm, then finish what they hold and exit.
+        If loading or warmup fails, the new workers are retired and the old ones stay active.
+        """
+        generation = self._load(load)
+        try:
+            standby = self._start_standby(generation, warmup)
+        except Exception:
+            self._drop(generation)
+            raise
+        with self._lock:
+            old, old_generation = self._workers, self._generation
+            self._workers, self._generation = standby, generation
+        self._retire(old)
+        self._drop(old_generation)
+        print(f"Replaced {len(old)} vision workers; old workers drain in the background")
+
+    def _retire(self, workers):
+        with self._lock:
+            self._draining.extend(workers)
+        for worker in workers:
+            with worker.send_lock:
+                worker.retired = True
+                try:
+                    for _ in range(self.handler_threads):
+                        worker.conn.send(None)
+                except OSError:
+                    pass
+
+    def submit(self, payload):
+        while True:
+            with self._lock:
+                if self._stopping:
+                    raise RuntimeError("Vision workers are shutting down")
+                worker = min(self._workers, key=lambda w: len(w.pending))
+            future = self._send(worker, payload)
+            # None means we lost a race with replace_models: the worker already got its stop signal.
+            if future is not None:
+                return future
+
+    def _send(self, worker, payload):
+        future = Future()
+        job_id = next(self._ids)
+        with worker.send_lock:
+            if worker.retired:
+                return None
+            with self._lock:
+                worker.pending.add(job_id)
+                self._futures[job_id] = future
+            try:
+                worker.conn.send((job_id, payload))
+            except OSError:
+                with self._lock:
+                    worker.pending.discard(job_id)
+                    self._futures.pop(job_id, None)
+                future.set_exception(RuntimeError("Vision worker exited before taking the job"))
+        return future
+
+    def _collect(self):
+        while self._running:
+            with self._lock:
+                conns = {worker.conn: worker for worker in self._workers + self._standby + self._draining if not worker.conn.closed}
+            for conn in wait(list(conns), timeout=0.2):
+                self._receive(conns[conn])
+            self._replace_dead()
+
+    def _receive(self, worker):
+        try:
+            job_id, result, error = worker.conn.recv()
+        except (EOFError, OSError):
+            return False
+        with self._lock:
+            worker.pending.discard(job_id)
+            future = self._futures.pop(job_id, None)
+        if future is not None:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(error))
+        return True
+
+    def _replace_dead(self):
+        for worker in [worker for worker in self._draining + self._standby if not worker.process.is_alive()]:
+            # Replies sent just before exit are still in the pipe.
+            while worker.pending and worker.conn.poll() and self._receive(worker):
+                pass
+            with self._lock:
+                for job_id in worker.pending:
+                    future = self._futures.pop(job_id, None)
+                    if future is not None:
+                        future.set_exception(RuntimeError("Vision worker exited during inference"))
+                worker.pending.clear()
+                if worker in self._draining:
+                    worker.conn.close()
+                    self._draining.remove(worker)
+
+        with self._lock:
+            if self._stopping:
+                return
+            for i, worker in enumerate(self._workers):
+                if worker.process.is_alive():
+                    continue
+                if not worker.conn.closed:
+                    print(f"Vision worker {worker.process.pid} exited, restarting")
+                    for job_id in worker.pending:
+                        future = self._futures.pop(job_id, None)
+                        if future is not None:
+                            future.set_exception(RuntimeError("Vision worker exited during inference"))
+                    worker.pending.clear()
+                    worker.conn.close()
+                try:
+                    self._workers[i] = self._spawn(self._generation)
+                except RuntimeError as e:
+                    # The dead worker stays in place and is retried on the next pass.
+                    print(f"Could not restart vision worker: {e}")
+
+    def stop(self):
+        """Stop every worker without respawning; safe to call more than once (it runs at exit)."""
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+            workers = self._workers + self._standby
+        self._retire(workers)
+        self._running = False
+        for worker in workers + self._draining:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        with self._lock:
+            for future in self._futures.values():
+                future.set_exception(RuntimeError("Vision workers shut down"))
+            self._futures.clear()
+        if self._zygote is not None:
+            with self._control_lock:
+                try:
+                    self._control.send(None)
+                except OSError:
+                    pass
+            self._zygote.join(timeout=5)
+            if self._zygote.is_alive():
+                self._zygote.terminate()
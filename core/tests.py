@@ -2,6 +2,7 @@ from django.test import TestCase
 from django.utils import timezone
 from datetime import timedelta
 from core.models import User, MedicineLot, DistributionEvent
+from vision.models import VisionInspection
 
 
 class MedicineTrackingTestCase(TestCase):
@@ -88,3 +89,53 @@ class MedicineTrackingTestCase(TestCase):
                 total_quantity=2000,
                 remaining_quantity=2000
             )
+
+
+class LotListingTestCase(TestCase):
+    def setUp(self):
+        self.producer = User.objects.create_user(username="pharma_co", password="test123", role="MANUFACTURER")
+
+    def create_lots(self, count):
+        start = MedicineLot.objects.count()
+        for i in range(start, start + count):
+            lot = MedicineLot.objects.create(
+                product_name=f"Med {i}",
+                product_code=f"MED{i}",
+                lot_number=f"LOT{i:04d}",
+                producer=self.producer,
+                manufacture_date=timezone.now().date(),
+                expiry_date=timezone.now().date() + timedelta(days=365),
+                total_quantity=100,
+                remaining_quantity=100
+            )
+            for status in ("PENDING", "APPROVED", "APPROVED"):
+                VisionInspection.objects.create(lot=lot, result="GENUINE", status=status, confidence=0.9, hash="0" * 64)
+
+    def test_query_count_does_not_grow_with_lots(self):
+        self.create_lots(2)
+        with self.assertNumQueries(1):
+            self.client.get("/api/lots/")
+
+        self.create_lots(8)
+        with self.assertNumQueries(1):
+            lots = self.client.get("/api/lots/").json()["lots"]
+
+        self.assertEqual(len(lots), 10)
+        self.assertEqual((lots[0]["pending_count"], lots[0]["approved_count"]), (1, 2))
+        self.assertEqual(lots[0]["verification_status"], "PENDING")
+        self.assertEqual(lots[0]["producer"], "pharma_co")
+
+    def test_cursor_pages_cover_every_lot_once(self):
+        self.create_lots(5)
+        seen = []
+        cursor = ""
+        while True:
+            body = self.client.get("/api/lots/", {"limit": 2, "cursor": cursor}).json()
+            seen.extend(lot["lot_number"] for lot in body["lots"])
+            if not body["next_cursor"]:
+                break
+            cursor = body["next_cursor"]
+
+        self.assertEqual(sorted(seen), [f"LOT{i:04d}" for i in range(5)])
+        self.assertEqual(self.client.get("/api/lots/", {"unverified": "true"}).json()["lots"], [])
+        self.assertEqual(self.client.get("/api/lots/", {"cursor": "bogus"}).status_code, 400)
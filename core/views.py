@@ -2,7 +2,11 @@ from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth import login as auth_login, logout as auth_logout
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Q
 from functools import wraps
+from datetime import datetime
+import base64
 import json
 import qrcode
 from io import BytesIO
@@ -10,6 +14,19 @@ from .models import MedicineLot, DistributionEvent, User, AuditLog
 from .utils import log_action, generate_audit_pdf
 
 
+LOTS_PAGE_SIZE = 100
+LOTS_MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(lot):
+    return base64.urlsafe_b64encode(json.dumps([lot.created_at.isoformat(), str(lot.id)]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    created_at, lot_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(created_at), lot_id
+
+
 def require_role(*allowed_roles):
     def decorator(view_func):
         @wraps(view_func)
@@ -101,14 +118,28 @@ def lots(request):
         if request.GET.get("unverified") == "true":
             qs = qs.filter(vision_inspections__isnull=True)
 
+        try:
+            limit = min(max(1, int(request.GET.get("limit", LOTS_PAGE_SIZE))), LOTS_MAX_PAGE_SIZE)
+            cursor = request.GET.get("cursor")
+            if cursor:
+                created_at, lot_id = decode_cursor(cursor)
+                qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=lot_id))
+        except (ValueError, TypeError, ValidationError):
+            return JsonResponse({"error": "Invalid limit or cursor"}, status=400)
+
+        # One query per page: producer joined, verification counts aggregated, and an
+        # (created_at, id) keyset so pages stay stable while lots are being added.
+        qs = qs.select_related("producer").annotate(
+            pending_count=Count("vision_inspections", filter=Q(vision_inspections__status="PENDING")),
+            approved_count=Count("vision_inspections", filter=Q(vision_inspections__status="APPROVED")),
+        ).order_by("-created_at", "-id")
+        page = list(qs[:limit + 1])
+
         data = []
-        for lot in qs:
-            # Calculate verification status
-            pending_count = lot.vision_inspections.filter(status="PENDING").count()
-            approved_count = lot.vision_inspections.filter(status="APPROVED").count()
-            if pending_count > 0:
+        for lot in page[:limit]:
+            if lot.pending_count > 0:
                 verification_status = "PENDING"
-            elif approved_count > 0:
+            elif lot.approved_count > 0:
                 verification_status = "APPROVED"
             else:
                 verification_status = "NONE"
@@ -125,10 +156,11 @@ def lots(request):
                 "remaining_quantity": lot.remaining_quantity,
                 "blockchain_txid": lot.blockchain_txid,
                 "verification_status": verification_status,
-                "pending_count": pending_count,
-                "approved_count": approved_count,
+                "pending_count": lot.pending_count,
+                "approved_count": lot.approved_count,
             })
-        return JsonResponse({"lots": data})
+        next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+        return JsonResponse({"lots": data, "next_cursor": next_cursor})
 
     elif request.method == "POST":
         if not request.user.is_authenticated:
@@ -1,7 +1,8 @@
 "use client";
 import { Truck, TrendingUp, Package, X } from "lucide-react";
 import { useEffect, useState } from "react";
-import { getDistributionEvents, getLots, createDistribution, type DistributionEvent, type Lot } from "@/lib/api";
+import { getDistributionEvents, getLots, createDistribution, type DistributionEvent } from "@/lib/api";
+import { useLotPages } from "@/hooks/useLotPages";
 
 function timeAgo(timestamp: string): string {
   const now = new Date();
@@ -132,7 +133,7 @@ export function DistributionCard({ refreshKey = 0 }: { refreshKey?: number }) {
 
 export function DistributionExpanded({ refreshKey = 0 }: { refreshKey?: number }) {
   const [events, setEvents] = useState<DistributionEvent[]>([]);
-  const [lots, setLots] = useState<Lot[]>([]);
+  const { lots, hasMore, loadingMore, loadMore, reload: reloadLots } = useLotPages(getLots, refreshKey);
   const [selected, setSelected] = useState<DistributionEvent | null>(null);
   const [form, setForm] = useState({ lot_id: "", quantity: "", location: "" });
   const [loading, setLoading] = useState(false);
@@ -141,7 +142,6 @@ export function DistributionExpanded({ refreshKey = 0 }: { refreshKey?: number }
 
   useEffect(() => {
     getDistributionEvents().then(setEvents).catch(() => {});
-    getLots().then(setLots).catch(() => {});
   }, [refreshKey]);
 
   const todayEvents = events.filter((e) => {
@@ -169,7 +169,7 @@ export function DistributionExpanded({ refreshKey = 0 }: { refreshKey?: number }
       setSuccess("Distribution recorded successfully");
       setForm({ lot_id: "", quantity: "", location: "" });
       getDistributionEvents().then(setEvents).catch(() => {});
-      getLots().then(setLots).catch(() => {});
+      reloadLots();
     } catch (err) {
       setError(err instanceof Error ? err.message : "Distribution failed");
     } finally {
@@ -206,6 +206,16 @@ export function DistributionExpanded({ refreshKey = 0 }: { refreshKey?: number }
                 </option>
               ))}
             </select>
+            {hasMore && (
+              <button
+                type="button"
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="text-xs text-cyan-400 hover:underline disabled:opacity-50"
+              >
+                {loadingMore ? "Loading..." : "[load more lots]"}
+              </button>
+            )}
             <input
               type="number"
               placeholder="Quantity"
@@ -3,6 +3,7 @@ import { FlaskConical, X, Download, CheckCircle2, XCircle, Loader2, Clock, Check
 import { useEffect, useState } from "react";
 import { getLots, getLotVerifications, getPendingVerifications, approveVerification, getUnlinkedVerifications, linkVerification, unlinkVerification, type Lot, type VerificationRecord, type PendingVerification, API_URL } from "@/lib/api";
 import { Link2, Link2Off } from "lucide-react";
+import { useLotPages } from "@/hooks/useLotPages";
 
 function QRModal({ lot, onClose }: { lot: Lot; onClose: () => void }) {
   const qrUrl = `${API_URL}/lots/${lot.id}/qr/`;
@@ -472,13 +473,9 @@ function LotDetailModal({ lot, onClose }: { lot: Lot; onClose: () => void }) {
 }
 
 export function LotsCard({ refreshKey = 0 }: { refreshKey?: number }) {
-  const [lots, setLots] = useState<Lot[]>([]);
+  const { lots, hasMore } = useLotPages(getLots, refreshKey);
   const [selected, setSelected] = useState<Lot | null>(null);
 
-  useEffect(() => {
-    getLots().then(setLots).catch(() => {});
-  }, [refreshKey]);
-
   const expiringSoon = lots.filter((lot) => {
     const expiry = new Date(lot.expiry_date);
     const now = new Date();
@@ -490,11 +487,11 @@ export function LotsCard({ refreshKey = 0 }: { refreshKey?: number }) {
     <div className="space-y-3 h-full">
       <div className="flex gap-4">
         <div>
-          <div className="text-2xl font-bold text-cyan-400">{lots.length}</div>
+          <div className="text-2xl font-bold text-cyan-400">{lots.length}{hasMore ? "+" : ""}</div>
           <div className="text-xs text-slate-500">Active Lots</div>
         </div>
         <div>
-          <div className="text-2xl font-bold text-amber-400">{expiringSoon}</div>
+          <div className="text-2xl font-bold text-amber-400">{expiringSoon}{hasMore ? "+" : ""}</div>
           <div className="text-xs text-slate-500">Expiring Soon</div>
         </div>
       </div>
@@ -531,15 +528,11 @@ export function LotsCard({ refreshKey = 0 }: { refreshKey?: number }) {
 }
 
 export function LotsExpanded({ refreshKey = 0 }: { refreshKey?: number }) {
-  const [lots, setLots] = useState<Lot[]>([]);
+  const { lots, hasMore, loadingMore, loadMore } = useLotPages(getLots, refreshKey);
   const [search, setSearch] = useState("");
   const [selectedQR, setSelectedQR] = useState<Lot | null>(null);
   const [selectedLot, setSelectedLot] = useState<Lot | null>(null);
 
-  useEffect(() => {
-    getLots().then(setLots).catch(() => {});
-  }, [refreshKey]);
-
   const filtered = search
     ? lots.filter((lot) =>
         lot.product_name.toLowerCase().includes(search.toLowerCase()) ||
@@ -617,6 +610,16 @@ export function LotsExpanded({ refreshKey = 0 }: { refreshKey?: number }) {
           </tbody>
         </table>
       </div>
+      {hasMore && (
+        <button
+          type="button"
+          onClick={loadMore}
+          disabled={loadingMore}
+          className="text-xs text-cyan-400 hover:underline disabled:opacity-50"
+        >
+          {loadingMore ? "Loading..." : "[load more lots]"}
+        </button>
+      )}
 
       {selectedQR && <QRModal lot={selectedQR} onClose={() => setSelectedQR(null)} />}
       {selectedLot && <LotDetailModal lot={selectedLot} onClose={() => setSelectedLot(null)} />}
@@ -2,6 +2,7 @@
 import { PlusCircle, X } from "lucide-react";
 import { useState, useEffect } from "react";
 import { createLot, getLots, type Lot, API_URL } from "@/lib/api";
+import { useLotPages } from "@/hooks/useLotPages";
 
 function LotDetailModal({ lot, onClose }: { lot: Lot; onClose: () => void }) {
   useEffect(() => {
@@ -77,18 +78,14 @@ function LotDetailModal({ lot, onClose }: { lot: Lot; onClose: () => void }) {
 }
 
 export function RegisterCard({ refreshKey = 0 }: { refreshKey?: number }) {
-  const [lots, setLots] = useState<Lot[]>([]);
+  const { lots, hasMore } = useLotPages(getLots, refreshKey);
   const [selected, setSelected] = useState<Lot | null>(null);
 
-  useEffect(() => {
-    getLots().then(setLots).catch(() => {});
-  }, [refreshKey]);
-
   return (
     <div className="space-y-3 h-full flex flex-col">
       <div className="flex justify-between items-center">
         <div className="text-sm text-slate-400">Recent registrations</div>
-        <div className="text-xs text-cyan-400">{lots.length} lots</div>
+        <div className="text-xs text-cyan-400">{lots.length}{hasMore ? "+" : ""} lots</div>
       </div>
       <div className="flex-1 overflow-y-auto space-y-1">
         {lots.slice(0, 10).map((lot) => (
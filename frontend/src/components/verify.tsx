@@ -2,8 +2,9 @@
 import { useState, useRef, useEffect } from "react";
 import { ShieldCheck, CheckCircle2, XCircle, Upload, Loader2, X } from "lucide-react";
 import { verificationStyles, type VerificationStatus } from "@/lib/styles";
-import { verifyMedicine, getVerificationStats, getVerificationsByType, getUnverifiedLots, type VerificationResult, type Detection, type VerificationStats, type VerificationRecord, type Lot } from "@/lib/api";
+import { verifyMedicine, getVerificationStats, getVerificationsByType, getUnverifiedLots, type VerificationResult, type Detection, type VerificationStats, type VerificationRecord } from "@/lib/api";
 import { useAuth } from "@/lib/auth";
+import { useLotPages } from "@/hooks/useLotPages";
 
 function CroppedImage({
   imageUrl,
@@ -93,7 +94,8 @@ function DetailModal({
     return () => window.removeEventListener("keydown", handleEscape);
   }, [imageUrl, detection.bbox, onClose]);
 
-  const labelsMatch = detection.yolo_label.toLowerCase() === detection.cnn_label.toLowerCase();
+  const labelsMatch = detection.cnn_label === null ||
+    detection.yolo_label.toLowerCase() === detection.cnn_label.toLowerCase();
   const labelColor = labelsMatch ? "text-emerald-400" : "text-red-400";
 
   const statusColor = status === "genuine" ? "text-emerald-400" :
@@ -155,10 +157,16 @@ function DetailModal({
 
               <div className="bg-slate-800/50 rounded-lg p-3">
                 <div className="text-slate-500 text-xs mb-1">CNN Classification</div>
-                <div className={`font-medium ${labelColor}`}>{detection.cnn_label}</div>
-                <div className={`text-sm ${labelColor}`}>
-                  {(detection.cnn_confidence * 100).toFixed(1)}%
-                </div>
+                {detection.cnn_label === null || detection.cnn_confidence === null ? (
+                  <div className="text-sm text-slate-400">Skipped (YOLO confident)</div>
+                ) : (
+                  <>
+                    <div className={`font-medium ${labelColor}`}>{detection.cnn_label}</div>
+                    <div className={`text-sm ${labelColor}`}>
+                      {(detection.cnn_confidence * 100).toFixed(1)}%
+                    </div>
+                  </>
+                )}
               </div>
             </div>
 
@@ -192,8 +200,9 @@ function DetectionCard({
   const borderColor = status === "genuine" ? "border-emerald-500" :
     status === "suspicious" ? "border-amber-500" : "border-red-500";
 
-  const confidenceColor = detection.cnn_confidence > 0.8 ? "text-emerald-400" :
-    detection.cnn_confidence > 0.5 ? "text-amber-400" : "text-red-400";
+  const confidence = detection.cnn_confidence ?? detection.yolo_confidence;
+  const confidenceColor = confidence > 0.8 ? "text-emerald-400" :
+    confidence > 0.5 ? "text-amber-400" : "text-red-400";
 
   return (
     <>
@@ -227,7 +236,7 @@ function DetectionCard({
 
         <div className="text-xs">
           <span className="text-slate-500">Confidence: </span>
-          <span className={confidenceColor}>{(detection.cnn_confidence * 100).toFixed(1)}%</span>
+          <span className={confidenceColor}>{(confidence * 100).toFixed(1)}%</span>
         </div>
 
         <div className="text-xs text-slate-600 mt-1.5">Click for details</div>
@@ -569,17 +578,11 @@ export function VerifyExpanded({
   setError,
 }: VerifyExpandedProps) {
   const [isLoading, setIsLoading] = useState(false);
-  const [lots, setLots] = useState<Lot[]>([]);
   const [selectedLotId, setSelectedLotId] = useState<string>("");
   const fileInputRef = useRef<HTMLInputElement>(null);
   const { user } = useAuth();
   const showLotSelector = user && !["PHARMACY", "CONSUMER"].includes(user.role);
-
-  useEffect(() => {
-    if (showLotSelector) {
-      getUnverifiedLots().then(setLots).catch(() => setLots([]));
-    }
-  }, [showLotSelector]);
+  const { lots, hasMore, loadingMore, loadMore } = useLotPages(getUnverifiedLots, 0, !!showLotSelector);
 
   const handleFileSelect = async (file: File) => {
     setIsLoading(true);
@@ -631,6 +634,16 @@ export function VerifyExpanded({
               </option>
             ))}
           </select>
+          {hasMore && (
+            <button
+              type="button"
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="text-xs text-cyan-400 hover:underline disabled:opacity-50"
+            >
+              {loadingMore ? "Loading..." : "[load more lots]"}
+            </button>
+          )}
         </div>
       )}
 
@@ -0,0 +1,48 @@
+"use client";
+import { useState, useEffect, useCallback, useRef } from "react";
+import type { Lot, LotPage } from "@/lib/api";
+
+// Loads the first page of lots, then one more page each time loadMore is called.
+export function useLotPages(fetchPage: (cursor?: string | null) => Promise<LotPage>, refreshKey = 0, enabled = true) {
+  const [lots, setLots] = useState<Lot[]>([]);
+  const [cursor, setCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  // Bumped on every reload so a page that arrives after a reload is dropped.
+  const generation = useRef(0);
+
+  const reload = useCallback(() => {
+    const current = ++generation.current;
+    setLoadingMore(false);
+    fetchPage()
+      .then((page) => {
+        if (current !== generation.current) return;
+        setLots(page.lots);
+        setCursor(page.next_cursor);
+      })
+      .catch(() => {});
+  }, [fetchPage]);
+
+  useEffect(() => {
+    if (enabled) {
+      reload();
+    }
+  }, [reload, refreshKey, enabled]);
+
+  const loadMore = useCallback(() => {
+    if (!cursor || loadingMore) return;
+    const current = generation.current;
+    setLoadingMore(true);
+    fetchPage(cursor)
+      .then((page) => {
+        if (current !== generation.current) return;
+        setLots((prev) => [...prev, ...page.lots]);
+        setCursor(page.next_cursor);
+      })
+      .catch(() => {})
+      .finally(() => {
+        if (current === generation.current) setLoadingMore(false);
+      });
+  }, [fetchPage, cursor, loadingMore]);
+
+  return { lots, hasMore: cursor !== null, loadingMore, loadMore, reload };
+}
@@ -29,9 +29,10 @@ export interface Detection {
   bbox: [number, number, number, number];
   yolo_label: string;
   yolo_confidence: number;
-  cnn_label: string;
-  cnn_confidence: number;
+  cnn_label: string | null; // null when the cascade skipped the CNN
+  cnn_confidence: number | null;
   result: string; // "GENUINE" | "SUSPICIOUS" | "COUNTERFEIT"
+  path?: "yolo" | "cnn";
 }
 
 export interface VerificationResult {
@@ -62,7 +63,38 @@ export async function verifyMedicine(image: File, lotId?: string): Promise<Verif
     throw new Error(error.error || "Verification failed");
   }
 
-  return res.json();
+  // Verification runs as a background job; poll it until it finishes.
+  // Images verified before come back already finished.
+  const job: VerificationJob = await res.json();
+  if (job.status === "SUCCEEDED" && job.result) {
+    return job.result;
+  }
+  return waitForVerification(job.job_id);
+}
+
+export interface VerificationJob {
+  job_id: string;
+  status: "QUEUED" | "RUNNING" | "SUCCEEDED" | "FAILED";
+  stage: string;
+  result: VerificationResult | null;
+  error: string | null;
+}
+
+export async function waitForVerification(jobId: string, intervalMs = 1000): Promise<VerificationResult> {
+  for (;;) {
+    const res = await fetch(`${VISION_URL}/jobs/${jobId}/`, { credentials: "include" });
+    if (!res.ok) {
+      throw new Error("Verification job not found");
+    }
+    const job: VerificationJob = await res.json();
+    if (job.status === "SUCCEEDED" && job.result) {
+      return job.result;
+    }
+    if (job.status === "FAILED") {
+      throw new Error(job.error || "Verification failed");
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
 }
 
 // Stats
@@ -132,22 +164,31 @@ export interface Lot {
   approved_count: number;
 }
 
-export async function getLots(): Promise<Lot[]> {
-  const res = await fetch(`${API_URL}/lots/`, { credentials: "include" });
-  if (!res.ok) {
-    throw new Error("Failed to fetch lots");
-  }
-  const data = await res.json();
-  return data.lots || [];
+export interface LotPage {
+  lots: Lot[];
+  next_cursor: string | null;
 }
 
-export async function getUnverifiedLots(): Promise<Lot[]> {
-  const res = await fetch(`${API_URL}/lots/?unverified=true`, { credentials: "include" });
+// /lots/ is cursor-paginated; callers ask for the next page with the returned next_cursor.
+async function fetchLotPage(query: string, cursor?: string | null): Promise<LotPage> {
+  const params = new URLSearchParams(query);
+  if (cursor) {
+    params.set("cursor", cursor);
+  }
+  const res = await fetch(`${API_URL}/lots/?${params}`, { credentials: "include" });
   if (!res.ok) {
     throw new Error("Failed to fetch lots");
   }
   const data = await res.json();
-  return data.lots || [];
+  return { lots: data.lots || [], next_cursor: data.next_cursor || null };
+}
+
+export async function getLots(cursor?: string | null): Promise<LotPage> {
+  return fetchLotPage("", cursor);
+}
+
+export async function getUnverifiedLots(cursor?: string | null): Promise<LotPage> {
+  return fetchLotPage("unverified=true", cursor);
 }
 
 export interface LotDetail extends Omit<Lot, "verification_status" | "pending_count" | "approved_count"> {
@@ -44,7 +44,10 @@ def test_verify_endpoint():
                 for idx, detection in enumerate(result['detections'], 1):
                     print(f"  Detection #{idx}:")
                     print(f"    YOLO: {detection['yolo_label']} ({detection['yolo_confidence']:.2%})")
-                    print(f"    CNN: {detection['cnn_label']} ({detection['cnn_confidence']:.2%})")
+                    if detection['cnn_label'] is None:
+                        print(f"    CNN: skipped (cascade)")
+                    else:
+                        print(f"    CNN: {detection['cnn_label']} ({detection['cnn_confidence']:.2%})")
                     print(f"    Final: {detection['result']}")
                     print(f"    BBox: {detection['bbox']}")
             else:
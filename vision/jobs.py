@@ -0,0 +1,445 @@
+import io
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image as PILImage
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .services import verify_with_colab, VisionServerBusy
+from .models import BlockchainAddress, RecordCounter, VisionInspection, VerificationJob
+from blockchain.utils import record_verification
+from core.utils import log_action
+
+JOB_WORKERS = int(os.getenv("VERIFY_JOB_WORKERS", "4"))
+CROP_THREADS = int(os.getenv("VERIFY_CROP_THREADS", "4"))
+JOB_STALE_SECONDS = 600
+JOB_QUEUED_STALE_SECONDS = 3600
+# Each process stamps heartbeat_at on the jobs it owns; a job whose owner missed several beats is orphaned.
+JOB_HEARTBEAT_SECONDS = 15
+JOB_OWNER_STALE_SECONDS = 60
+INFLIGHT = ("QUEUED", "RUNNING")
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_crop_executor = None
+_executor_lock = threading.Lock()
+_owner = None
+
+
+def process_owner():
+    """host:pid:boot-id of this web process; the boot id tells a restarted process from one that reused the pid."""
+    global _owner
+    pid = os.getpid()
+    if _owner is None or _owner[0] != pid:
+        _owner = (pid, f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}")
+    return _owner[1]
+
+
+def owner_gone(job):
+    """True when the process that owns the job has exited or stopped heartbeating."""
+    if job.heartbeat_at is not None and timezone.now() - job.heartbeat_at > timedelta(seconds=JOB_OWNER_STALE_SECONDS):
+        return True
+    host, pid, _ = job.owner.rsplit(":", 2)
+    if host != socket.gethostname() or job.owner == process_owner():
+        return False
+    if int(pid) == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def heartbeat():
+    """Keep this process's in-flight jobs marked as owned; runs for the life of the job pool."""
+    owner = process_owner()
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            VerificationJob.objects.filter(owner=owner, status__in=INFLIGHT).update(heartbeat_at=timezone.now())
+        except Exception:
+            logger.exception("Verification job heartbeat failed")
+        finally:
+            connection.close()
+
+
+def crop_pool():
+    """Threads for crop encoding and file writes; PIL and file I/O release the GIL."""
+    global _crop_executor
+    with _executor_lock:
+        if _crop_executor is None:
+            _crop_executor = ThreadPoolExecutor(max_workers=CROP_THREADS, thread_name_prefix="verify-crop")
+    return _crop_executor
+
+
+def verify(image_file, image_hash):
+    colab_result = verify_with_colab(image_file)
+    # A near-duplicate reuses another image's detections; the upload keeps its own hash.
+    return {
+        "detections": colab_result.get("detections", []),
+        "crops": colab_result.get("crops"),
+        "image_hash": image_hash,
+        "duplicate_of": colab_result.get("duplicate_of") or ""
+    }
+
+
+def encode_crop(source_image, bbox):
+    buf = io.BytesIO()
+    source_image.crop(tuple(bbox)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def crop_detections(image_file, detections):
+    """Fallback for vision servers that do not return encoded crops."""
+    image_file.seek(0)
+    source_image = PILImage.open(image_file)
+    # Decode once here; the crops are then cut and encoded in parallel.
+    source_image.load()
+    return list(crop_pool().map(lambda detection: encode_crop(source_image, detection["bbox"]), detections))
+
+
+def store_inspections(inspections, crops, extension):
+    """Write the crop files in parallel, then insert every row in one transaction.
+
+    If any write or the insert fails, the files already written are deleted again.
+    """
+    field = VisionInspection._meta.get_field("image")
+    futures = [
+        crop_pool().submit(field.storage.save, field.generate_filename(inspection, f"{inspection.hash}_{i + 1}{extension}"), ContentFile(crop))
+        for i, (inspection, crop) in enumerate(zip(inspections, crops))
+    ]
+    saved = []
+    error = None
+    for future in futures:
+        try:
+            saved.append(future.result())
+        except Exception as e:
+            error = error or e
+
+    try:
+        if error is not None:
+            raise error
+        for inspection, name in zip(inspections, saved):
+            inspection.image.name = name
+        with transaction.atomic():
+            VisionInspection.objects.bulk_create(inspections)
+    except Exception:
+        for name in saved:
+            field.storage.delete(name)
+        raise
+
+
+def record(image_hash, detections):
+    tx_result = record_verification(image_hash, detections)
+    return {
+        "tx_hash": tx_result["tx_hash"],
+        "block": tx_result["block"],
+        "verification_id": tx_result["verification_id"],
+        "already_verified": tx_result["already_verified"]
+    }
+
+
+def next_record_number(name="inspection_record"):
+    """Next value of a counter row; the UPDATE's row lock serialises concurrent callers."""
+    with transaction.atomic():
+        if not RecordCounter.objects.filter(name=name).update(value=F("value") + 1):
+            RecordCounter.objects.get_or_create(name=name)
+            RecordCounter.objects.filter(name=name).update(value=F("value") + 1)
+        return RecordCounter.objects.get(name=name).value
+
+
+def verify_and_store(image_file, image_hash, lot=None, user=None, progress=lambda stage: None):
+    """Vision call, crop storage and blockchain record for one upload; returns the verify response body."""
+    progress("vision")
+    verification = verify(image_file, image_hash)
+
+    if len(verification["detections"]) == 0:
+        return {
+            "detections": [],
+            "blockchain": None
+        }
+
+    progress("storing")
+    # Numbers burned by a failed store leave gaps; names never repeat.
+    source_num = next_record_number()
+    crops = verification["crops"]
+    extension = ".webp" if settings.VISION_CROP_FORMAT == "webp" else ".jpg"
+    if crops is None:
+        crops = crop_detections(image_file, verification["detections"])
+        extension = ".jpg"
+
+    inspections = [
+        VisionInspection(
+            result=detection["result"].upper(),
+            confidence=detection["cnn_confidence"] if detection["cnn_confidence"] is not None else detection["yolo_confidence"],
+            bbox=detection["bbox"],
+            yolo_label=detection["yolo_label"],
+            yolo_confidence=detection["yolo_confidence"],
+            cnn_label=detection["cnn_label"] or "",
+            cnn_confidence=detection["cnn_confidence"],
+            cascade_path=detection.get("path", "cnn"),
+            hash=verification["image_hash"],
+            duplicate_of=verification["duplicate_of"],
+            image_name=f"record_{source_num}_{i + 1}",
+            user=user,
+            lot=lot,
+        )
+        for i, detection in enumerate(verification["detections"])
+    ]
+    store_inspections(inspections, crops, extension)
+
+    progress("blockchain")
+    blockchain = record(
+        verification["image_hash"],
+        verification["detections"]
+    )
+    log_action("VERIFY", "Verified medicine image", user=user, target_id=blockchain["verification_id"])
+    return {
+        "detections": verification["detections"],
+        "blockchain": blockchain,
+        "image_hash": verification["image_hash"],
+        "duplicate_of": verification["duplicate_of"] or None
+    }
+
+
+def record_index(inspection):
+    """(n, i) of a record_{n}_{i} name; unnamed rows sort first."""
+    parts = inspection.image_name.split("_")
+    if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+        return int(parts[1]), int(parts[2])
+    return 0, 0
+
+
+def source_inspections(image_hash):
+    """The first upload's inspections for this hash, in detection order.
+
+    bulk_create can give a whole upload one created_at, so the record number orders them.
+    """
+    inspections = sorted(VisionInspection.objects.filter(hash=image_hash), key=lambda i: (record_index(i), i.created_at))
+    if not inspections:
+        return []
+    # Re-uploads from before the short-circuit stored extra copies; answer with the first upload's rows.
+    source = record_index(inspections[0])[0]
+    return [inspection for inspection in inspections if record_index(inspection)[0] == source]
+
+
+def cached_verification(image_hash):
+    """Verify response rebuilt from stored rows when this exact image is already on chain, else None."""
+    address = BlockchainAddress.objects.filter(image_hash=image_hash).first()
+    if address is None:
+        return None
+    inspections = source_inspections(image_hash)
+    if not inspections:
+        return None
+
+    detections = [
+        {
+            "bbox": inspection.bbox,
+            "yolo_label": inspection.yolo_label,
+            "yolo_confidence": inspection.yolo_confidence,
+            "cnn_label": inspection.cnn_label or None,
+            "cnn_confidence": inspection.cnn_confidence,
+            "result": inspection.result,
+            "path": inspection.cascade_path or "cnn",
+        }
+        for inspection in inspections
+    ]
+    return {
+        "detections": detections,
+        "blockchain": {
+            "tx_hash": address.tx_hash,
+            "block": address.block_number,
+            "verification_id": address.verification_id,
+            "already_verified": True
+        }
+    }
+
+
+def link_inspections(image_hash, lot=None, user=None):
+    """Copy an already verified image's inspections onto another upload's lot and user.
+
+    The copies point at the stored crop files, so nothing is re-encoded or written.
+    """
+    if lot is None and user is None:
+        return
+    sources = source_inspections(image_hash)
+    if not sources:
+        return
+    source_num = next_record_number()
+    with transaction.atomic():
+        VisionInspection.objects.bulk_create([
+            VisionInspection(
+                result=source.result,
+                confidence=source.confidence,
+                bbox=source.bbox,
+                yolo_label=source.yolo_label,
+                yolo_confidence=source.yolo_confidence,
+                cnn_label=source.cnn_label,
+                cnn_confidence=source.cnn_confidence,
+                cascade_path=source.cascade_path,
+                hash=source.hash,
+                duplicate_of=source.duplicate_of,
+                image=source.image.name,
+                image_name=f"record_{source_num}_{i + 1}",
+                user=user,
+                lot=lot,
+            )
+            for i, source in enumerate(sources)
+        ])
+
+
+def claim_job(image_hash, image_name="", lot=None, user=None):
+    """Create the job that verifies this hash; True when it is new and must be submitted.
+
+    If another upload of the image is already in flight, the new job follows it instead and
+    is finished with the leader's result. The partial unique constraint on leader jobs makes
+    this hold across web processes.
+    """
+    for attempt in range(3):
+        try:
+            with transaction.atomic():
+                job = VerificationJob.objects.create(
+                    image_hash=image_hash, image_name=image_name, lot=lot, user=user,
+                    owner=process_owner(), heartbeat_at=timezone.now(),
+                )
+            return job, True
+        except IntegrityError:
+            if attempt == 2:
+                raise
+            leader = VerificationJob.objects.filter(image_hash=image_hash, status__in=INFLIGHT, leader=None).first()
+            # The running job may have just finished or been abandoned; then claim it afresh.
+            if leader is not None and expire_if_stale(leader).status in INFLIGHT:
+                job = VerificationJob.objects.create(
+                    image_hash=image_hash, image_name=image_name, lot=lot, user=user, leader=leader,
+                )
+                # The leader may have finished before this follower existed.
+                leader.refresh_from_db()
+                if leader.status not in INFLIGHT:
+                    finish_follower(job, leader)
+                return job, False
+
+
+def finish_follower(job, leader):
+    """Give a follower its leader's outcome, linking the inspections to the follower's lot and user."""
+    # Only one caller may finish it: the leader's job thread or a poll that found it behind.
+    if not VerificationJob.objects.filter(id=job.id, status="QUEUED").update(status="RUNNING", stage="linking"):
+        return
+    if leader.status == "SUCCEEDED":
+        if leader.result.get("detections"):
+            link_inspections(leader.result.get("image_hash", leader.image_hash), job.lot, job.user)
+        job.status = "SUCCEEDED"
+        job.stage = "done"
+        job.result = leader.result
+    else:
+        job.status = "FAILED"
+        job.stage = leader.stage
+        job.error = leader.error
+        job.retry_after = leader.retry_after
+    job.save(update_fields=["status", "stage", "result", "error", "retry_after", "updated_at"])
+
+
+def finish_followers(leader):
+    for job in leader.followers.filter(status="QUEUED").select_related("lot", "user"):
+        finish_follower(job, leader)
+
+
+def update_running(job_id, **fields):
+    """Write to a job only while it is still RUNNING; False once it was expired elsewhere."""
+    return bool(VerificationJob.objects.filter(id=job_id, status="RUNNING").update(updated_at=timezone.now(), **fields))
+
+
+def run_job(job_id, image_path):
+    # A queued job may have been given up on while it waited for a pool thread; leave it be.
+    if not VerificationJob.objects.filter(id=job_id, status="QUEUED").update(status="RUNNING", updated_at=timezone.now()):
+        return
+    job = VerificationJob.objects.select_related("lot", "user").get(id=job_id)
+
+    def progress(stage):
+        update_running(job_id, stage=stage)
+
+    outcome = {}
+    try:
+        with open(image_path, "rb") as image_file:
+            outcome = {"status": "SUCCEEDED", "stage": "done", "result": verify_and_store(image_file, job.image_hash, job.lot, job.user, progress)}
+    except VisionServerBusy as e:
+        outcome = {"status": "FAILED", "error": str(e), "retry_after": e.retry_after}
+    except Exception as e:
+        outcome = {"status": "FAILED", "error": str(e)}
+    if update_running(job_id, **outcome):
+        job.refresh_from_db()
+        finish_followers(job)
+
+
+def _run_in_pool(job_id, image_path):
+    try:
+        run_job(job_id, image_path)
+    except Exception:
+        logger.exception("Verification job %s crashed", job_id)
+    finally:
+        # Pool threads outlive requests, so nothing else closes their connection.
+        connection.close()
+        os.remove(image_path)
+
+
+def submit_job(job, image_path):
+    """Run the job on this process's verification pool; the job deletes image_path when done."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="verify-job")
+            threading.Thread(target=heartbeat, name="verify-heartbeat", daemon=True).start()
+    _executor.submit(_run_in_pool, job.id, image_path)
+
+
+def expire_if_stale(job):
+    """Fail a job whose process went away (gunicorn restart) instead of leaving it running forever.
+
+    Jobs live on their owner's in-process pool, so once the owner has exited or stopped
+    heartbeating the job is failed at once, freeing its hash for a new leader. Otherwise a
+    RUNNING job refreshes updated_at at every stage, so JOB_STALE_SECONDS without progress
+    means it is stuck. A QUEUED job may just be waiting behind a backlog and gets much longer;
+    run_job will not start a job that was failed here.
+    """
+    if job.leader_id is not None:
+        if job.status == "QUEUED":
+            leader = expire_if_stale(job.leader)
+            if leader.status not in INFLIGHT:
+                finish_follower(job, leader)
+                job.refresh_from_db()
+        return job
+    limit = JOB_STALE_SECONDS if job.status == "RUNNING" else JOB_QUEUED_STALE_SECONDS
+    if job.status in INFLIGHT and (timezone.now() - job.updated_at > timedelta(seconds=limit) or (job.owner and owner_gone(job))):
+        error = "Verification job was interrupted; please upload again"
+        expired = VerificationJob.objects.filter(id=job.id, status=job.status, updated_at=job.updated_at).update(
+            status="FAILED", error=error, updated_at=timezone.now()
+        )
+        job.refresh_from_db()
+        if expired:
+            finish_followers(job)
+    return job
+
+
+def job_body(job):
+    return {
+        "job_id": str(job.id),
+        "status": job.status,
+        "stage": job.stage,
+        "image_hash": job.image_hash,
+        "result": job.result,
+        "error": job.error or None,
+        "retry_after": job.retry_after,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat(),
+    }
@@ -0,0 +1,74 @@
+import time
+from django.core.management.base import BaseCommand
+from vision.models import VisionInspection
+from vision.services import classify_with_colab
+
+
+def final_result(yolo_label, cnn_label=None, cnn_confidence=None):
+    """Same decision rule as the vision server; no CNN label means the cascade trusted YOLO."""
+    if cnn_label is None:
+        return "GENUINE" if yolo_label == "authentic" else "COUNTERFEIT"
+    if yolo_label == cnn_label and cnn_confidence > 0.8:
+        return "GENUINE" if yolo_label == "authentic" else "COUNTERFEIT"
+    return "SUSPICIOUS"
+
+
+class Command(BaseCommand):
+    help = "Replay stored inspection crops through the CNN and report what a YOLO confidence cascade would save"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threshold", type=float, nargs="+", default=[0.8, 0.9, 0.95], help="YOLO confidence thresholds to evaluate")
+        parser.add_argument("--limit", type=int, default=1000, help="Most recent inspections to replay")
+        parser.add_argument("--batch-size", type=int, default=64, help="Crops per /api/classify request")
+
+    def handle(self, *args, **options):
+        inspections = list(
+            VisionInspection.objects.exclude(yolo_confidence=None).exclude(image="").order_by("-created_at")[:options["limit"]]
+        )
+        if not inspections:
+            self.stdout.write(self.style.WARNING("No inspections with stored YOLO confidence and crop."))
+            return
+
+        predictions, elapsed = self.replay(inspections, options["batch_size"])
+        per_crop = elapsed / len(inspections)
+        self.stdout.write(f"Replayed {len(inspections)} crops through the CNN ({per_crop * 1000:.1f} ms/crop).")
+
+        full = [
+            final_result(inspection.yolo_label, prediction["cnn_label"], prediction["cnn_confidence"])
+            for inspection, prediction in zip(inspections, predictions)
+        ]
+        # Approved inspections are the only rows with a reviewer-confirmed result.
+        reviewed = [i for i, inspection in enumerate(inspections) if inspection.status == "APPROVED"]
+        if reviewed:
+            correct = sum(full[i] == inspections[i].result for i in reviewed)
+            self.stdout.write(f"Without cascade: {correct / len(reviewed):.1%} accurate on {len(reviewed)} approved inspections.")
+
+        for threshold in sorted(options["threshold"]):
+            skipped = [inspection.yolo_confidence >= threshold for inspection in inspections]
+            cascade = [
+                final_result(inspection.yolo_label) if skip else result
+                for inspection, skip, result in zip(inspections, skipped, full)
+            ]
+            saved = sum(skipped)
+            agreement = sum(a == b for a, b in zip(cascade, full)) / len(full)
+            line = (
+                f"threshold {threshold:.2f}: skips CNN on {saved}/{len(full)} ({saved / len(full):.1%}), "
+                f"~{saved * per_crop:.1f}s saved, {agreement:.1%} agree with full pipeline"
+            )
+            if reviewed:
+                correct = sum(cascade[i] == inspections[i].result for i in reviewed)
+                line += f", {correct / len(reviewed):.1%} accurate on approved"
+            self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    def replay(self, inspections, batch_size):
+        predictions = []
+        started = time.perf_counter()
+        for start in range(0, len(inspections), batch_size):
+            crops = []
+            for inspection in inspections[start:start + batch_size]:
+                with inspection.image.open("rb") as f:
+                    crops.append((inspection.image.name, f.read()))
+            predictions.extend(classify_with_colab(crops))
+        return predictions, time.perf_counter() - started
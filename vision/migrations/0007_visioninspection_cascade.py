@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vision', '0006_visioninspection_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visioninspection',
+            name='cascade_path',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='visioninspection',
+            name='cnn_confidence',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='visioninspection',
+            name='cnn_label',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='visioninspection',
+            name='yolo_confidence',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='visioninspection',
+            name='yolo_label',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+    ]
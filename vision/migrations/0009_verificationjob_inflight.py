@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_auditlog'),
+        ('vision', '0008_verificationjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='verificationjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['QUEUED', 'RUNNING'])), fields=('image_hash',), name='unique_inflight_verification_job'),
+        ),
+    ]
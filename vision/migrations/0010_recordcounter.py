@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:09
+
+from django.db import migrations, models
+
+
+def backfill_record_numbers(apps, schema_editor):
+    """Renumber existing inspections record_{n}_{i}, one n per upload in upload order.
+
+    The old distinct-hash count handed re-uploads the same n as the next new image, so
+    an upload is identified by its hash together with the n it was given.
+    """
+    VisionInspection = apps.get_model("vision", "VisionInspection")
+    RecordCounter = apps.get_model("vision", "RecordCounter")
+
+    uploads = {}
+    for inspection in VisionInspection.objects.order_by("created_at", "id").only("id", "hash", "image_name", "created_at"):
+        key = (inspection.hash, inspection.image_name.rsplit("_", 1)[0])
+        uploads.setdefault(key, []).append(inspection)
+
+    changed = []
+    for n, inspections in enumerate(uploads.values(), start=1):
+        for i, inspection in enumerate(inspections, start=1):
+            name = f"record_{n}_{i}"
+            if inspection.image_name != name:
+                inspection.image_name = name
+                changed.append(inspection)
+    VisionInspection.objects.bulk_update(changed, ["image_name"], batch_size=500)
+    RecordCounter.objects.update_or_create(name="inspection_record", defaults={"value": len(uploads)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vision', '0009_verificationjob_inflight'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_record_numbers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_auditlog'),
+        ('vision', '0010_recordcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='verificationjob',
+            name='unique_inflight_verification_job',
+        ),
+        migrations.AddField(
+            model_name='verificationjob',
+            name='leader',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='followers', to='vision.verificationjob'),
+        ),
+        migrations.AddConstraint(
+            model_name='verificationjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('leader__isnull', True), ('status__in', ['QUEUED', 'RUNNING'])), fields=('image_hash',), name='unique_inflight_verification_job'),
+        ),
+    ]
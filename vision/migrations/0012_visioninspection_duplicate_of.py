@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vision', '0011_verificationjob_leader'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visioninspection',
+            name='duplicate_of',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vision', '0012_visioninspection_duplicate_of'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='verificationjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='verificationjob',
+            name='owner',
+            field=models.CharField(blank=True, default='', max_length=128),
+        ),
+    ]
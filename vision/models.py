@@ -24,7 +24,14 @@ class VisionInspection(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="PENDING")
     confidence = models.FloatField()
     bbox = models.JSONField(blank=True, null=True)
+    yolo_label = models.CharField(max_length=20, blank=True, default="")
+    yolo_confidence = models.FloatField(null=True, blank=True)
+    cnn_label = models.CharField(max_length=20, blank=True, default="")
+    cnn_confidence = models.FloatField(null=True, blank=True)
+    cascade_path = models.CharField(max_length=10, blank=True, default="")
     hash = models.CharField(max_length=64)
+    # SHA-256 of the earlier image whose detections were reused for this near-duplicate upload.
+    duplicate_of = models.CharField(max_length=64, blank=True, default="")
     image_name = models.CharField(max_length=255, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -48,3 +55,54 @@ class BlockchainAddress(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+
+
+class VerificationJob(models.Model):
+    STATUS_CHOICES = [
+        ("QUEUED", "Queued"),
+        ("RUNNING", "Running"),
+        ("SUCCEEDED", "Succeeded"),
+        ("FAILED", "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    lot = models.ForeignKey(MedicineLot, on_delete=models.SET_NULL, null=True, blank=True, related_name="verification_jobs")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="verification_jobs")
+    image_hash = models.CharField(max_length=64)
+    image_name = models.CharField(max_length=255, blank=True, default="")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="QUEUED")
+    stage = models.CharField(max_length=20, blank=True, default="queued")
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, default="")
+    retry_after = models.IntegerField(null=True, blank=True)
+    # A coalesced upload waits on the job already running for its image and is finished with it.
+    leader = models.ForeignKey("self", on_delete=models.SET_NULL, null=True, blank=True, related_name="followers")
+    # host:pid:boot-id of the web process whose pool runs the job, refreshed through heartbeat_at.
+    owner = models.CharField(max_length=128, blank=True, default="")
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Job {self.id} - {self.status} ({self.stage})"
+
+    class Meta:
+        ordering = ["-created_at"]
+        constraints = [
+            # At most one in-flight job per image runs the vision call; concurrent uploads follow it.
+            models.UniqueConstraint(
+                fields=["image_hash"],
+                condition=models.Q(status__in=["QUEUED", "RUNNING"], leader__isnull=True),
+                name="unique_inflight_verification_job",
+            ),
+        ]
+
+
+class RecordCounter(models.Model):
+    """Monotonic counters, e.g. the n in an inspection's record_{n}_{i} name."""
+
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
@@ -1,6 +1,271 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from email import message_from_bytes, policy
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
 
+VISION_TIMEOUT = 30
+CONNECT_TIMEOUT = float(os.getenv("VISION_CONNECT_TIMEOUT", "3"))
+BATCH_TIMEOUT = 300
+MAX_BUSY_RETRIES = 2
+# Retries for requests that failed before the server answered (refused, reset, 502-504).
+MAX_RETRIES = int(os.getenv("VISION_MAX_RETRIES", "2"))
+RETRY_BACKOFF = 0.25
+POOL_SIZE = int(os.getenv("VISION_POOL_SIZE", "10"))
+BREAKER_FAILURES = int(os.getenv("VISION_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("VISION_BREAKER_COOLDOWN", "30"))
+RETRY_STATUSES = (502, 503, 504)
+
+
+class VisionServerBusy(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Vision server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class VisionServerUnavailable(VisionServerBusy):
+    def __init__(self, retry_after):
+        Exception.__init__(self, f"Vision server unavailable, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fails calls fast after repeated vision server failures.
+
+    Opens after max_failures consecutive failures; once cooldown has passed a single
+    trial request is let through and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, max_failures, cooldown):
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.total_failures = 0
+        self.rejected = 0
+
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0
+        return max(1, int(self.opened_at + self.cooldown - time.monotonic() + 0.999))
+
+    def allow(self):
+        with self._lock:
+            state = self.state()
+            if state == "closed" or (state == "half_open" and not self.trial_running):
+                self.trial_running = state == "half_open"
+                return
+            self.rejected += 1
+            raise VisionServerUnavailable(self.retry_after())
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.total_failures += 1
+            if self.trial_running or self.failures >= self.max_failures:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state(),
+                "consecutive_failures": self.failures,
+                "total_failures": self.total_failures,
+                "rejected": self.rejected,
+                "retry_after": self.retry_after(),
+            }
+
+
+breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN)
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Keep-alive session shared by this process's threads; recreated after a fork."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def pool_state():
+    if _session is None or _session_pid != os.getpid():
+        return {"pools": []}
+    pools = []
+    for adapter in set(_session.adapters.values()):
+        manager = adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "max_size": pool.pool.maxsize if pool.pool else 0,
+                # The pool queue is pre-filled with None placeholders for unopened connections.
+                "idle": sum(conn is not None for conn in list(pool.pool.queue)) if pool.pool else 0,
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+            })
+    return {"max_size": POOL_SIZE, "pools": pools}
+
+
+def client_state():
+    return {"breaker": breaker.snapshot(), "pool": pool_state()}
+
+
+def backoff(attempt):
+    # Full jitter keeps Django workers from retrying against a recovering server in lockstep.
+    return random.uniform(0, RETRY_BACKOFF * (2 ** attempt))
+
+
+def rewind(files):
+    # A file handle read by an earlier attempt has to be sent again from the start.
+    specs = files.values() if isinstance(files, dict) else (spec for _, spec in files)
+    for spec in specs:
+        if hasattr(spec[1], "seek"):
+            spec[1].seek(0)
+
+
+class MultipartBody:
+    """multipart/form-data body streamed from bytes or an open file, never joined in memory.
+
+    requests takes Content-Length from __len__ and sends what __iter__ yields. Every
+    iteration starts again from the top of the file, so a retried request resends it whole.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, fields, name, filename, content, content_type):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self.head = b"".join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode()
+            for key, value in fields.items()
+        ) + (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        self.tail = f"\r\n--{boundary}--\r\n".encode()
+        self.content = content
+        if isinstance(content, bytes):
+            self.size = len(content)
+        else:
+            content.seek(0, os.SEEK_END)
+            self.size = content.tell()
+
+    def __len__(self):
+        return len(self.head) + self.size + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        if isinstance(self.content, bytes):
+            yield self.content
+        else:
+            self.content.seek(0)
+            while True:
+                chunk = self.content.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        yield self.tail
+
+
+def vision_request(method, path, read_timeout, idempotent=True, deadline=None, **kwargs):
+    """Send one request to the vision server through the shared session and breaker.
+
+    Connect timeouts are always retried; resets, read timeouts and 502-504 responses only
+    when the request is idempotent. Retries back off with jitter and stop at the deadline.
+    """
+    url = f"{settings.COLAB_API_URL}{path}"
+    for attempt in range(MAX_RETRIES + 1):
+        timeout = read_timeout
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise requests.exceptions.Timeout("Vision request deadline passed")
+            kwargs.setdefault("headers", {})["X-Request-Timeout"] = f"{timeout:.1f}"
+        breaker.allow()
+        response = None
+        try:
+            rewind(kwargs.get("files") or ())
+            response = get_session().request(method, url, timeout=(CONNECT_TIMEOUT, timeout), **kwargs)
+        except requests.exceptions.ConnectTimeout as e:
+            # Nothing reached the server, so any request may be sent again.
+            error, retry = e, True
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error, retry = e, idempotent
+        except requests.exceptions.RequestException as e:
+            # Broken or undecodable responses are not worth resending.
+            error, retry = e, False
+        except BaseException:
+            # Every outcome must settle the breaker, or a half-open trial would never end.
+            breaker.record_failure()
+            raise
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                return response
+            error, retry = None, idempotent
+        breaker.record_failure()
+
+        delay = backoff(attempt)
+        out_of_time = deadline is not None and time.monotonic() + delay >= deadline
+        if not retry or attempt == MAX_RETRIES or out_of_time:
+            if error is not None:
+                raise error
+            return response
+        time.sleep(delay)
+
+
+def parse_retry_after(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 1
+
+
+def parse_multipart(content_type, body):
+    """Split a multipart/mixed verify response into its JSON result and crop images."""
+    message = message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body, policy=policy.HTTP)
+    parts = list(message.iter_parts())
+    result = json.loads(parts[0].get_payload(decode=True))
+    result["crops"] = [part.get_payload(decode=True) for part in parts[1:]]
+    return result
+
 
 def call_colab_api():
     api_url = settings.COLAB_API_URL
@@ -9,25 +274,98 @@ def call_colab_api():
         return {"status": "error", "message": "COLAB_API_URL not set"}
 
     try:
-        response = requests.get(f"{api_url}/", timeout=5)
+        response = vision_request("GET", "/", 5)
         return response.json()
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
-def verify_with_colab(image_bytes):
+def verify_with_colab(image):
+    """image is bytes or an open file; a file is streamed from its handle in chunks, never read whole."""
     api_url = settings.COLAB_API_URL
 
     if not api_url:
         raise Exception("COLAB_API_URL not set")
 
+    deadline = time.monotonic() + VISION_TIMEOUT
+    fields = {}
+    if settings.VISION_CROP_FORMAT:
+        fields = {"crop_format": settings.VISION_CROP_FORMAT, "crop_quality": settings.VISION_CROP_QUALITY}
+    # requests would read a file passed through files= into one bytes body.
+    body = MultipartBody(fields, "image", "image.jpg", image, "image/jpeg")
     try:
-        files = {"image": ("image.jpg", image_bytes, "image/jpeg")}
-        response = requests.post(f"{api_url}/api/verify", files=files, timeout=30)
-        return response.json()
+        for attempt in range(MAX_BUSY_RETRIES + 1):
+            response = vision_request(
+                "POST", "/api/verify", VISION_TIMEOUT, deadline=deadline,
+                data=body, headers={"Content-Type": body.content_type},
+            )
+            if response.status_code >= 500:
+                raise Exception(response.json().get("message", f"HTTP {response.status_code}"))
+            if response.status_code != 429:
+                content_type = response.headers.get("Content-Type", "")
+                if content_type.startswith("multipart/"):
+                    return parse_multipart(content_type, response.content)
+                return response.json()
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if attempt == MAX_BUSY_RETRIES or time.monotonic() + retry_after >= deadline:
+                raise VisionServerBusy(retry_after)
+            time.sleep(retry_after)
+    except VisionServerBusy:
+        raise
     except requests.exceptions.ConnectionError:
         raise Exception("Vision server not reachable. Make sure Flask server is running on port 5000")
     except requests.exceptions.Timeout:
         raise Exception("Vision server timeout. Flask server may be overloaded")
     except Exception as e:
         raise Exception(f"Vision server error: {str(e)}")
+
+
+def verify_batch_with_colab(images):
+    """Verify many (name, bytes) images in one request, yielding each result as the server finishes it."""
+    api_url = settings.COLAB_API_URL
+
+    if not api_url:
+        raise Exception("COLAB_API_URL not set")
+
+    files = [("images", (name, image_bytes, "image/jpeg")) for name, image_bytes in images]
+    try:
+        # Streamed results may already have been consumed, so a failed batch is not resent.
+        with vision_request(
+            "POST",
+            "/api/verify/batch",
+            VISION_TIMEOUT,
+            idempotent=False,
+            files=files,
+            headers={"X-Request-Timeout": str(BATCH_TIMEOUT)},
+            stream=True,
+        ) as response:
+            if response.status_code != 200:
+                raise Exception(response.json().get("message", f"HTTP {response.status_code}"))
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+    except requests.exceptions.ConnectionError:
+        raise Exception("Vision server not reachable. Make sure Flask server is running on port 5000")
+    except requests.exceptions.Timeout:
+        raise Exception("Vision server timeout. Flask server may be overloaded")
+
+
+def classify_with_colab(crops):
+    """Run only the CNN on (name, bytes) crops; returns one {cnn_label, cnn_confidence} per crop."""
+    api_url = settings.COLAB_API_URL
+
+    if not api_url:
+        raise Exception("COLAB_API_URL not set")
+
+    files = [("crops", (name, crop_bytes, "image/jpeg")) for name, crop_bytes in crops]
+    try:
+        response = vision_request("POST", "/api/classify", VISION_TIMEOUT, files=files)
+        result = response.json()
+        if response.status_code != 200:
+            raise Exception(result.get("message", f"HTTP {response.status_code}"))
+        return result["predictions"]
+    except requests.exceptions.ConnectionError:
+        raise Exception("Vision server not reachable. Make sure Flask server is running on port 5000")
+    except requests.exceptions.Timeout:
+        raise Exception("Vision server timeout. Flask server may be overloaded")
@@ -1,3 +1,405 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+from datetime import date, timedelta
+from email import message_from_bytes, policy
+from unittest import mock
+import requests
+from PIL import Image as PILImage
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from vision.jobs import expire_if_stale, run_job, verify_and_store
+from vision.models import BlockchainAddress, VisionInspection, VerificationJob
+from blockchain.utils import hash_image
+from core.models import MedicineLot, User
+from vision.services import MultipartBody, verify_with_colab, verify_batch_with_colab, breaker, VisionServerBusy, VisionServerUnavailable
 
-# Create your tests here.
+
+def jpeg_bytes(size=(8, 8)):
+    buf = io.BytesIO()
+    PILImage.new("RGB", size).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def vision_response(status_code, body=None, headers=None, lines=()):
+    response = mock.MagicMock(status_code=status_code, headers=headers or {})
+    response.json.return_value = body or {}
+    response.iter_lines.return_value = list(lines)
+    response.__enter__.return_value = response
+    return response
+
+
+@override_settings(COLAB_API_URL="http://vision:5000")
+class VerifyWithColabTestCase(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("vision.services.get_session")
+        self.post = patcher.start().return_value.request
+        self.addCleanup(patcher.stop)
+        breaker.reset()
+        self.addCleanup(breaker.reset)
+
+    @mock.patch("vision.services.time.sleep")
+    def test_retries_after_busy_response(self, sleep):
+        self.post.side_effect = [
+            vision_response(429, headers={"Retry-After": "2"}),
+            vision_response(200, {"status": "success", "detections": []}),
+        ]
+
+        result = verify_with_colab(b"image")
+
+        self.assertEqual(result["status"], "success")
+        sleep.assert_called_once_with(2)
+        self.assertEqual(self.post.call_count, 2)
+
+    @mock.patch("vision.services.time.sleep")
+    def test_gives_up_when_retry_after_exceeds_timeout(self, sleep):
+        self.post.return_value = vision_response(429, headers={"Retry-After": "60"})
+
+        with self.assertRaises(VisionServerBusy) as ctx:
+            verify_with_colab(b"image")
+
+        self.assertEqual(ctx.exception.retry_after, 60)
+        sleep.assert_not_called()
+
+    def test_batch_yields_each_streamed_result(self):
+        self.post.return_value = vision_response(200, lines=[
+            b'{"index": 1, "name": "b.jpg", "status": "success", "detections": []}',
+            b"",
+            b'{"index": 0, "name": "a.jpg", "status": "success", "detections": []}',
+        ])
+
+        results = list(verify_batch_with_colab([("a.jpg", b"a"), ("b.jpg", b"b")]))
+
+        self.assertEqual([r["name"] for r in results], ["b.jpg", "a.jpg"])
+        self.assertEqual(len(self.post.call_args.kwargs["files"]), 2)
+
+    def test_parses_multipart_crops(self):
+        body = (
+            b"--b\r\nContent-Type: application/json\r\n\r\n"
+            b'{"status": "success", "detections": [{"bbox": [0, 0, 2, 2]}]}\r\n'
+            b"--b\r\nContent-Type: image/jpeg\r\n\r\n\xff\xd8crop\r\n"
+            b"--b--\r\n"
+        )
+        response = vision_response(200, headers={"Content-Type": "multipart/mixed; boundary=b"})
+        response.content = body
+        self.post.return_value = response
+
+        result = verify_with_colab(b"image")
+
+        self.assertEqual(result["detections"], [{"bbox": [0, 0, 2, 2]}])
+        self.assertEqual(result["crops"], [b"\xff\xd8crop"])
+        self.assertIn(b'name="crop_format"\r\n\r\njpeg\r\n', b"".join(self.post.call_args.kwargs["data"]))
+
+    def test_file_upload_is_streamed_and_resent_whole(self):
+        self.post.side_effect = [
+            vision_response(429, headers={"Retry-After": "0"}),
+            vision_response(200, {"status": "success", "detections": []}),
+        ]
+        image = io.BytesIO(b"\xff\xd8" + os.urandom(200 * 1024))
+
+        with mock.patch("vision.services.time.sleep"):
+            verify_with_colab(image)
+
+        body = self.post.call_args.kwargs["data"]
+        headers = self.post.call_args.kwargs["headers"]
+        self.assertIsInstance(body, MultipartBody)
+        chunks = list(body)
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), MultipartBody.CHUNK_SIZE)
+        self.assertEqual(len(b"".join(chunks)), len(body))
+        self.assertEqual(b"".join(body), b"".join(chunks))
+        message = message_from_bytes(f"Content-Type: {headers['Content-Type']}\r\n\r\n".encode() + b"".join(chunks), policy=policy.HTTP)
+        part = list(message.iter_parts())[-1]
+        self.assertEqual(part.get_filename(), "image.jpg")
+        self.assertEqual(part.get_payload(decode=True), image.getvalue())
+
+    @mock.patch("vision.services.time.sleep")
+    def test_retries_refused_connection(self, sleep):
+        self.post.side_effect = [
+            requests.exceptions.ConnectionError("refused"),
+            vision_response(200, {"status": "success", "detections": []}),
+        ]
+
+        result = verify_with_colab(b"image")
+
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(breaker.snapshot()["state"], "closed")
+
+    @mock.patch("vision.services.time.sleep")
+    def test_breaker_fails_fast_while_server_is_down(self, sleep):
+        self.post.side_effect = requests.exceptions.ConnectionError("refused")
+        with self.assertRaises(Exception):
+            verify_with_colab(b"image")
+        with self.assertRaises(Exception):
+            verify_with_colab(b"image")
+        calls = self.post.call_count
+
+        with self.assertRaises(VisionServerUnavailable):
+            verify_with_colab(b"image")
+
+        self.assertEqual(self.post.call_count, calls)
+        self.assertEqual(breaker.snapshot()["state"], "open")
+
+    @mock.patch("vision.services.time.sleep")
+    def test_failed_half_open_trial_reopens_the_breaker(self, sleep):
+        for _ in range(breaker.max_failures):
+            breaker.record_failure()
+        breaker.opened_at -= breaker.cooldown
+        self.post.side_effect = requests.exceptions.ChunkedEncodingError("truncated")
+
+        with self.assertRaises(Exception):
+            verify_with_colab(b"image")
+
+        self.assertEqual(self.post.call_count, 1)
+        self.assertEqual(breaker.snapshot()["state"], "open")
+        breaker.opened_at -= breaker.cooldown
+        self.post.side_effect = None
+        self.post.return_value = vision_response(200, {"status": "success", "detections": []})
+        self.assertEqual(verify_with_colab(b"image")["status"], "success")
+        self.assertEqual(breaker.snapshot()["state"], "closed")
+
+
+class EvaluateCascadeTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        for i, (yolo_confidence, result) in enumerate([(0.97, "GENUINE"), (0.6, "SUSPICIOUS")]):
+            inspection = VisionInspection(
+                result=result,
+                status="APPROVED",
+                confidence=0.9,
+                hash=f"{i:064d}",
+                yolo_label="authentic",
+                yolo_confidence=yolo_confidence,
+            )
+            inspection.image.save(f"crop_{i}.jpg", ContentFile(b"crop"), save=True)
+
+    @mock.patch("vision.management.commands.evaluate_cascade.classify_with_colab")
+    def test_reports_skipped_crops_and_accuracy(self, classify):
+        classify.side_effect = lambda crops: [{"cnn_label": "counterfeit", "cnn_confidence": 0.7} for _ in crops]
+        out = io.StringIO()
+
+        call_command("evaluate_cascade", "--threshold", "0.9", stdout=out)
+
+        classify.assert_called_once()
+        self.assertIn("Without cascade: 50.0% accurate on 2 approved", out.getvalue())
+        self.assertIn("skips CNN on 1/2 (50.0%)", out.getvalue())
+        self.assertIn("50.0% agree with full pipeline, 100.0% accurate on approved", out.getvalue())
+
+
+class VerificationJobTestCase(TestCase):
+    def setUp(self):
+        self.image = jpeg_bytes()
+
+    def upload(self, name="a.jpg", lot=None):
+        data = {"image": SimpleUploadedFile(name, self.image)}
+        if lot is not None:
+            data["lot_id"] = str(lot.id)
+        return self.client.post("/vision/verify/", data)
+
+    def create_lot(self, number):
+        producer, _ = User.objects.get_or_create(username="pharma_co", defaults={"role": "MANUFACTURER"})
+        return MedicineLot.objects.create(
+            product_name="Med", product_code="MED", lot_number=number, producer=producer,
+            manufacture_date=date(2026, 1, 1), expiry_date=date(2027, 1, 1), total_quantity=10, remaining_quantity=10,
+        )
+
+    @mock.patch("vision.views.submit_job")
+    def test_verify_returns_job_and_result_is_polled(self, submit_job):
+        response = self.upload()
+
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["job_id"]
+        submit_job.assert_called_once()
+        image_path = submit_job.call_args.args[1]
+        self.addCleanup(os.remove, image_path)
+        self.assertEqual(self.client.get(f"/vision/jobs/{job_id}/").json()["status"], "QUEUED")
+        self.assertEqual(response.json()["image_hash"], hash_image(self.image))
+
+        with mock.patch("vision.jobs.verify_with_colab", return_value={"status": "success", "detections": []}) as verify:
+            run_job(job_id, image_path)
+
+        self.assertEqual(verify.call_args.args[0].name, image_path)
+
+        body = self.client.get(f"/vision/jobs/{job_id}/").json()
+        self.assertEqual(body["status"], "SUCCEEDED")
+        self.assertEqual(body["result"], {"detections": [], "blockchain": None})
+
+    def test_failed_vision_call_is_recorded_on_the_job(self):
+        job = VerificationJob.objects.create(image_hash="0" * 64)
+
+        with tempfile.NamedTemporaryFile() as f, mock.patch("vision.jobs.verify_with_colab", side_effect=VisionServerBusy(3)):
+            run_job(job.id, f.name)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "FAILED")
+        self.assertEqual(job.retry_after, 3)
+
+    @mock.patch("vision.views.submit_job")
+    def test_known_image_is_answered_without_inference(self, submit_job):
+        image_hash = hash_image(self.image)
+        BlockchainAddress.objects.create(image_hash=image_hash, verification_id=7, tx_hash="0xabc", block_number=3, timestamp=0)
+        for i in (2, 1):  # inserted out of order; the record index decides
+            VisionInspection.objects.create(
+                result="GENUINE", confidence=0.9, bbox=[0, 0, i, i], hash=image_hash, image_name=f"record_1_{i}",
+                yolo_label="authentic", yolo_confidence=0.9, cnn_label="authentic", cnn_confidence=0.9,
+            )
+
+        response = self.upload()
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["status"], "SUCCEEDED")
+        self.assertEqual([d["bbox"] for d in body["result"]["detections"]], [[0, 0, 1, 1], [0, 0, 2, 2]])
+        self.assertEqual(body["result"]["blockchain"]["verification_id"], 7)
+        submit_job.assert_not_called()
+        self.assertEqual(VisionInspection.objects.count(), 2)
+
+        lot = self.create_lot("LOT1")
+        self.assertEqual(self.upload(lot=lot).status_code, 200)
+        linked = VisionInspection.objects.filter(lot=lot).order_by("image_name")
+        self.assertEqual([i.bbox for i in linked], [[0, 0, 1, 1], [0, 0, 2, 2]])
+        self.assertEqual({i.status for i in linked}, {"PENDING"})
+
+    @mock.patch("vision.views.submit_job")
+    def test_concurrent_uploads_share_one_vision_call(self, submit_job):
+        first_lot, second_lot = self.create_lot("LOT1"), self.create_lot("LOT2")
+        first = self.upload("a.jpg", first_lot).json()
+        second = self.upload("b.jpg", second_lot).json()
+        image_path = submit_job.call_args.args[1]
+        self.addCleanup(os.remove, image_path)
+
+        self.assertNotEqual(first["job_id"], second["job_id"])
+        self.assertTrue(second["coalesced"])
+        submit_job.assert_called_once()
+
+        colab_result = {"status": "success", "detections": [{
+            "bbox": [0, 0, 4, 4], "yolo_label": "authentic", "yolo_confidence": 0.9,
+            "cnn_label": "authentic", "cnn_confidence": 0.95, "result": "GENUINE", "path": "cnn",
+        }], "crops": [b"crop"]}
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root), \
+                mock.patch("vision.jobs.verify_with_colab", return_value=colab_result), \
+                mock.patch("vision.jobs.record", return_value={"verification_id": 1}):
+            run_job(first["job_id"], image_path)
+
+        body = self.client.get(f"/vision/jobs/{second['job_id']}/").json()
+        self.assertEqual(body["status"], "SUCCEEDED")
+        self.assertEqual(body["result"]["detections"][0]["bbox"], [0, 0, 4, 4])
+        self.assertEqual(VisionInspection.objects.filter(lot=first_lot).count(), 1)
+        self.assertEqual(VisionInspection.objects.filter(lot=second_lot).count(), 1)
+
+    def test_malformed_lot_id_is_a_json_400(self):
+        response = self.upload(lot=mock.Mock(id="abc"))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "Invalid lot_id")
+
+    def test_queued_job_is_not_expired_by_backlog_and_never_resurrected(self):
+        job = VerificationJob.objects.create(image_hash="0" * 64)
+        VerificationJob.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(seconds=900))
+        self.assertEqual(expire_if_stale(VerificationJob.objects.get(id=job.id)).status, "QUEUED")
+
+        VerificationJob.objects.filter(id=job.id).update(status="RUNNING", updated_at=timezone.now() - timedelta(seconds=900))
+        self.assertEqual(expire_if_stale(VerificationJob.objects.get(id=job.id)).status, "FAILED")
+
+        with mock.patch("vision.jobs.verify_with_colab") as verify:
+            run_job(job.id, "/nonexistent")
+        verify.assert_not_called()
+        self.assertEqual(VerificationJob.objects.get(id=job.id).status, "FAILED")
+
+    @mock.patch("vision.views.submit_job")
+    def test_job_of_an_exited_process_is_failed_and_its_image_claimed_again(self, submit_job):
+        first = self.upload().json()
+        self.addCleanup(os.remove, submit_job.call_args.args[1])
+        self.assertEqual(self.client.get(first["status_url"]).json()["status"], "QUEUED")
+
+        exited = subprocess.Popen([sys.executable, "-c", "pass"])
+        exited.wait()
+        VerificationJob.objects.filter(id=first["job_id"]).update(owner=f"{socket.gethostname()}:{exited.pid}:0000")
+        body = self.client.get(first["status_url"]).json()
+        self.assertEqual(body["status"], "FAILED")
+
+        second = self.upload().json()
+        self.addCleanup(os.remove, submit_job.call_args.args[1])
+        self.assertFalse(second["coalesced"])
+        self.assertEqual(submit_job.call_count, 2)
+
+    def test_job_whose_owner_stopped_heartbeating_is_failed(self):
+        job = VerificationJob.objects.create(image_hash="0" * 64, owner="elsewhere:1:0000", heartbeat_at=timezone.now())
+        self.assertEqual(expire_if_stale(VerificationJob.objects.get(id=job.id)).status, "QUEUED")
+
+        VerificationJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(seconds=120))
+        self.assertEqual(expire_if_stale(VerificationJob.objects.get(id=job.id)).status, "FAILED")
+
+    @mock.patch("vision.views.submit_job")
+    def test_oversized_uploads_are_rejected_before_a_job(self, submit_job):
+        with override_settings(VISION_MAX_PIXELS=63):
+            self.assertEqual(self.upload().status_code, 400)
+        with override_settings(VISION_MAX_UPLOAD_BYTES=100):
+            self.assertEqual(self.upload().status_code, 413)
+        submit_job.assert_not_called()
+        self.assertFalse(VerificationJob.objects.exists())
+
+
+class StoreInspectionsTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root, VISION_CROP_FORMAT="")
+        override.enable()
+        self.addCleanup(override.disable)
+        self.image = io.BytesIO(jpeg_bytes((32, 32)))
+        detection = {
+            "yolo_label": "authentic", "yolo_confidence": 0.9, "cnn_label": "authentic", "cnn_confidence": 0.95,
+            "result": "GENUINE", "path": "cnn",
+        }
+        self.colab_result = {
+            "status": "success",
+            "detections": [dict(detection, bbox=[0, 0, 16, 16]), dict(detection, bbox=[8, 8, 32, 32])],
+        }
+
+    def stored_files(self):
+        return [name for _, _, files in os.walk(self.media_root) for name in files]
+
+    @mock.patch("vision.jobs.record", return_value={"verification_id": 1})
+    def test_crops_are_cut_locally_and_inserted_together(self, record):
+        with mock.patch("vision.jobs.verify_with_colab", return_value=self.colab_result):
+            verify_and_store(self.image, "a" * 64)
+
+        inspections = VisionInspection.objects.order_by("image_name")
+        self.assertEqual([i.image_name for i in inspections], ["record_1_1", "record_1_2"])
+        self.assertEqual(PILImage.open(inspections[1].image.path).size, (24, 24))
+        self.assertEqual(len(self.stored_files()), 2)
+
+    @mock.patch("vision.jobs.record", return_value={"verification_id": 1})
+    def test_near_duplicate_keeps_the_uploads_own_hash(self, record):
+        colab_result = dict(self.colab_result, duplicate_of="b" * 64)
+        with mock.patch("vision.jobs.verify_with_colab", return_value=colab_result):
+            body = verify_and_store(self.image, "a" * 64)
+
+        self.assertEqual(body["image_hash"], "a" * 64)
+        self.assertEqual(body["duplicate_of"], "b" * 64)
+        self.assertEqual(record.call_args.args[0], "a" * 64)
+        self.assertEqual({(i.hash, i.duplicate_of) for i in VisionInspection.objects.all()}, {("a" * 64, "b" * 64)})
+
+    def test_failed_insert_leaves_no_files(self):
+        with mock.patch("vision.jobs.verify_with_colab", return_value=self.colab_result), \
+                mock.patch("vision.jobs.VisionInspection.objects.bulk_create", side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                verify_and_store(self.image, "a" * 64)
+
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(VisionInspection.objects.exists())
@@ -0,0 +1,80 @@
+import hashlib
+import io
+import os
+from PIL import Image as PILImage
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+
+# Enough of the file for PIL to read the dimensions of a JPEG, PNG or WebP header.
+HEADER_BYTES = 256 * 1024
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """Streams uploads to a temp file, hashing them and enforcing size and pixel limits on the way.
+
+    The finished file carries its SHA-256 as `sha256` and its dimensions as `image_size`.
+    A rejected upload is skipped and the reason is left on request.upload_error.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.received = 0
+        self.header = b""
+        self.image_size = None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.VISION_MAX_UPLOAD_BYTES:
+            self.reject(f"Image is larger than {settings.VISION_MAX_UPLOAD_BYTES // (1024 * 1024)} MB", 413)
+
+        # Check the pixel count as soon as the header is in, before the rest is written out.
+        if self.image_size is None and len(self.header) < HEADER_BYTES:
+            self.header += raw_data[:HEADER_BYTES - len(self.header)]
+            self.check_pixels(self.header, final=False)
+
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.image_size is None:
+            self.file.seek(0)
+            try:
+                self.check_pixels(self.file, final=True)
+            except SkipFile:
+                # Too late to skip the part; dropping the file has the same effect.
+                self.file.close()
+                return None
+        file = super().file_complete(file_size)
+        file.sha256 = self.sha256.hexdigest()
+        file.image_size = self.image_size
+        return file
+
+    def check_pixels(self, data, final):
+        try:
+            with PILImage.open(io.BytesIO(data) if isinstance(data, bytes) else data) as image:
+                self.image_size = image.size
+        except Exception:
+            if final or len(self.header) >= HEADER_BYTES:
+                self.reject("Unsupported or corrupt image")
+            return
+        width, height = self.image_size
+        if width * height > settings.VISION_MAX_PIXELS:
+            self.reject(f"Image has {width}x{height} pixels; the limit is {settings.VISION_MAX_PIXELS}")
+
+    def reject(self, message, status=400):
+        self.request.upload_error = UploadRejected(message, status)
+        raise SkipFile()
+
+
+def stash_upload(uploaded, name):
+    """Keep a streamed upload past the request by renaming its temp file; the caller removes it."""
+    path = os.path.join(os.path.dirname(uploaded.temporary_file_path()), name)
+    os.replace(uploaded.temporary_file_path(), path)
+    return path
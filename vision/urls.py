@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     path("test-colab/", views.test_colab_connection, name="test_colab"),
     path("verify/", views.verify_and_record, name="verify"),
+    path("jobs/<uuid:job_id>/", views.verification_job, name="verification_job"),
     path("stats/", views.verification_stats, name="verification_stats"),
     path("lots/<uuid:lot_id>/verifications/", views.lot_verifications, name="lot_verifications"),
     path("verifications/pending/", views.pending_verifications, name="pending_verifications"),
@@ -1,107 +1,106 @@
 import json
-import io
-from PIL import Image as PILImage
 from django.http import JsonResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
 from django.db.models import Count
-from django.core.files.base import ContentFile
-from .services import call_colab_api, verify_with_colab
-from .models import VisionInspection
-from blockchain.utils import record_verification, get_verification, get_all_verifications, hash_image
+from .services import call_colab_api, client_state
+from .models import VisionInspection, VerificationJob
+from .uploads import HashingUploadHandler, stash_upload
+from .jobs import record, submit_job, job_body, expire_if_stale, cached_verification, claim_job, link_inspections
+from blockchain.utils import get_verification, get_all_verifications
 from core.utils import log_action
 from core.models import MedicineLot
 
 
 def test_colab_connection(request):
     result = call_colab_api()
+    result["client"] = client_state()
     return JsonResponse(result)
 
 
-def verify(image_bytes):
-    colab_result = verify_with_colab(image_bytes)
-    image_hash = hash_image(image_bytes)
-    return {
-        "detections": colab_result.get("detections", []),
-        "image_hash": image_hash
-    }
-
-
-def record(image_hash, detections):
-    tx_result = record_verification(image_hash, detections)
-    return {
-        "tx_hash": tx_result["tx_hash"],
-        "block": tx_result["block"],
-        "verification_id": tx_result["verification_id"],
-        "already_verified": tx_result["already_verified"]
-    }
-
-
 @csrf_exempt
 @require_http_methods(["POST"])
 def verify_and_record(request):
+    # Must be set before anything reads request.POST or request.FILES.
+    request.upload_handlers = [HashingUploadHandler(request)]
     if "image" not in request.FILES:
+        upload_error = getattr(request, "upload_error", None)
+        if upload_error is not None:
+            return JsonResponse({"error": str(upload_error)}, status=upload_error.status)
         return JsonResponse({"error": "No image provided"}, status=400)
 
+    uploaded = request.FILES["image"]
+    lot_id = request.POST.get("lot_id")
+
+    lot = None
+    if lot_id:
+        try:
+            lot = MedicineLot.objects.get(id=lot_id)
+        except ValidationError:
+            return JsonResponse({"error": "Invalid lot_id"}, status=400)
+        except MedicineLot.DoesNotExist:
+            return JsonResponse({"error": "Lot not found"}, status=404)
+
     try:
-        uploaded = request.FILES["image"]
-        image_bytes = uploaded.read()
-        original_name = uploaded.name
-        lot_id = request.POST.get("lot_id")
-
-        lot = None
-        if lot_id:
-            try:
-                lot = MedicineLot.objects.get(id=lot_id)
-            except MedicineLot.DoesNotExist:
-                return JsonResponse({"error": "Lot not found"}, status=404)
-
-        verification = verify(image_bytes)
-
-        if len(verification["detections"]) == 0:
-            return JsonResponse({
-                "detections": [],
-                "blockchain": None
-            })
-
-        source_num = VisionInspection.objects.values("hash").distinct().count() + 1
-        source_image = PILImage.open(io.BytesIO(image_bytes))
-
-        for i, detection in enumerate(verification["detections"]):
-            x1, y1, x2, y2 = detection["bbox"]
-            cropped = source_image.crop((x1, y1, x2, y2))
-            buf = io.BytesIO()
-            cropped.save(buf, format="JPEG")
-            cropped_bytes = buf.getvalue()
-
-            inspection = VisionInspection(
-                result=detection["result"].upper(),
-                confidence=detection["cnn_confidence"],
-                bbox=detection["bbox"],
-                hash=verification["image_hash"],
-                image_name=f"record_{source_num}_{i + 1}",
-                user=request.user if request.user.is_authenticated else None,
-                lot=lot,
-            )
-            inspection.image.save(
-                f"{verification['image_hash']}_{i + 1}.jpg",
-                ContentFile(cropped_bytes),
-                save=True,
-            )
-
-        blockchain = record(
-            verification["image_hash"],
-            verification["detections"]
-        )
-        log_action("VERIFY", "Verified medicine image", user=request.user if request.user.is_authenticated else None, target_id=blockchain["verification_id"])
-        return JsonResponse({
-            "detections": verification["detections"],
-            "blockchain": blockchain
-        })
+        return start_verification(uploaded, lot, request.user if request.user.is_authenticated else None)
+    except IntegrityError:
+        # Lost a race with other uploads of the same image more than once; the client retries.
+        response = JsonResponse({"error": "Another upload of this image is being set up, retry shortly"}, status=503)
+        response["Retry-After"] = "1"
+        return response
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
+def start_verification(uploaded, lot, user):
+    """Answer from the database, follow an in-flight job, or queue a new one for this upload."""
+    image_hash = uploaded.sha256
+    image_name = uploaded.name or ""
+
+    # An image already verified and on chain is answered from the database: no inference, crops or chain calls.
+    cached = cached_verification(image_hash)
+    if cached is not None:
+        job = VerificationJob.objects.create(
+            image_hash=image_hash,
+            image_name=image_name,
+            user=user,
+            lot=lot,
+            status="SUCCEEDED",
+            stage="cached",
+            result=cached,
+        )
+        link_inspections(image_hash, lot, user)
+        body = job_body(job)
+        body["cached"] = True
+        body["status_url"] = reverse("verification_job", args=[job.id])
+        return JsonResponse(body)
+
+    job, created = claim_job(image_hash, image_name, lot, user)
+    if created:
+        try:
+            submit_job(job, stash_upload(uploaded, f"verify-{job.id}.upload"))
+        except Exception as e:
+            # Never leave an unsubmitted job holding the image's in-flight slot.
+            VerificationJob.objects.filter(id=job.id).update(status="FAILED", error=str(e))
+            raise
+    body = job_body(job)
+    body["coalesced"] = not created
+    body["status_url"] = reverse("verification_job", args=[job.id])
+    return JsonResponse(body, status=202)
+
+
+@require_http_methods(["GET"])
+def verification_job(request, job_id):
+    try:
+        job = VerificationJob.objects.get(id=job_id)
+    except VerificationJob.DoesNotExist:
+        return JsonResponse({"error": "Job not found"}, status=404)
+    return JsonResponse(job_body(expire_if_stale(job)))
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def record_to_blockchain(request):